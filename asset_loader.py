@@ -0,0 +1,77 @@
+from concurrent.futures import Executor, ThreadPoolExecutor, wait
+
+from typing import Any, Callable
+
+
+class AssetLoader:
+
+    def __init__(self, executor: Executor | None = None):
+        """
+        Decodes images and parses meshes on a pool of workers, GL uploads stay on the context thread.
+
+        Assets hand a decode function to submit together with a callback that
+        uploads its result. Workers only produce contiguous numpy arrays, the
+        callbacks run inside update, which the render loop calls once per
+        frame, so the GL context is never touched from another thread. Until
+        then assets draw with placeholder data.
+
+        numpy parsing and pygame image decoding release the GIL, so the
+        default thread pool scales with cores. A ProcessPoolExecutor works as
+        well, the decode functions are module level and return plain arrays.
+
+        Args:
+            executor (Executor): pool running the decode functions, one thread per core by default
+        """
+        self.executor = executor or ThreadPoolExecutor()
+        # (asset, future, callback) in submission order
+        self.pending = []
+
+    def __len__(self):
+        return len(self.pending)
+
+    def submit(self, asset, function: Callable, *args, callback: Callable[[Any], None]):
+        """
+        Run function(*args) on a worker and later callback(result) on the thread calling update.
+
+        Args:
+            asset: object the result belongs to, reported by update once uploaded
+        """
+        self.pending.append((asset, self.executor.submit(function, *args), callback))
+
+    def update(self, limit: int | None = None):
+        """
+        Upload the results of finished jobs, on the thread owning the GL context.
+
+        Errors raised while decoding are raised here.
+
+        Args:
+            limit (int): upload at most this many results, spreads large uploads over several frames
+
+        Returns:
+            list: assets that received data, in submission order
+        """
+        loaded = []
+        pending = []
+        for job in self.pending:
+            asset, future, callback = job
+            if not future.done() or (limit is not None and len(loaded) >= limit):
+                pending.append(job)
+                continue
+            callback(future.result())
+            loaded.append(asset)
+        self.pending = pending
+        return loaded
+
+    def wait(self):
+        """
+        Block until every job is finished and uploaded.
+
+        Returns:
+            list: assets that received data
+        """
+        wait([future for _, future, _ in self.pending])
+        return self.update()
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.pending = []
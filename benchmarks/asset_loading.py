@@ -0,0 +1,64 @@
+"""
+Serial against pooled decoding of a startup's worth of assets.
+
+Every image in img/ is decoded several times and a few synthetic meshes are
+parsed, once one after the other on the calling thread and once through an
+AssetLoader. Only the CPU side is measured, the GL uploads are the same in
+both cases and still happen on the context thread.
+
+Run from the repository root:
+    python -m benchmarks.asset_loading
+"""
+import glob
+import os
+import tempfile
+import time
+
+from asset_loader import AssetLoader
+from benchmarks.obj_loading import write_synthetic_obj
+from obj_loader import load_obj
+from texture_bake import decode_image
+
+COPIES = 8
+
+
+def jobs(directory):
+    images = sorted(glob.glob("img/*"))
+    meshes = []
+    for i in range(4):
+        filename = os.path.join(directory, f"sphere_{i}.obj")
+        write_synthetic_obj(filename, 128)
+        meshes.append(filename)
+    return [(decode_image, path) for path in images * COPIES] + [(load_obj, path) for path in meshes]
+
+
+def serial(jobs):
+    start = time.perf_counter()
+    for function, path in jobs:
+        function(path)
+    return time.perf_counter() - start
+
+
+def pooled(jobs):
+    loader = AssetLoader()
+    start = time.perf_counter()
+    for function, path in jobs:
+        loader.submit(path, function, path, callback=lambda result: None)
+    loader.wait()
+    elapsed = time.perf_counter() - start
+    loader.shutdown()
+    return elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        work = jobs(directory)
+        serial_time = min(serial(work) for _ in range(3))
+        pooled_time = min(pooled(work) for _ in range(3))
+
+    print(f"{len(work)} assets on {os.cpu_count()} cores  serial {serial_time * 1000:8.1f} ms"
+          f"  pooled {pooled_time * 1000:8.1f} ms  x{serial_time / pooled_time:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Lights shaded per fragment with clustered lighting, as the number of point lights grows.
+
+Lights are spread over a level at a constant density, so the level grows
+with the light count while the camera sees about as much of it. Without
+clusters every fragment loops over every light, with them a fragment only
+loops over the lights of its cluster, which stay about as many however
+large the level gets. Assigning the lights to clusters is timed as well.
+
+Run from the repository root:
+    python -m benchmarks.clustered_lighting
+"""
+import time
+
+import glm
+import numpy as np
+
+from camera import Camera
+from clustered_lighting import PointLights, assign_lights, cluster_bounds
+
+# lights per square unit of the level
+DENSITY = 0.5
+GRID = (16, 9, 24)
+
+
+def level(count, rng):
+    """
+    Lights over a square level in front of the camera, which looks down -z from its middle edge.
+    """
+    size = np.sqrt(count / DENSITY)
+    lights = PointLights(count)
+    positions = np.stack((rng.uniform(-size / 2, size / 2, count), rng.uniform(0, 3, count), rng.uniform(-size, 0, count)), axis=1)
+    radii = rng.uniform(1, 3, count)
+    for position, radius in zip(positions, radii):
+        lights.add(position, (0, 0, 0), (1, 1, 1), (1, 1, 1), radius)
+    return lights
+
+
+def report(count, camera, bounds, rng):
+    lights = level(count, rng)
+    projection = np.asarray(camera.projection_transform)
+    view = np.asarray(camera.view_matrix)
+    centers = lights.positions @ view[:3, :3].T + view[:3, 3]
+
+    elapsed = []
+    for _ in range(5):
+        start = time.perf_counter()
+        light_of, cluster_of = assign_lights(centers, lights.radii, projection, camera.near, camera.far, GRID, *bounds)
+        # grouped by cluster as LightClusters uploads them
+        light_of = light_of[np.argsort(cluster_of, kind='stable')]
+        counts = np.bincount(cluster_of, minlength=int(np.prod(GRID)))
+        elapsed.append(time.perf_counter() - start)
+
+    # every cluster is weighted alike, close to the share of the screen its fragments cover
+    print(f"{count:>6} lights  {len(np.unique(light_of)):>5} in view  per fragment: {count:>6} without clusters,"
+          f" {counts.mean():5.2f} on average and {counts.max():3} at most with them  assigned in {min(elapsed) * 1000:6.2f} ms")
+
+
+def main():
+    camera = Camera((0, 1.5, 0), (0, 0, 0), glm.radians(45.0), 1200 / 800, 0.3, 30.0)
+    camera.view_matrix = glm.lookAt(glm.vec3(0, 1.5, 0), glm.vec3(0, 1.5, -1), glm.vec3(0, 1, 0))
+    bounds = cluster_bounds(np.asarray(camera.projection_transform), camera.near, camera.far, GRID)
+
+    rng = np.random.default_rng(0)
+    for count in (100, 300, 1000, 3000, 10000, 30000):
+        report(count, camera, bounds, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Model matrix computation, vectorized EntityStore against the per-entity glm path.
+
+Run from the repository root:
+    python -m benchmarks.entity_transforms
+"""
+import time
+
+import glm
+import numpy as np
+
+from entity_store import EntityStore
+
+
+def glm_transform(position, orientation, scale):
+    # the original Entity.calculate_transform_matrix
+    pitch = glm.rotate(glm.radians(orientation.x), glm.vec3(1, 0, 0))
+    yaw = glm.rotate(glm.radians(orientation.y), glm.vec3(0, 1, 0))
+    roll = glm.rotate(glm.radians(orientation.z), glm.vec3(0, 0, 1))
+    rotation_transformation = yaw @ pitch @ roll
+
+    position_transformation = glm.translate(position)
+
+    scale_transformation = glm.scale(glm.vec3(scale, scale, scale))
+
+    return position_transformation @ rotation_transformation @ scale_transformation
+
+
+class Handle:
+    row = None
+
+
+def report(count):
+    rng = np.random.default_rng(0)
+    positions = rng.uniform(-100, 100, (count, 3)).astype(np.float32)
+    orientations = rng.uniform(0, 360, (count, 3)).astype(np.float32)
+    scales = rng.uniform(0.1, 2, count).astype(np.float32)
+
+    objects = [(glm.vec3(*p), glm.vec3(*o), float(s)) for p, o, s in zip(positions, orientations, scales)]
+    start = time.perf_counter()
+    matrices = [glm_transform(*o) for o in objects]
+    glm_time = time.perf_counter() - start
+
+    store = EntityStore(count)
+    for p, o, s in zip(positions, orientations, scales):
+        handle = Handle()
+        handle.row = store.add(handle, p, o, s)
+    store_time = float('inf')
+    for _ in range(5):
+        # mark every row as changed, update_transforms returns early otherwise
+        store.dirty[:count] = True
+        store.changed = True
+        start = time.perf_counter()
+        store.update_transforms()
+        store_time = min(store_time, time.perf_counter() - start)
+
+    expected = np.frombuffer(b''.join(m.to_bytes() for m in matrices), dtype=np.float32).reshape(-1, 4, 4)
+    assert np.allclose(store.transforms[:count], expected, atol=1e-3)
+
+    print(f"{count:>7} entities  glm {glm_time * 1000:9.2f} ms  store {store_time * 1000:7.2f} ms"
+          f"  x{glm_time / store_time:.0f}")
+
+
+def main():
+    for count in (1_000, 10_000, 100_000):
+        report(count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Triangles submitted with and without levels of detail, on fields of distant models.
+
+Models are spread over a field in front of the camera, most of them far
+away. Without levels of detail every one is drawn at its full triangle
+count, with them LODSelector picks a level by size on screen. The camera
+then walks back and forth across a threshold to count level switches, which
+the hysteresis holds down.
+
+Run from the repository root:
+    python -m benchmarks.lod
+"""
+import tempfile
+import time
+
+import glm
+import numpy as np
+
+from camera import Camera
+from culling import Bounds
+from entity_store import EntityStore
+from lod import LODSelector
+from mesh_cache import load_lods
+
+MODEL = "models/monkey.obj"
+LEVELS = 4
+
+
+def field(count, depth, rng, bounds):
+    store = EntityStore()
+    positions = np.stack((rng.uniform(-depth / 2, depth / 2, count), np.zeros(count), rng.uniform(-depth, -2, count)), axis=1)
+    for position in positions:
+        store.add(None, position, (0, rng.uniform(0, 360), 0), 1.0, bounds)
+    store.update_transforms()
+    return store
+
+
+def report(chain, count, depth, rng):
+    triangles = np.array([len(indices) // 3 for _, indices in chain])
+    store = field(count, depth, rng, Bounds(chain[0][0][:, :3]))
+    camera = Camera((0, 1, 0), (0, 0, 0), glm.radians(45.0), 1.5, 0.3, 2 * depth)
+
+    selector = LODSelector(store)
+    start = time.perf_counter()
+    selector.update(camera)
+    elapsed = time.perf_counter() - start
+
+    full = count * triangles[0]
+    drawn = int((selector.counts[:LEVELS] * triangles).sum())
+    print(f"{count:>6} models {depth:>4} deep  {full:>10} triangles full  {drawn:>9} with lods"
+          f"  {full / drawn:5.1f}x fewer  levels {selector.counts.tolist()}  selection {elapsed * 1000:.2f} ms")
+
+
+def popping(chain, hysteresis):
+    """
+    Level switches of one model while the camera jitters around the distance of its first threshold.
+    """
+    store = EntityStore()
+    store.add(None, (0, 0, 0), (0, 0, 0), 1.0, Bounds(chain[0][0][:, :3]))
+    store.update_transforms()
+    camera = Camera((0, 0, 0), (0, 0, 0), glm.radians(45.0), 1.5, 0.3, 100)
+    selector = LODSelector(store, hysteresis=hysteresis)
+    focal = camera.projection_transform[1][1]
+    threshold_distance = store.world_radii[0] * focal / selector.thresholds[0]
+
+    switches = 0
+    level = store.lods[0]
+    rng = np.random.default_rng(1)
+    for z in store.world_centers[0, 2] + threshold_distance * (1 + rng.uniform(-0.05, 0.05, 1000)):
+        camera.position = glm.vec3(0, 0, z)
+        selector.update(camera)
+        switches += store.lods[0] != level
+        level = store.lods[0]
+    return switches
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        chain = load_lods(MODEL, LEVELS, cache_directory=directory)
+        print(f"{MODEL}: " + ", ".join(str(len(indices) // 3) for _, indices in chain)
+              + f" triangles, chain built in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    rng = np.random.default_rng(0)
+    for count, depth in ((100, 20), (1000, 60), (10000, 200)):
+        report(chain, count, depth, rng)
+
+    print(f"level switches over 1000 frames at a threshold: {popping(chain, 0.0)} without hysteresis,"
+          f" {popping(chain, 0.15)} with 15%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Cold against warm mesh loading through the binary mesh cache.
+
+Cold loads parse the OBJ text and write the cache, warm loads map the
+cached file. Both read every byte of the result, as glBufferData would.
+
+Run from the repository root:
+    python -m benchmarks.mesh_cache
+"""
+import os
+import tempfile
+import time
+
+from mesh_cache import load_mesh
+from benchmarks.obj_loading import write_synthetic_obj
+
+
+def timed_load(filename, cache_directory):
+    start = time.perf_counter()
+    vertices, indices = load_mesh(filename, cache_directory)
+    vertices.sum(), indices.sum()
+    return time.perf_counter() - start
+
+
+def report(filename, cache_directory):
+    cold = timed_load(filename, cache_directory)
+    warm = min(timed_load(filename, cache_directory) for _ in range(5))
+
+    print(f"{os.path.basename(filename):>16}  cold {cold * 1000:9.2f} ms  warm {warm * 1000:8.2f} ms"
+          f"  x{cold / warm:.0f}")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        cache_directory = os.path.join(directory, "cache")
+        report("models/monkey.obj", cache_directory)
+
+        for resolution in (256, 512):
+            filename = os.path.join(directory, f"sphere_{resolution}.obj")
+            write_synthetic_obj(filename, resolution)
+            report(filename, cache_directory)
+
+
+if __name__ == "__main__":
+    main()
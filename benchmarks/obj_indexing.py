@@ -0,0 +1,60 @@
+"""
+Buffer sizes and vertex shader invocations, indexed against expanded geometry.
+
+Vertex shader invocations of the indexed path are estimated with a FIFO
+post-transform cache; glDrawArrays never reuses a transformed vertex.
+
+Run from the repository root:
+    python -m benchmarks.obj_indexing
+"""
+import os
+import tempfile
+from collections import deque
+
+from obj_loader import load_obj
+from benchmarks.obj_loading import write_synthetic_obj
+
+CACHE_SIZE = 32
+
+
+def shader_invocations(indices, cache_size):
+    cache = deque(maxlen=cache_size)
+    cached = set()
+    invocations = 0
+    for index in indices.tolist():
+        if index in cached:
+            continue
+        invocations += 1
+        if len(cache) == cache_size:
+            cached.discard(cache[0])
+        cache.append(index)
+        cached.add(index)
+    return invocations
+
+
+def report(filename):
+    vertices, indices = load_obj(filename)
+    corners = len(indices)
+
+    expanded_bytes = corners * vertices.itemsize * vertices.shape[1]
+    indexed_bytes = vertices.nbytes + indices.nbytes
+    invocations = shader_invocations(indices, CACHE_SIZE)
+
+    print(f"{os.path.basename(filename):>16} {corners // 3:>9} tris {len(vertices):>8} verts ({indices.dtype})"
+          f"  buffers {expanded_bytes / 1024:9.1f} KiB -> {indexed_bytes / 1024:9.1f} KiB"
+          f"  VS invocations {corners:>8} -> {invocations:>8}"
+          f" (ACMR {3 * invocations / corners:.2f})")
+
+
+def main():
+    report("models/monkey.obj")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for resolution in (64, 256, 512):
+            filename = os.path.join(directory, f"sphere_{resolution}.obj")
+            write_synthetic_obj(filename, resolution)
+            report(filename)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+OBJ load time, vectorized loader against the original line by line parser.
+
+Run from the repository root:
+    python -m benchmarks.obj_loading
+"""
+import os
+import tempfile
+import time
+
+import glm
+import numpy as np
+
+from obj_loader import load_obj
+
+
+def legacy_load_mesh(filename):
+    # the original OBJModel.loadMesh, kept here as the reference implementation
+    v = []
+    vt = []
+    vn = []
+    vertices = []
+
+    with open(filename, 'r') as f:
+        line = f.readline()
+        while line:
+            firstSpace = line.find(" ")
+            flag = line[0:firstSpace]
+            if flag == "v":
+                line = line.replace("v ", "")
+                line = line.split(" ")
+                v.append([float(x) for x in line])
+            elif flag == "vt":
+                line = line.replace("vt ", "")
+                line = line.split(" ")
+                vt.append([float(x) for x in line])
+            elif flag == "vn":
+                line = line.replace("vn ", "")
+                line = line.split(" ")
+                vn.append([float(x) for x in line])
+            elif flag == "f":
+                line = line.replace("f ", "")
+                line = line.replace("\n", "")
+                line = line.split(" ")
+                faceVertices = []
+                faceTextures = []
+                faceNormals = []
+                for vertex in line:
+                    l = vertex.split("/")
+                    faceVertices.append(v[int(l[0]) - 1])
+                    faceTextures.append(vt[int(l[1]) - 1])
+                    faceNormals.append(vn[int(l[2]) - 1])
+                vertex_order = []
+                for i in range(len(line) - 2):
+                    vertex_order.append(0)
+                    vertex_order.append(i+1)
+                    vertex_order.append(i+2)
+                for i in vertex_order:
+                    for x in faceVertices[i]:
+                        vertices.append(x)
+                    for x in faceTextures[i]:
+                        vertices.append(x)
+                    for x in faceNormals[i]:
+                        vertices.append(x)
+            line = f.readline()
+
+    return glm.array(glm.float32, *vertices)
+
+
+def write_synthetic_obj(filename, resolution):
+    """
+    Write a uv sphere made of quads, resolution x resolution faces.
+    """
+    theta = np.linspace(0, np.pi, resolution + 1)
+    phi = np.linspace(0, 2 * np.pi, resolution + 1)
+    t, p = np.meshgrid(theta, phi, indexing='ij')
+    normals = np.stack((np.sin(t) * np.cos(p), np.cos(t), np.sin(t) * np.sin(p)), axis=-1).reshape(-1, 3)
+    uvs = np.stack((p / (2 * np.pi), t / np.pi), axis=-1).reshape(-1, 2)
+
+    row = resolution + 1
+    i, j = np.meshgrid(np.arange(resolution), np.arange(resolution), indexing='ij')
+    a = (i * row + j).ravel() + 1
+    quads = np.stack((a, a + row, a + row + 1, a + 1), axis=1)
+
+    with open(filename, 'w') as f:
+        f.write(''.join(f"v {x:.6f} {y:.6f} {z:.6f}\n" for x, y, z in normals))
+        f.write(''.join(f"vt {s:.6f} {t:.6f}\n" for s, t in uvs))
+        f.write(''.join(f"vn {x:.6f} {y:.6f} {z:.6f}\n" for x, y, z in normals))
+        f.write(''.join(f"f {a}/{a}/{a} {b}/{b}/{b} {c}/{c}/{c} {d}/{d}/{d}\n" for a, b, c, d in quads))
+
+
+def best_of(function, filename, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(filename)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def compare(filename, repeat):
+    legacy_time, legacy = best_of(legacy_load_mesh, filename, repeat)
+    numpy_time, (vertices, indices) = best_of(load_obj, filename, repeat)
+    assert np.allclose(np.frombuffer(legacy.to_bytes(), dtype=np.float32), vertices[indices].ravel())
+
+    print(f"{os.path.basename(filename):>16} {len(indices) // 3:>9} tris"
+          f"  legacy {legacy_time * 1000:9.1f} ms  numpy {numpy_time * 1000:8.1f} ms"
+          f"  x{legacy_time / numpy_time:.1f}")
+
+
+def main():
+    compare("models/monkey.obj", repeat=5)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for resolution in (256, 512):
+            filename = os.path.join(directory, f"sphere_{resolution}.obj")
+            write_synthetic_obj(filename, resolution)
+            compare(filename, repeat=1)
+
+
+if __name__ == "__main__":
+    main()
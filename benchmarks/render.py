@@ -0,0 +1,474 @@
+"""
+Frame times of the whole renderer on a declarative scene, without a window.
+
+A scene file lists the models, how many entities of each are scattered over
+which area, the point lights and a camera path, see benchmarks/scenes. The
+scene is rendered for a fixed number of frames on an offscreen EGL context,
+with llvmpipe when there is no GPU, along the same passes as main.py and
+under the same profiler scopes. After the warm up frames the CPU and GPU
+frame times and per frame counters are reported, and the image of chosen
+frames is hashed, the camera and the animation advance by frame and not by
+time, so the same renderer draws the same pixels on every run.
+
+Results can be saved and compared against an earlier run of the same
+configuration, which fails when
+the p50 or p95 frame time grew by more than the tolerance or a checksum
+changed. Checksums only compare between runs on the same renderer.
+
+Run from the repository root:
+    python -m benchmarks.render benchmarks/scenes/default.json
+    python -m benchmarks.render benchmarks/scenes/default.json --save baseline.json
+    python -m benchmarks.render benchmarks/scenes/default.json --baseline baseline.json --deferred
+"""
+import os
+
+# PyOpenGL picks its platform on the first import of OpenGL
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+import argparse
+import json
+import sys
+
+import glm
+import numpy as np
+from OpenGL.GL import *
+
+from offscreen import OffscreenContext
+
+from asset_loader import AssetLoader
+from camera import Camera
+from clustered_lighting import LightClusters, PointLights
+from culling import FrustumCuller
+from deferred import DeferredShading
+from entities import LIGHTS_BLOCK_SIZE, DirLight, Entity, PointLight
+from entity_store import EntityStore, entity_store
+from geometry_pool import geometry_pool
+from gl_state import gl_state
+from indirect import IndirectRenderer
+from instancing import InstancedRenderer
+from lod import LODSelector
+from material import Material
+from models import ColoredCube, OBJModel, TexturedCube
+from post_processing import PostProcessing, bloom_graph
+from profiler import profiler, _percentiles
+from render_queue import RenderQueue
+from shader import Shader
+from spatial import BVH, entity_boxes
+from static_batching import merge_static
+from stream_buffer import StreamBuffer
+from uniform_buffer import FRAME_DATA_BINDING, LIGHTS_BINDING, UniformBuffer
+
+# p50 and p95 frame times may grow by this share before a run counts as a regression
+TOLERANCE = 0.1
+# results of runs that differ in any of these are not compared
+CONFIGURATION = ("scene", "size", "deferred", "post_process", "indirect", "merge_static", "frames", "warmup")
+
+
+class BenchmarkScene:
+
+    def __init__(self, description: dict, loader: AssetLoader):
+        """
+        The renderer of main.py set up for a scene description, see benchmarks/scenes.
+
+        Args:
+            description (dict): parsed scene file
+            loader (AssetLoader): decodes the models and textures, wait on it before the first frame
+        """
+        self.description = description
+        self.size = tuple(description["size"])
+        self.deferred = description.get("deferred", False)
+        self.post_process = description.get("post_process", True)
+        self.indirect = description.get("indirect", True)
+        self.merge_static = description.get("merge_static", True)
+        rng = np.random.default_rng(description.get("seed", 0))
+
+        glClearColor(0.0, 0.0, 0.0, 1)
+        gl_state.enable(GL_DEPTH_TEST)
+
+        # shaders
+        self.shader = Shader("shaders/vertex.vert", "shaders/fragment.frag")
+        self.shader_instanced = Shader("shaders/vertex_instanced.vert", "shaders/fragment.frag")
+        for lit_shader in (self.shader, self.shader_instanced):
+            lit_shader.use()
+            lit_shader.set_int("material.diffuse", 0)
+            lit_shader.set_int("material.specular", 1)
+            lit_shader.set_float("material.shininess", 32.0)
+        self.shader_basic = Shader("shaders/simple_3d_vertex.vert", "shaders/simple_3d_fragment.frag")
+        shader_basic_instanced = Shader("shaders/simple_3d_vertex_instanced.vert", "shaders/simple_3d_fragment.frag")
+        shader_directional = Shader("shaders/screen_vertex.vert", "shaders/deferred_directional.frag")
+        shader_point_volume = Shader("shaders/deferred_point.vert", "shaders/deferred_point.frag")
+
+        self.frame_data = UniformBuffer("FrameData", Camera.FRAME_DATA_SIZE, FRAME_DATA_BINDING)
+        self.frame_data.attach(self.shader, self.shader_instanced, self.shader_basic, shader_basic_instanced,
+                               shader_directional, shader_point_volume)
+        self.lights = UniformBuffer("Lights", LIGHTS_BLOCK_SIZE, LIGHTS_BINDING)
+        self.lights.attach(self.shader, self.shader_instanced, shader_directional)
+
+        self.point_light_set = PointLights()
+        self.light_clusters = LightClusters(self.lights, self.size)
+        self.light_clusters.attach(self.shader, self.shader_instanced)
+
+        shader2d = Shader("shaders/screen_vertex.vert", "shaders/screen_fragment.frag")
+        self.post_graph = None
+        if self.post_process:
+            self.post_graph = bloom_graph(
+                Shader("shaders/screen_vertex.vert", "shaders/post_downsample.frag"),
+                Shader("shaders/screen_vertex.vert", "shaders/post_upsample.frag"),
+                Shader("shaders/screen_vertex.vert", "shaders/post_tone_map.frag"),
+                Shader("shaders/screen_vertex.vert", "shaders/post_fxaa.frag"),
+            )
+        self.post_processing = PostProcessing(self.size, shader2d, self.post_graph)
+        self.deferred_shading = DeferredShading(self.size, shader2d, shader_directional, shader_point_volume, self.post_graph)
+        self.deferred_shading.attach(self.shader, self.shader_instanced, self.shader_basic, shader_basic_instanced)
+
+        # entities
+        self.models = {name: self._model(model, loader) for name, model in description["models"].items()}
+        self.static_store = EntityStore()
+        self.static_entities: list[Entity] = []
+        self.dynamic_entities: list[Entity] = []
+        # degrees per frame of every dynamic entity
+        self.rotations = []
+        for group in description["entities"]:
+            static = group.get("static", False)
+            positions = rng.uniform(*group["area"], size=(group["count"], 3))
+            yaws = rng.uniform(0, 360, group["count"])
+            scales = rng.uniform(*group.get("scale", (1, 1)), group["count"])
+            for position, yaw, scale in zip(positions, yaws, scales):
+                model = self.models[group["model"]]
+                if static:
+                    self.static_entities.append(Entity(model, position, (0, yaw, 0), scale, self.static_store))
+                else:
+                    self.dynamic_entities.append(Entity(model, position, (0, yaw, 0), scale))
+                    self.rotations.append(group.get("rotate", (0, 0, 0)))
+        self.rotations = np.array(self.rotations, dtype=np.float32).reshape(-1, 3)
+        self.orientations = np.array([entity.orientation for entity in self.dynamic_entities], dtype=np.float32).reshape(-1, 3)
+
+        lights = description.get("lights", {"count": 0})
+        self.dir_light = DirLight(self.lights, (0.5, -1, -0.5), (0.2, 0.2, 0.2), (1.0, 1.0, 1.0), (1.0, 1.0, 1.0))
+        self.point_lights = [
+            PointLight(self.shader_basic, self.point_light_set, color, position, radius)
+            for color, position, radius in zip(
+                rng.uniform(0.2, 1.0, (lights["count"], 3)),
+                rng.uniform(*lights.get("area", ((0, 0, 0), (0, 0, 0))), size=(lights["count"], 3)),
+                rng.uniform(*lights.get("radius", (PointLight.RADIUS, PointLight.RADIUS)), lights["count"]),
+            )
+        ]
+
+        self.static_index = BVH()
+        self.stream = StreamBuffer(32 * 1024 * 1024)
+        if self.merge_static:
+            self.merged_static, instanced_static = merge_static(self.static_entities)
+        else:
+            self.merged_static, instanced_static = [], self.static_entities
+        instanced_shaders = {self.shader: self.shader_instanced, self.shader_basic: shader_basic_instanced}
+        Renderer = IndirectRenderer if self.indirect else InstancedRenderer
+        self.static_batches = Renderer(instanced_shaders, self.stream)
+        self.static_batches.add(instanced_static)
+        self.dynamic_batches = None
+        if self.indirect:
+            self.dynamic_batches = IndirectRenderer(instanced_shaders, self.stream)
+            self.dynamic_batches.add(self.dynamic_entities)
+
+        self.culler = FrustumCuller(entity_store)
+        self.lod_selectors = [LODSelector(entity_store), LODSelector(self.static_store)]
+        self.render_queue = RenderQueue()
+
+        camera = description["camera"]
+        self.path = camera["path"]
+        self.camera = Camera(self.path[0]["position"], self.path[0]["orientation"], glm.radians(camera.get("fov", 45.0)),
+                             self.size[0] / self.size[1], camera.get("near", 0.3), camera.get("far", 30.0))
+
+    def loaded(self, assets):
+        """
+        Pick up the bounds of the assets AssetLoader.update uploaded.
+        """
+        entity_store.update_bounds(assets)
+        self.static_store.update_bounds(assets)
+        self.static_index.build(self.static_entities, *entity_boxes(self.static_entities))
+
+    def move(self, t, frame):
+        """
+        Place the camera along its path and turn the dynamic entities.
+
+        Both only depend on the measured frame, not on how many frames were rendered before.
+
+        Args:
+            t (float): position along the path, 0 at the first key and 1 at the last
+            frame (int): measured frame, the entities have turned by their rotation this many times
+        """
+        keys = len(self.path) - 1
+        key = min(int(t * keys), keys - 1) if keys else 0
+        blend = t * keys - key if keys else 0.0
+        start, end = self.path[key], self.path[min(key + 1, keys)]
+        self.camera.position = glm.mix(glm.vec3(*start["position"]), glm.vec3(*end["position"]), blend)
+        self.camera.orientation = glm.mix(glm.vec3(*start["orientation"]), glm.vec3(*end["orientation"]), blend)
+
+        for entity, orientation, rotation in zip(self.dynamic_entities, self.orientations, self.rotations):
+            if rotation.any():
+                entity.orientation = orientation + rotation * frame
+
+    def render(self):
+        """
+        One frame of main.py, into framebuffer 0.
+        """
+        deferred = self.deferred
+        with profiler.scope("camera"):
+            self.camera.update(self.frame_data)
+
+        with profiler.scope("lights"):
+            self.dir_light.update()
+            for point_light in self.point_lights:
+                point_light.update()
+            if deferred:
+                self.deferred_shading.update(self.point_light_set)
+            else:
+                self.light_clusters.update(self.camera, self.point_light_set)
+            self.lights.upload()
+
+        with profiler.scope("transforms"):
+            for entity in self.dynamic_entities:
+                entity.update()
+            entity_store.update_transforms()
+            self.static_store.update_transforms()
+            for lod_selector in self.lod_selectors:
+                lod_selector.update(self.camera)
+
+        with profiler.scope("culling"):
+            frustum = self.camera.frustum_planes()
+            self.culler.update(frustum)
+            visible_mask = self.static_store.mask(self.static_index.query_frustum(frustum))
+            self.static_batches.update(visible_mask)
+            for batch in self.merged_static:
+                batch.update(visible_mask)
+            if self.indirect:
+                self.dynamic_batches.update(self.culler.visible)
+
+        with profiler.scope("draw"):
+            if deferred:
+                self.deferred_shading.begin()
+            else:
+                if self.post_process:
+                    self.post_processing.begin()
+                else:
+                    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+                self.light_clusters.bind()
+
+            gl_state.enable(GL_CULL_FACE)
+            if self.indirect:
+                self.dynamic_batches.draw()
+            else:
+                self.render_queue.submit_entities(self.culler.filter(self.dynamic_entities))
+                self.render_queue.flush(self.camera.position)
+            self.static_batches.draw()
+            for batch in self.merged_static:
+                batch.draw()
+
+        if deferred:
+            with profiler.scope("deferred lighting"):
+                self.deferred_shading.shade()
+
+        with profiler.scope("draw"):
+            gl_state.disable(GL_CULL_FACE)
+            self.render_queue.submit_entities(self.culler.filter(self.point_lights))
+            self.render_queue.flush(self.camera.position)
+
+        with profiler.scope("post processing"):
+            if deferred:
+                self.deferred_shading.end()
+            elif self.post_process:
+                self.post_processing.end()
+
+    def end_frame(self):
+        self.stream.end_frame()
+        profiler.end_frame()
+        gl_state.end_frame()
+        self.render_queue.end_frame()
+
+    def destroy(self):
+        # entities share their models, which are freed once each
+        for entity in self.dynamic_entities + self.point_lights + self.static_entities:
+            entity.store.remove(entity)
+        for model in self.models.values():
+            model.destroy()
+        for point_light in self.point_lights:
+            point_light.model.destroy()
+        self.stream.destroy()
+        for batch in self.merged_static:
+            batch.destroy()
+        self.frame_data.destroy()
+        self.lights.destroy()
+        self.light_clusters.destroy()
+        self.deferred_shading.destroy()
+        self.post_processing.destroy()
+        if self.post_graph is not None:
+            self.post_graph.destroy()
+        geometry_pool.destroy()
+
+    def _model(self, model, loader):
+        if model["type"] == "obj":
+            material = Material(model["diffuse"], model["specular"], loader=loader)
+            return OBJModel(model["file"], material, self.shader, loader, lod_count=model.get("lod_count", 1))
+        if model["type"] == "textured_cube":
+            return TexturedCube(Material(model["diffuse"], model["specular"], loader=loader), self.shader)
+        if model["type"] == "colored_cube":
+            return ColoredCube(*model["color"], self.shader_basic)
+        raise ValueError(f"unknown model type {model['type']!r}")
+
+
+def run(description: dict, frames=None, warmup=None):
+    """
+    Render a scene offscreen and measure it.
+
+    Args:
+        description (dict): parsed scene file
+        frames (int): measured frames, the scene's by default
+        warmup (int): frames rendered before measuring, the scene's by default
+
+    Returns:
+        dict: renderer, frame counts, profiler summary, GPU frame time and checksums by frame
+    """
+    frames = frames or description.get("frames", 240)
+    warmup = max(1, warmup if warmup is not None else description.get("warmup", 30))
+    checksum_frames = {frame for frame in description.get("checksum_frames", ()) if frame < frames}
+
+    context = OffscreenContext(description["size"])
+    loader = AssetLoader()
+    scene = BenchmarkScene(description, loader)
+    scene.loaded(loader.wait())
+
+    checksums = {}
+    for frame in range(warmup + frames):
+        if frame == warmup:
+            # the first frames compile shaders and fill caches, the first GPU query can read garbage on some drivers
+            profiler.finish()
+            profiler.reset(frames)
+        measured = frame - warmup
+        profiler.begin_frame()
+        scene.move(max(measured, 0) / max(frames - 1, 1), max(measured, 0))
+        scene.render()
+        with profiler.scope("swap"):
+            context.swap()
+        scene.end_frame()
+        # read back outside of the frame, it waits for the GPU
+        if measured in checksum_frames:
+            checksums[str(measured)] = context.checksum()
+    profiler.finish()
+
+    summary = profiler.summary()
+    gpu_frame_ms = [sum(frame["gpu_ms"].values()) for frame in profiler.frames]
+    results = {
+        "renderer": context.renderer,
+        "size": list(scene.size),
+        "deferred": scene.deferred,
+        "post_process": scene.post_process,
+        "indirect": scene.indirect,
+        "merge_static": scene.merge_static,
+        "warmup": warmup,
+        **summary,
+        "gpu_frame_ms": _percentiles(gpu_frame_ms),
+        "checksums": checksums,
+    }
+
+    loader.shutdown()
+    scene.destroy()
+    profiler.destroy()
+    context.destroy()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance=TOLERANCE):
+    """
+    Regressions of results against a baseline run of the same scene.
+
+    Returns:
+        list[str]: one line per frame time that grew by more than tolerance or checksum that changed
+
+    Raises:
+        ValueError: the baseline was run with another configuration, see CONFIGURATION
+    """
+    differences = [
+        f"{key} {baseline.get(key)} -> {results.get(key)}" for key in CONFIGURATION if baseline.get(key) != results.get(key)
+    ]
+    if differences:
+        raise ValueError(f"the baseline was run with another configuration: {', '.join(differences)}")
+
+    failures = []
+    for key in ("frame_ms", "gpu_frame_ms"):
+        for stat in ("p50", "p95"):
+            before, after = baseline[key][stat], results[key][stat]
+            if after > before * (1 + tolerance):
+                failures.append(f"{key} {stat} {before:.2f} -> {after:.2f} ms (+{(after / before - 1) * 100:.0f}%)")
+    if baseline.get("renderer") == results["renderer"]:
+        for frame, checksum in baseline.get("checksums", {}).items():
+            if frame in results["checksums"] and results["checksums"][frame] != checksum:
+                failures.append(f"image of frame {frame} changed")
+    return failures
+
+
+def report(results: dict):
+    lines = [
+        f"{results['renderer']}  {results['size'][0]}x{results['size'][1]}"
+        f"  {'deferred' if results['deferred'] else 'forward'}{' with post processing' if results['post_process'] else ''}",
+        f"{results['frames']} frames  p50 / p95 / p99 / mean ms",
+    ]
+    for label, stats in (("cpu frame", results["frame_ms"]), ("gpu frame", results["gpu_frame_ms"])):
+        lines.append(f"  {label:<18} {stats['p50']:8.2f} {stats['p95']:8.2f} {stats['p99']:8.2f} {stats['mean']:8.2f}")
+    for kind in ("cpu_ms", "gpu_ms"):
+        for name, stats in results[kind].items():
+            lines.append(f"    {kind[:3]} {name:<14} {stats['p50']:8.2f} {stats['p95']:8.2f} {stats['p99']:8.2f} {stats['mean']:8.2f}")
+    for name, mean in results["counters"].items():
+        lines.append(f"  {name}: {mean:.1f} per frame")
+    for frame, checksum in results["checksums"].items():
+        lines.append(f"  frame {frame}: {checksum}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a benchmark scene offscreen and report its frame times.")
+    parser.add_argument("scene", help="scene file, see benchmarks/scenes")
+    parser.add_argument("--frames", type=int, help="measured frames, overrides the scene")
+    parser.add_argument("--warmup", type=int, help="frames rendered before measuring, overrides the scene")
+    parser.add_argument("--size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"), help="overrides the scene")
+    shading = parser.add_mutually_exclusive_group()
+    shading.add_argument("--deferred", dest="deferred", action="store_true", default=None)
+    shading.add_argument("--forward", dest="deferred", action="store_false")
+    parser.add_argument("--no-post-process", dest="post_process", action="store_false", default=None)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed growth of the p50 and p95 frame times")
+    parser.add_argument("--trace", help="write the measured frames as a Chrome trace")
+    args = parser.parse_args()
+
+    with open(args.scene) as f:
+        description = json.load(f)
+    for key in ("size", "deferred", "post_process"):
+        if getattr(args, key) is not None:
+            description[key] = getattr(args, key)
+
+    results = run(description, args.frames, args.warmup)
+    results["scene"] = args.scene
+    print(report(results))
+
+    if args.trace:
+        profiler.export_chrome_trace(args.trace)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        try:
+            failures = compare(results, baseline, args.tolerance)
+        except ValueError as error:
+            sys.exit(f"cannot compare against {args.baseline}: {error}")
+        for failure in failures:
+            print(f"regression: {failure}")
+        if failures:
+            sys.exit(1)
+        print(f"no regression against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
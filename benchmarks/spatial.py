@@ -0,0 +1,123 @@
+"""
+BVH queries against linear scans over every box.
+
+Objects are spread at a constant density, so the world grows with the object
+count while the queries cover the same volume and return about as many results.
+A linear scan costs more with every object added, the BVH only gets deeper.
+
+Run from the repository root:
+    python -m benchmarks.spatial
+"""
+import time
+
+import glm
+import numpy as np
+
+from culling import frustum_planes
+from spatial import BVH
+
+# objects per cubic unit
+DENSITY = 0.05
+QUERIES = 50
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def scan_frustum(planes, lows, highs):
+    normals = planes[:, :3]
+    # corner of each box furthest along each plane normal
+    far = np.where(normals[None] >= 0, highs[:, None], lows[:, None])
+    return np.flatnonzero(((far * normals).sum(axis=2) + planes[:, 3] >= 0).all(axis=1))
+
+
+def scan_radius(center, radius, lows, highs):
+    closest = np.clip(center, lows, highs)
+    return np.flatnonzero(((closest - center) ** 2).sum(axis=1) <= radius * radius)
+
+
+def scan_ray(origin, direction, lows, highs):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t0 = (lows - origin) / direction
+        t1 = (highs - origin) / direction
+    entry = np.maximum(np.minimum(t0, t1).max(axis=1), 0)
+    leave = np.maximum(t0, t1).min(axis=1)
+    hits = np.flatnonzero(entry <= leave)
+    if len(hits) == 0:
+        return None
+    return hits[np.argmin(entry[hits])]
+
+
+def report(count, rng):
+    size = (count / DENSITY) ** (1 / 3)
+    centers = rng.uniform(0, size, (count, 3))
+    extents = rng.uniform(0.2, 1.0, (count, 1))
+    lows, highs = centers - extents, centers + extents
+    items = list(range(count))
+
+    bvh = BVH(margin=0)
+    _, build_time = timed(bvh.build, items, lows, highs)
+
+    middle = np.full(3, size / 2)
+    frustums = []
+    for _ in range(QUERIES):
+        target = middle + rng.normal(size=3)
+        proj_view = glm.perspective(glm.radians(45.0), 1.5, 0.3, 15.0) @ glm.lookAt(
+            glm.vec3(*middle), glm.vec3(*target), glm.vec3(0, 1, 0)
+        )
+        frustums.append(frustum_planes(np.asarray(proj_view)).astype(np.float64))
+    spheres = [(middle + rng.uniform(-5, 5, 3), 5.0) for _ in range(QUERIES)]
+    rays = [(middle, rng.normal(size=3)) for _ in range(QUERIES)]
+
+    results = {}
+    for name, queries, query, scan in (
+        ("frustum", frustums, lambda q: bvh.query_frustum(q), lambda q: scan_frustum(q, lows, highs)),
+        ("radius", spheres, lambda q: bvh.query_radius(*q), lambda q: scan_radius(*q, lows, highs)),
+        ("ray", rays, lambda q: bvh.query_ray(*q)[0], lambda q: scan_ray(*q, lows, highs)),
+    ):
+        bvh_time = scan_time = 0
+        found = visited = 0
+        for q in queries:
+            result, elapsed = timed(query, q)
+            bvh_time += elapsed
+            visited += bvh.visited
+            expected, elapsed = timed(scan, q)
+            scan_time += elapsed
+
+            if name == "ray":
+                # ties between overlapping boxes may resolve to either one
+                assert (result is None) == (expected is None)
+                found += result is not None
+            else:
+                assert sorted(result) == expected.tolist()
+                found += len(result)
+        results[name] = (bvh_time / len(queries), scan_time / len(queries), found / len(queries), visited / len(queries))
+
+    # incremental updates, move a tenth of the objects far enough to leave their leaf
+    moved = rng.choice(count, count // 10, replace=False)
+    offsets = rng.uniform(-3, 3, (len(moved), 3))
+    start = time.perf_counter()
+    for item, offset in zip(moved.tolist(), offsets):
+        bvh.update(item, lows[item] + offset, highs[item] + offset)
+    update_time = (time.perf_counter() - start) / len(moved)
+    lows[moved] += offsets
+    highs[moved] += offsets
+    assert sorted(bvh.query_radius(*spheres[0])) == scan_radius(*spheres[0], lows, highs).tolist()
+
+    print(f"{count:>7} objects  build {build_time * 1000:8.1f} ms  update {update_time * 1e6:6.1f} us")
+    for name, (bvh_time, scan_time, found, visited) in results.items():
+        print(f"    {name:<8} bvh {bvh_time * 1e6:8.1f} us ({visited:6.0f} nodes)"
+              f"  scan {scan_time * 1e6:8.1f} us  x{scan_time / bvh_time:5.1f}  {found:6.1f} results")
+
+
+def main():
+    rng = np.random.default_rng(0)
+    for count in (1_000, 10_000, 100_000):
+        report(count, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Decoding images at startup against mapping baked textures.
+
+Decoding is what a load cost before baking, glGenerateMipmap then built the
+mip chain on the GPU. Warm loads map the baked file, whose levels are
+uploaded as they are. Both read every byte of the result, as the upload would.
+
+Run from the repository root:
+    python -m benchmarks.texture_bake
+"""
+import glob
+import os
+import tempfile
+import time
+
+from texture_bake import bake_file, decode_image, load_texture
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def report(filename, cache_directory):
+    pixels, decode = timed(decode_image, filename)
+    decode = min(decode, *(timed(decode_image, filename)[1] for _ in range(4)))
+
+    print(f"{os.path.basename(filename):>22}  decode {decode * 1000:6.2f} ms  RGBA8 + mips {pixels.nbytes * 4 / 3 / 1024:7.1f} KiB")
+    for format in ("rgb8", "bc1"):
+        bake_file(filename, format, cache_directory=cache_directory)
+        warm = min(timed(lambda: sum(int(level.sum()) for level in load_texture(filename, True, cache_directory).levels))[1]
+                   for _ in range(5))
+        texture = load_texture(filename, True, cache_directory)
+        print(f"{format:>22}  warm   {warm * 1000:6.2f} ms  {texture.nbytes / 1024:18.1f} KiB")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        for filename in sorted(glob.glob("img/*")):
+            report(filename, directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 from OpenGL.GL import *
 import glm
+import numpy as np
 
-from shader import Shader
+from culling import frustum_planes
+from uniform_buffer import UniformBuffer
 
 from typing import Sequence
 
@@ -10,12 +12,29 @@ class Camera:
     forward = glm.vec3(0.0, 0.0, -1.0)
     up = glm.vec3(0.0, 1.0, 0.0)
     
+    # std140 layout of the FrameData uniform block
+    FRAME_DATA_SIZE = 80
+    PROJ_VIEW_OFFSET = 0
+    VIEW_POS_OFFSET = 64
+    
     def __init__(self, position: Sequence, orientation: Sequence, fov, aspect_ratio, near, far):
         self.position = glm.vec3(*position)
         # orientation is a list of euler angles (yaw, pitch, roll)
         self.orientation = glm.vec3(*orientation)
+        self.fov = fov
+        self.near = near
+        self.far = far
         self.projection_transform = glm.perspective(fov, aspect_ratio, near, far)
+        # view and projection @ view of the last update
+        self.view_matrix = glm.mat4(1.0)
+        self.projView_matrix = self.projection_transform
         
+    def set_aspect_ratio(self, aspect_ratio):
+        """
+        Rebuild the projection for a resized window, the next update uploads it.
+        """
+        self.projection_transform = glm.perspective(self.fov, aspect_ratio, self.near, self.far)
+
     def rotate(self, pitch, yaw, roll):
         self.orientation.x += pitch
         self.orientation.y += yaw
@@ -26,7 +45,7 @@ class Camera:
         self.position.y += y
         self.position.z += z
 
-    def update(self, shaders: Sequence[Shader]):
+    def update(self, frame_data: UniformBuffer):
         pitch = glm.rotate(glm.radians(self.orientation.x), glm.vec3(1, 0, 0))
         yaw = glm.rotate(glm.radians(self.orientation.y), glm.vec3(0, 1, 0))
         roll = glm.rotate(glm.radians(self.orientation.z), glm.vec3(0, 0, 1))
@@ -39,11 +58,18 @@ class Camera:
         lookat_matrix = glm.lookAt(self.position, self.position + forward, up)
         
         projView_matrix = self.projection_transform @ lookat_matrix
+        self.view_matrix = lookat_matrix
+        self.projView_matrix = projView_matrix
+        
+        frame_data.write(Camera.PROJ_VIEW_OFFSET, projView_matrix)
+        frame_data.write(Camera.VIEW_POS_OFFSET, self.position)
+        frame_data.upload()
         
-        for shader in shaders:
-            shader.use()
-            shader.set_mat4("projView", projView_matrix)
-            shader.set_vec3("viewPos", self.position)
+    def frustum_planes(self):
+        """
+        (6, 4) planes of the view frustum as of the last update, normals pointing inside.
+        """
+        return frustum_planes(np.asarray(self.projView_matrix))
         
 class FPS_Camera(Camera):
     
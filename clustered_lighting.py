@@ -0,0 +1,320 @@
+from OpenGL.GL import *
+import numpy as np
+
+from camera import Camera
+from gl_state import gl_state
+from shader import Shader
+from uniform_buffer import UniformBuffer
+
+from typing import Sequence
+
+# texture units of the light buffers, after the material's diffuse and specular maps
+POINT_LIGHTS_UNIT = 2
+CLUSTERS_UNIT = 3
+CLUSTER_LIGHTS_UNIT = 4
+
+# byte offset of the cluster parameters in the Lights uniform block, after the DirLight
+CLUSTERS_OFFSET = 64
+
+# texels of one light in the point light buffer: position and radius, then ambient, diffuse
+# and specular each with one attenuation term
+LIGHT_TEXELS = 4
+
+
+class PointLights:
+
+    def __init__(self, capacity=64):
+        """
+        Struct of arrays holding every point light, indexed by the index add returns.
+
+        Args:
+            capacity (int): initial number of lights, the arrays grow as needed
+        """
+        self.count = 0
+        # (n, 4, 4) float32, the layout of the point light buffer:
+        # x, y, z, radius | ambient, constant | diffuse, linear | specular, quadratic
+        self.data = np.zeros((capacity, LIGHT_TEXELS, 4), dtype=np.float32)
+
+    @property
+    def positions(self):
+        return self.data[:self.count, 0, :3]
+
+    @property
+    def radii(self):
+        return self.data[:self.count, 0, 3]
+
+    def add(self, position: Sequence, ambient: Sequence, diffuse: Sequence, specular: Sequence, radius: float,
+            constant=1.0, linear=0.0, quadratic=0.0):
+        """
+        Args:
+            position (Sequence): x, y, z world space position
+            ambient, diffuse, specular (Sequence): r, g, b colors
+            radius (float): distance at which the light has faded out completely, lights
+                only reach the clusters their sphere touches
+            constant, linear, quadratic (float): attenuation terms
+
+        Returns:
+            int: index of the light
+        """
+        if self.count == len(self.data):
+            grown = np.zeros((2 * self.count, LIGHT_TEXELS, 4), dtype=np.float32)
+            grown[:self.count] = self.data[:self.count]
+            self.data = grown
+
+        index = self.count
+        self.count += 1
+        self.data[index] = (
+            (*position, radius), (*ambient, constant), (*diffuse, linear), (*specular, quadratic)
+        )
+        return index
+
+    def set_position(self, index, position: Sequence):
+        self.data[index, 0, :3] = position
+
+
+class LightClusters:
+
+    def __init__(self, lights: UniformBuffer, win_size: Sequence, grid: Sequence = (16, 9, 24)):
+        """
+        Clustered forward lighting: point lights are only shaded by the fragments of the clusters they touch.
+
+        The view frustum is split into tiles across the screen and
+        exponentially spaced depth slices. Every frame the clusters each
+        light's sphere touches are found with NumPy, without a Python loop per
+        light, and sorted into one list of light indices per cluster. The
+        lights, each cluster's range of the list and the list itself go to the
+        GPU in texture buffers, which GL 3.1 already has, and the fragment
+        shader only iterates the lights of its own cluster. The cost per
+        fragment follows the number of lights near it, not the total.
+
+        Args:
+            lights (UniformBuffer): buffer of the Lights uniform block, the cluster parameters follow its DirLight
+            win_size (Sequence): width and height of the viewport in pixels
+            grid (Sequence): tiles across, tiles up and depth slices
+        """
+        self.lights = lights
+        self.win_size = tuple(win_size)
+        self.grid = tuple(grid)
+        self.cluster_count = int(np.prod(grid))
+
+        # texture buffers of the point lights, each cluster's (offset, count) in the light list, and the list
+        self.buffers = glGenBuffers(3)
+        self.textures = glGenTextures(3)
+        self.capacities = [0, 0, 0]
+        for unit, buffer, texture, internal_format in zip(
+            (POINT_LIGHTS_UNIT, CLUSTERS_UNIT, CLUSTER_LIGHTS_UNIT), self.buffers, self.textures, (GL_RGBA32F, GL_RG32UI, GL_R32UI)
+        ):
+            glBindBuffer(GL_TEXTURE_BUFFER, buffer)
+            glBufferData(GL_TEXTURE_BUFFER, 16, None, GL_STREAM_DRAW)
+            gl_state.bind_texture(unit, texture, GL_TEXTURE_BUFFER)
+            glTexBuffer(GL_TEXTURE_BUFFER, internal_format, buffer)
+
+        # view space bounds of every cluster, rebuilt when the projection changes
+        self.projection = None
+        self.cluster_lows = self.cluster_highs = None
+
+        # lights in view, (light, cluster) pairs and most lights in one cluster, as of the last update
+        self.visible = 0
+        self.pairs = 0
+        self.most = 0
+
+    def attach(self, *shaders: Shader):
+        """
+        Point the light buffer samplers of lit shaders at their texture units.
+        """
+        for shader in shaders:
+            shader.use()
+            shader.set_int("pointLights", POINT_LIGHTS_UNIT)
+            shader.set_int("clusters", CLUSTERS_UNIT)
+            shader.set_int("clusterLights", CLUSTER_LIGHTS_UNIT)
+
+    def update(self, camera: Camera, point_lights: PointLights):
+        """
+        Assign the point lights to clusters and upload everything, after camera.update.
+        """
+        near, far = camera.near, camera.far
+        projection = np.asarray(camera.projection_transform)
+        if self.projection is None or not np.array_equal(projection, self.projection):
+            self.projection = projection
+            self.cluster_lows, self.cluster_highs = cluster_bounds(projection, near, far, self.grid)
+
+        count = point_lights.count
+        view = np.asarray(camera.view_matrix)
+        # numpy copies of glm matrices are in math layout, [row, column]
+        centers = point_lights.positions @ view[:3, :3].T + view[:3, 3]
+        lights, clusters = assign_lights(
+            centers, point_lights.radii, projection, near, far, self.grid, self.cluster_lows, self.cluster_highs
+        )
+
+        # one contiguous run of light indices per cluster
+        order = np.argsort(clusters, kind='stable')
+        light_list = lights[order].astype(np.uint32)
+        counts = np.bincount(clusters, minlength=self.cluster_count)
+        ranges = np.stack((np.cumsum(counts) - counts, counts), axis=1).astype(np.uint32)
+
+        self.visible = len(np.unique(lights))
+        self.pairs = len(lights)
+        self.most = int(counts.max())
+
+        self._upload(0, point_lights.data[:count])
+        self._upload(1, ranges)
+        self._upload(2, light_list)
+
+        slices = self.grid[2]
+        depth_scale = slices / np.log(far / near)
+        self.lights.write(CLUSTERS_OFFSET, np.array((*self.grid, 0), dtype=np.float32))
+        self.lights.write(CLUSTERS_OFFSET + 16, np.array(
+            (self.grid[0] / self.win_size[0], self.grid[1] / self.win_size[1], depth_scale, -np.log(near) * depth_scale),
+            dtype=np.float32
+        ))
+        self.lights.write(CLUSTERS_OFFSET + 32, np.array((near, far, 0, 0), dtype=np.float32))
+
+    def resize(self, win_size: Sequence):
+        """
+        Follow a resized window, the cluster bounds are rebuilt with the new projection on the next update.
+        """
+        self.win_size = tuple(win_size)
+
+    def bind(self):
+        """
+        Bind the light buffers to their texture units, before drawing with a lit shader.
+        """
+        for unit, texture in zip((POINT_LIGHTS_UNIT, CLUSTERS_UNIT, CLUSTER_LIGHTS_UNIT), self.textures):
+            gl_state.bind_texture(unit, texture, GL_TEXTURE_BUFFER)
+
+    def destroy(self):
+        gl_state.forget_textures(self.textures)
+        glDeleteTextures(3, self.textures)
+        glDeleteBuffers(3, self.buffers)
+
+    def _upload(self, i, array):
+        self.capacities[i] = upload_texture_buffer(self.buffers[i], self.capacities[i], array)
+
+
+def upload_texture_buffer(buffer, capacity, array: np.ndarray):
+    """
+    Replace the contents of a texture buffer, growing its store when the array does not fit.
+
+    Args:
+        buffer (int): buffer object backing the texture
+        capacity (int): current size of its store in bytes
+        array (np.ndarray): data to upload
+
+    Returns:
+        int: size of the store in bytes after the upload
+    """
+    glBindBuffer(GL_TEXTURE_BUFFER, buffer)
+    if array.nbytes > capacity:
+        capacity = max(array.nbytes, 2 * capacity)
+    # orphan last frame's store, so the write never waits on draws still reading it
+    glBufferData(GL_TEXTURE_BUFFER, max(capacity, 16), None, GL_STREAM_DRAW)
+    if array.nbytes:
+        glBufferSubData(GL_TEXTURE_BUFFER, 0, array.nbytes, np.ascontiguousarray(array))
+    return capacity
+
+
+def slice_depths(near, far, slices):
+    """
+    Depths bounding the exponentially spaced slices, from near to far.
+    """
+    return near * (far / near) ** (np.arange(slices + 1) / slices)
+
+
+def cluster_bounds(projection: np.ndarray, near, far, grid: Sequence):
+    """
+    View space bounding boxes of every cluster.
+
+    Args:
+        projection (np.ndarray): (4, 4) column major perspective projection
+        near, far (float): clip plane distances
+        grid (Sequence): tiles across, tiles up and depth slices
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (n, 3) low and high corners, clusters ordered x fastest, then y, then depth
+    """
+    tiles_x, tiles_y, slices = grid
+    # x and y of the tile edges on the plane at distance 1
+    xs = np.linspace(-1, 1, tiles_x + 1) / projection[0, 0]
+    ys = np.linspace(-1, 1, tiles_y + 1) / projection[1, 1]
+    depths = slice_depths(near, far, slices)
+
+    z, y, x = np.meshgrid(np.arange(slices), np.arange(tiles_y), np.arange(tiles_x), indexing='ij')
+    x, y, z = x.ravel(), y.ravel(), z.ravel()
+    # every tile edge spreads out with depth, so the box spans both ends of the slice
+    near_depths, far_depths = depths[z], depths[z + 1]
+    x_edges = np.stack((xs[x] * near_depths, xs[x] * far_depths, xs[x + 1] * near_depths, xs[x + 1] * far_depths))
+    y_edges = np.stack((ys[y] * near_depths, ys[y] * far_depths, ys[y + 1] * near_depths, ys[y + 1] * far_depths))
+
+    # the camera looks down -z
+    lows = np.stack((x_edges.min(axis=0), y_edges.min(axis=0), -far_depths), axis=1)
+    highs = np.stack((x_edges.max(axis=0), y_edges.max(axis=0), -near_depths), axis=1)
+    return lows.astype(np.float32), highs.astype(np.float32)
+
+
+def assign_lights(centers: np.ndarray, radii: np.ndarray, projection: np.ndarray, near, far, grid: Sequence,
+                  cluster_lows: np.ndarray, cluster_highs: np.ndarray):
+    """
+    Every (light, cluster) pair where the light's sphere touches the cluster.
+
+    Each light's sphere is first bounded by a box of clusters, from its depth
+    range and its extent on screen, then every cluster of the box is tested
+    against the sphere.
+
+    Args:
+        centers (np.ndarray): (n, 3) view space centers
+        radii (np.ndarray): (n,) radii
+        projection (np.ndarray): (4, 4) column major perspective projection
+        near, far (float): clip plane distances
+        grid (Sequence): tiles across, tiles up and depth slices
+        cluster_lows, cluster_highs (np.ndarray): cluster boxes, as returned by cluster_bounds
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: light index and cluster index of every pair
+    """
+    tiles_x, tiles_y, slices = grid
+    depths = -centers[:, 2]
+    nearest = np.maximum(depths - radii, near)
+    furthest = np.minimum(depths + radii, far)
+    lights = np.flatnonzero(nearest <= furthest)
+    centers, radii, nearest, furthest = centers[lights], radii[lights], nearest[lights], furthest[lights]
+
+    depth_scale = slices / np.log(far / near)
+    z0 = np.clip((np.log(nearest / near) * depth_scale).astype(np.int64), 0, slices - 1)
+    z1 = np.clip((np.log(furthest / near) * depth_scale).astype(np.int64), 0, slices - 1)
+
+    # x / depth over the depth range of the sphere is extreme at one of its ends
+    def tile_range(coordinate, scale, tiles):
+        low = coordinate - radii
+        high = coordinate + radii
+        low = np.minimum(low / nearest, low / furthest) * scale
+        high = np.maximum(high / nearest, high / furthest) * scale
+        first = np.clip(np.floor((low + 1) / 2 * tiles), 0, tiles - 1).astype(np.int64)
+        last = np.clip(np.floor((high + 1) / 2 * tiles), 0, tiles - 1).astype(np.int64)
+        # spheres entirely off one side of the screen
+        off = (high < -1) | (low > 1)
+        return first, last, off
+
+    x0, x1, off_x = tile_range(centers[:, 0], projection[0, 0], tiles_x)
+    y0, y1, off_y = tile_range(centers[:, 1], projection[1, 1], tiles_y)
+    on_screen = ~(off_x | off_y)
+    lights = lights[on_screen]
+    centers, radii = centers[on_screen], radii[on_screen]
+    x0, x1, y0, y1, z0, z1 = x0[on_screen], x1[on_screen], y0[on_screen], y1[on_screen], z0[on_screen], z1[on_screen]
+
+    # expand every light's box of clusters into (light, cluster) pairs
+    width = x1 - x0 + 1
+    height = y1 - y0 + 1
+    counts = width * height * (z1 - z0 + 1)
+    pair_light = np.repeat(np.arange(len(lights)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    pair_width = width[pair_light]
+    pair_height = height[pair_light]
+    x = x0[pair_light] + local % pair_width
+    y = y0[pair_light] + local // pair_width % pair_height
+    z = z0[pair_light] + local // (pair_width * pair_height)
+    clusters = (z * tiles_y + y) * tiles_x + x
+
+    # keep the clusters the sphere actually reaches
+    closest = np.clip(centers[pair_light], cluster_lows[clusters], cluster_highs[clusters])
+    touching = ((closest - centers[pair_light]) ** 2).sum(axis=1) <= radii[pair_light] ** 2
+    return lights[pair_light[touching]], clusters[touching]
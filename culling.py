@@ -0,0 +1,83 @@
+import numpy as np
+
+
+class Bounds:
+
+    def __init__(self, positions: np.ndarray):
+        """
+        Axis aligned box and bounding sphere of a model in model space.
+
+        Args:
+            positions (np.ndarray): (n, 3) vertex positions
+        """
+        positions = np.asarray(positions, dtype=np.float32)
+        self.minimum = positions.min(axis=0)
+        self.maximum = positions.max(axis=0)
+        self.center = (self.minimum + self.maximum) / 2
+        self.radius = float(np.sqrt(((positions - self.center) ** 2).sum(axis=1).max()))
+
+
+def frustum_planes(proj_view: np.ndarray):
+    """
+    Planes of the view frustum, extracted from the projection @ view matrix.
+
+    Args:
+        proj_view (np.ndarray): (4, 4) matrix in math layout, m[row][column]
+
+    Returns:
+        np.ndarray: (6, 4) float32 planes a, b, c, d with unit normals pointing inside:
+            left, right, bottom, top, near, far
+    """
+    m = np.asarray(proj_view, dtype=np.float32)
+    planes = np.array((
+        m[3] + m[0], m[3] - m[0],
+        m[3] + m[1], m[3] - m[1],
+        m[3] + m[2], m[3] - m[2],
+    ))
+    return planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+
+def spheres_in_frustum(planes: np.ndarray, centers: np.ndarray, radii: np.ndarray):
+    """
+    Args:
+        planes (np.ndarray): (6, 4) frustum planes
+        centers (np.ndarray): (n, 3) world space sphere centers
+        radii (np.ndarray): (n,) world space sphere radii
+
+    Returns:
+        np.ndarray: (n,) bool, True for spheres at least partly inside the frustum
+    """
+    distances = centers @ planes[:, :3].T + planes[:, 3]
+    return (distances > -radii[:, None]).all(axis=1)
+
+
+class FrustumCuller:
+
+    def __init__(self, store):
+        """
+        Tests the bounding sphere of every entity in a store against the camera frustum in one pass.
+
+        Args:
+            store (EntityStore): store whose world space spheres are tested
+        """
+        self.store = store
+        self.visible = np.zeros(0, dtype=bool)
+        # counts of the last update
+        self.tested = 0
+        self.drawn = 0
+
+    def update(self, planes: np.ndarray):
+        store = self.store
+        store.update_transforms()
+
+        count = store.count
+        self.visible = spheres_in_frustum(planes, store.world_centers[:count], store.world_radii[:count])
+        self.tested = count
+        self.drawn = int(np.count_nonzero(self.visible))
+
+    def filter(self, entities):
+        """
+        The entities that passed the last update.
+        """
+        visible = self.visible
+        return [entity for entity in entities if visible[entity.row]]
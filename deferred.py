@@ -0,0 +1,238 @@
+from OpenGL.GL import *
+import numpy as np
+
+from clustered_lighting import POINT_LIGHTS_UNIT, PointLights, upload_texture_buffer
+from geometry_pool import POSITION, geometry_pool
+from gl_state import gl_state
+from post_processing import PostProcessing
+from shader import Shader
+
+from typing import Sequence
+
+# texture units of the G-buffer in the lighting passes, after the light buffers
+GBUFFER_UNITS = (5, 6, 7)
+# color attachments of the G-buffer, attachment 0 is the lit image
+GBUFFER_ATTACHMENTS = (GL_COLOR_ATTACHMENT1, GL_COLOR_ATTACHMENT2, GL_COLOR_ATTACHMENT3)
+
+
+class DeferredShading(PostProcessing):
+
+    def __init__(self, win_size: Sequence, shader: Shader, directional_shader: Shader, point_shader: Shader, graph=None):
+        """
+        Deferred shading on the post processing framebuffer, the lit shaders write a G-buffer which is shaded once per pixel.
+
+        The framebuffer gains three attachments next to its color texture:
+        world space position with a coverage flag, normal with shininess, and
+        albedo with specular intensity. Unlit shaders write their color as
+        albedo with a coverage of 2, which the lighting passes copy as is. After the geometry pass the ambient and
+        directional light are applied with one fullscreen quad, then every
+        point light draws a sphere around its radius, instanced, adding its
+        light to the pixels inside. The depth of the geometry pass stays in
+        the framebuffer, so unlit geometry can be drawn on top before end
+        copies the image to the screen, or runs the post processing graph.
+
+        Overdrawn fragments only write the G-buffer, which pays off over the
+        forward path once scenes have many lights and much overdraw.
+
+        Args:
+            win_size (Sequence): width and height of the viewport in pixels
+            shader (Shader): screen shader of the post processing quad
+            directional_shader (Shader): screen_vertex.vert with deferred_directional.frag
+            point_shader (Shader): deferred_point.vert with deferred_point.frag
+            graph (PostProcessingGraph): optional chain of passes run on the lit image by end
+        """
+        super().__init__(win_size, shader, graph)
+        self.directional_shader = directional_shader
+        self.point_shader = point_shader
+        # shaders switched between writing the G-buffer and shading, see attach
+        self.shaders = []
+
+        gl_state.bind_framebuffer(self.fbo)
+        self.gbuffer = glGenTextures(3)
+        self._allocate_gbuffer()
+        for attachment, texture in zip(GBUFFER_ATTACHMENTS, self.gbuffer):
+            gl_state.bind_texture(0, texture)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glFramebufferTexture2D(GL_FRAMEBUFFER, attachment, GL_TEXTURE_2D, texture, 0)
+        gl_state.bind_framebuffer(0)
+
+        for lighting_shader in (directional_shader, point_shader):
+            lighting_shader.use()
+            for name, unit in zip(("gPosition", "gNormal", "gAlbedoSpecular"), GBUFFER_UNITS):
+                lighting_shader.set_int(name, unit)
+        point_shader.set_int("pointLights", POINT_LIGHTS_UNIT)
+
+        vertices, indices = light_volume()
+        self.volume = geometry_pool.allocate(POSITION, vertices, indices)
+
+        # the point lights, in the texel layout of PointLights
+        self.light_buffer = glGenBuffers(1)
+        self.light_texture = glGenTextures(1)
+        self.light_capacity = 0
+        glBindBuffer(GL_TEXTURE_BUFFER, self.light_buffer)
+        glBufferData(GL_TEXTURE_BUFFER, 16, None, GL_STREAM_DRAW)
+        gl_state.bind_texture(POINT_LIGHTS_UNIT, self.light_texture, GL_TEXTURE_BUFFER)
+        glTexBuffer(GL_TEXTURE_BUFFER, GL_RGBA32F, self.light_buffer)
+        self.light_count = 0
+
+    def attach(self, *shaders: Shader):
+        """
+        Shaders drawn between begin and shade, they write the G-buffer there and draw forward elsewhere.
+
+        Every shader that can be drawn in the geometry pass has to be attached,
+        fragment.frag for lit and simple_3d_fragment.frag for unlit geometry.
+        """
+        self.shaders.extend(shaders)
+
+    def update(self, point_lights: PointLights):
+        """
+        Upload the point lights, in place of LightClusters.update while shading deferred.
+        """
+        self.light_count = point_lights.count
+        self.light_capacity = upload_texture_buffer(self.light_buffer, self.light_capacity, point_lights.data[:point_lights.count])
+
+    def begin(self):
+        """
+        Start the geometry pass, geometry drawn with the attached shaders until shade goes into the G-buffer.
+        """
+        gl_state.bind_framebuffer(self.fbo)
+        # fragment output 0 is the forward color, unused in this pass
+        glDrawBuffers(4, (GL_NONE, *GBUFFER_ATTACHMENTS))
+        for draw_buffer in range(1, 4):
+            glClearBufferfv(GL_COLOR, draw_buffer, (0.0, 0.0, 0.0, 0.0))
+        glClear(GL_DEPTH_BUFFER_BIT)
+        gl_state.enable(GL_DEPTH_TEST)
+
+        self._geometry_pass(True)
+
+    def shade(self):
+        """
+        Light the G-buffer into the color texture, unlit geometry can be drawn after it until end.
+        """
+        self._geometry_pass(False)
+
+        glDrawBuffers(1, (GL_COLOR_ATTACHMENT0,))
+        glClear(GL_COLOR_BUFFER_BIT)
+        for unit, texture in zip(GBUFFER_UNITS, self.gbuffer):
+            gl_state.bind_texture(unit, texture)
+
+        # ambient and directional light, once for every covered pixel
+        gl_state.disable(GL_DEPTH_TEST)
+        self.directional_shader.use()
+        gl_state.bind_vertex_array(self.quad.mesh.vao)
+        self.quad.mesh.draw()
+
+        if self.light_count:
+            # the back faces of each volume in front of the geometry cover the pixels inside the sphere,
+            # also with the camera inside it, depth clamping keeps spheres past the far plane whole
+            culling = gl_state.capabilities.get(GL_CULL_FACE)
+            gl_state.enable(GL_DEPTH_TEST)
+            gl_state.enable(GL_CULL_FACE)
+            gl_state.enable(GL_DEPTH_CLAMP)
+            gl_state.enable(GL_BLEND)
+            glDepthMask(GL_FALSE)
+            glDepthFunc(GL_GEQUAL)
+            glCullFace(GL_FRONT)
+            glBlendFunc(GL_ONE, GL_ONE)
+
+            gl_state.bind_texture(POINT_LIGHTS_UNIT, self.light_texture, GL_TEXTURE_BUFFER)
+            self.point_shader.use()
+            gl_state.bind_vertex_array(self.volume.vao)
+            self.volume.draw_instanced(self.light_count)
+
+            glDepthMask(GL_TRUE)
+            glDepthFunc(GL_LESS)
+            glCullFace(GL_BACK)
+            gl_state.disable(GL_BLEND)
+            gl_state.disable(GL_DEPTH_CLAMP)
+            if not culling:
+                gl_state.disable(GL_CULL_FACE)
+        gl_state.enable(GL_DEPTH_TEST)
+
+    def end(self):
+        """
+        Copy the lit image to the screen, through the post processing graph if there is one.
+        """
+        if self.graph is not None:
+            super().end()
+            return
+
+        width, height = self.win_size
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)
+        glBlitFramebuffer(0, 0, width, height, 0, 0, width, height, GL_COLOR_BUFFER_BIT, GL_NEAREST)
+        # rebinds the read framebuffer too
+        gl_state.bind_framebuffer(0)
+
+    def resize(self, win_size):
+        super().resize(win_size)
+        self._allocate_gbuffer()
+
+    def destroy(self):
+        self.volume.free()
+        gl_state.forget_textures((*self.gbuffer, self.light_texture))
+        glDeleteTextures(3, self.gbuffer)
+        glDeleteTextures(1, (self.light_texture,))
+        glDeleteBuffers(1, (self.light_buffer,))
+        super().destroy()
+
+    def _allocate_gbuffer(self):
+        # world position and coverage, normal and shininess, albedo and specular intensity
+        width, height = self.win_size
+        for texture, internal_format in zip(self.gbuffer, (GL_RGBA32F, GL_RGBA16F, GL_RGBA8)):
+            gl_state.bind_texture(0, texture)
+            glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0, GL_RGBA, GL_FLOAT, None)
+
+    def _geometry_pass(self, enabled):
+        for shader in self.shaders:
+            shader.use()
+            shader.set_int("geometryPass", int(enabled))
+
+
+def light_volume(subdivisions=1):
+    """
+    Icosphere whose faces enclose the unit sphere, so a scaled copy covers everything a light reaches.
+
+    Args:
+        subdivisions (int): times every triangle of the icosahedron is split in four
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (n, 3) float32 vertices and uint32 indices, counter clockwise seen from outside
+    """
+    t = (1 + np.sqrt(5)) / 2
+    vertices = [
+        (-1, t, 0), (1, t, 0), (-1, -t, 0), (1, -t, 0), (0, -1, t), (0, 1, t),
+        (0, -1, -t), (0, 1, -t), (t, 0, -1), (t, 0, 1), (-t, 0, -1), (-t, 0, 1),
+    ]
+    faces = [
+        (0, 11, 5), (0, 5, 1), (0, 1, 7), (0, 7, 10), (0, 10, 11), (1, 5, 9), (5, 11, 4), (11, 10, 2), (10, 7, 6), (7, 1, 8),
+        (3, 9, 4), (3, 4, 2), (3, 2, 6), (3, 6, 8), (3, 8, 9), (4, 9, 5), (2, 4, 11), (6, 2, 10), (8, 6, 7), (9, 8, 1),
+    ]
+    vertices = [np.array(vertex, dtype=np.float64) / np.linalg.norm(vertex) for vertex in vertices]
+
+    for _ in range(subdivisions):
+        # edge -> index of its midpoint
+        midpoints = {}
+
+        def midpoint(a, b):
+            edge = (min(a, b), max(a, b))
+            if edge not in midpoints:
+                middle = vertices[a] + vertices[b]
+                midpoints[edge] = len(vertices)
+                vertices.append(middle / np.linalg.norm(middle))
+            return midpoints[edge]
+
+        split = []
+        for a, b, c in faces:
+            ab, bc, ca = midpoint(a, b), midpoint(b, c), midpoint(c, a)
+            split += [(a, ab, ca), (b, bc, ab), (c, ca, bc), (ab, bc, ca)]
+        faces = split
+
+    vertices = np.array(vertices)
+    indices = np.array(faces)
+    # the faces cut inside the sphere, push them out until the closest one touches it
+    corners = vertices[indices]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    distances = (normals * corners[:, 0]).sum(axis=1) / np.linalg.norm(normals, axis=1)
+    vertices /= distances.min()
+    return vertices.astype(np.float32), indices.ravel().astype(np.uint32)
@@ -1,99 +1,138 @@
 from OpenGL.GL import *
 import glm
 
+from clustered_lighting import CLUSTERS_OFFSET, PointLights
+from entity_store import EntityStore, entity_store
 from models import Model, ColoredCube, TexturedModel
 from shader import Shader
+from uniform_buffer import UniformBuffer
 
 from typing import Sequence
 
 class Entity:
     
-    def __init__(self, model: Model | TexturedModel, position: Sequence, orientation: Sequence, scale: float):
+    def __init__(self, model: Model | TexturedModel, position: Sequence, orientation: Sequence, scale: float,
+                 store: EntityStore = entity_store):
         """
         Args:
             model (Model): the assiciated model
             position (Sequence): x, y, z position
             orientation (Sequence): pitch, yaw, roll
             scale (float): float
+            store (EntityStore): store holding the transform state
         """
         self.model = model
-        self.position = glm.vec3(*position)
-        self.orientation = glm.vec3(*orientation)
-        self.scale = scale
-        self.transform_matrix = self.calculate_transform_matrix()
-        
-    def calculate_transform_matrix(self):
-        pitch = glm.rotate(glm.radians(self.orientation.x), glm.vec3(1, 0, 0))
-        yaw = glm.rotate(glm.radians(self.orientation.y), glm.vec3(0, 1, 0))
-        roll = glm.rotate(glm.radians(self.orientation.z), glm.vec3(0, 0, 1))
-        rotation_transformation = yaw @ pitch @ roll
+        self.store = store
+        self.row = store.add(self, position, orientation, scale, model.bounds)
 
-        position_transformation = glm.translate(self.position)
-        
-        scale_transformation = glm.scale(glm.vec3(self.scale, self.scale, self.scale))
+    # position, orientation and scale live in the store, the returned arrays are
+    # read only so that every change goes through a setter, which marks the row
+    # dirty when the value actually differs
+    @property
+    def position(self):
+        return _read_only(self.store.positions[self.row])
+
+    @position.setter
+    def position(self, value: Sequence):
+        self.store.assign(self.store.positions, self.row, value)
+
+    @property
+    def orientation(self):
+        return _read_only(self.store.orientations[self.row])
+
+    @orientation.setter
+    def orientation(self, value: Sequence):
+        self.store.assign(self.store.orientations, self.row, value)
+
+    @property
+    def scale(self):
+        return float(self.store.scales[self.row])
 
-        transformation_matrix = position_transformation @ rotation_transformation @ scale_transformation
-        return transformation_matrix
+    @scale.setter
+    def scale(self, value: float):
+        self.store.assign(self.store.scales, self.row, value)
+
+    @property
+    def transform_matrix(self):
+        """
+        (4, 4) column major model matrix.
+        """
+        if self.store.dirty[self.row]:
+            self.store.update_transforms()
+        return self.store.transforms[self.row]
+
+    @property
+    def normal_matrix(self):
+        """
+        (3, 3) column major normal matrix.
+        """
+        if self.store.dirty[self.row]:
+            self.store.update_transforms()
+        return self.store.normal_matrices[self.row]
     
     def update(self):
         pass
         
-    def update_transform(self):
-        self.transform_matrix = self.calculate_transform_matrix()
-        
     def draw(self):
-        self.model.draw(self.transform_matrix)
+        self.model.draw(self.transform_matrix, self.normal_matrix)
         
     def destroy(self):
+        self.store.remove(self)
         self.model.destroy()
 
 
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+# std140 layout of the Lights uniform block in shaders/fragment.frag:
+# a 64 byte DirLight followed by the three vec4 cluster parameters of LightClusters,
+# point lights are kept in a texture buffer instead
+LIGHTS_BLOCK_SIZE = CLUSTERS_OFFSET + 48
+
+
 class DirLight():
-    def __init__(self, shader: Shader, direction: Sequence, ambient: Sequence, diffuse: Sequence, specular: Sequence):
-        self.shader = shader
+    OFFSET = 0
+
+    def __init__(self, lights: UniformBuffer, direction: Sequence, ambient: Sequence, diffuse: Sequence, specular: Sequence):
+        self.lights = lights
         self.direction = glm.vec3(*direction)
         self.ambient = glm.vec3(ambient)
         self.diffuse = glm.vec3(diffuse)
         self.specular = glm.vec3(specular)
         
     def update(self):
-        self.shader.use()
-        
-        self.shader.set_vec3("dirLight.direction", self.direction)
+        self.lights.write(DirLight.OFFSET + 0, self.direction)
         
-        self.shader.set_vec3("dirLight.ambient", self.ambient)
-        self.shader.set_vec3("dirLight.diffuse", self.diffuse)
-        self.shader.set_vec3("dirLight.specular", self.specular)
+        self.lights.write(DirLight.OFFSET + 16, self.ambient)
+        self.lights.write(DirLight.OFFSET + 32, self.diffuse)
+        self.lights.write(DirLight.OFFSET + 48, self.specular)
         
 
 class PointLight(Entity):
     CONSTANT = 1.0
     LINEAR = 0.00
     QUADRATIC = 0.00
+    RADIUS = 10.0
     
-    def __init__(self, shaders: Sequence[Shader], color: Sequence, position: Sequence, index: int):
+    def __init__(self, shader: Shader, point_lights: PointLights, color: Sequence, position: Sequence, radius=RADIUS):
         """
         Args:
-            shaders (Sequence[Shader]): cube shader and point light shader
+            shader (Shader): cube shader
+            point_lights (PointLights): set of lights the light is added to, drawn through LightClusters
             color (Sequence): r, g, b color (0.0 - 1.0)
             position (Sequence): x, y, z position
-            index (int): index of point light
+            radius (float): distance the light reaches
         """
-        super().__init__(ColoredCube(*color, shaders[0]), position, [0, 0, 0], 0.2)
+        super().__init__(ColoredCube(*color, shader), position, [0, 0, 0], 0.2)
         
         self.color = glm.vec3(*color)
-        self.shader = shaders[1]
-        self.index = index
+        self.point_lights = point_lights
+        self.index = point_lights.add(
+            position, self.color * 0.0, self.color, self.color, radius,
+            PointLight.CONSTANT, PointLight.LINEAR, PointLight.QUADRATIC
+        )
         
     def update(self):
-        self.shader.use()
-
-        self.shader.set_vec3(f"pointLights[{self.index}].position", self.position)
-        
-        self.shader.set_float(f"pointLights[{self.index}].constant", PointLight.CONSTANT)
-        self.shader.set_float(f"pointLights[{self.index}].linear", PointLight.LINEAR)
-        self.shader.set_float(f"pointLights[{self.index}].quadratic", PointLight.QUADRATIC)
-        
-        self.shader.set_vec3(f"pointLights[{self.index}].ambient", self.color * 0.0)
-        self.shader.set_vec3(f"pointLights[{self.index}].diffuse", self.color)
-        self.shader.set_vec3(f"pointLights[{self.index}].specular", self.color)
+        self.point_lights.set_position(self.index, self.position)
@@ -0,0 +1,206 @@
+import numpy as np
+
+
+class EntityStore:
+
+    def __init__(self, capacity=64):
+        """
+        Struct of arrays holding the transform state of every entity.
+
+        Entities are thin handles that own one row. Model matrices are kept
+        column major in a contiguous (n, 4, 4) float32 array, so any subset can
+        be handed to GL as uniforms or as an instance buffer without conversion.
+        Matrices are only recomputed for rows whose state actually changed, so
+        entities that stay put cost nothing per frame.
+
+        Args:
+            capacity (int): initial number of rows, the arrays grow as needed
+        """
+        self.count = 0
+        self.entities = []
+        # set when any row turns dirty, lets update_transforms skip scanning the dirty flags
+        self.changed = False
+
+        self.positions = np.zeros((capacity, 3), dtype=np.float32)
+        # pitch, yaw, roll in degrees
+        self.orientations = np.zeros((capacity, 3), dtype=np.float32)
+        self.scales = np.ones(capacity, dtype=np.float32)
+        self.dirty = np.zeros(capacity, dtype=bool)
+        self.transforms = np.zeros((capacity, 4, 4), dtype=np.float32)
+        # inverse transpose of the upper 3x3 of each model matrix, column major as well
+        self.normal_matrices = np.zeros((capacity, 3, 3), dtype=np.float32)
+        # bounding spheres of the models, in model space and moved into world space with the transforms
+        self.local_centers = np.zeros((capacity, 3), dtype=np.float32)
+        self.local_radii = np.zeros(capacity, dtype=np.float32)
+        self.world_centers = np.zeros((capacity, 3), dtype=np.float32)
+        self.world_radii = np.zeros(capacity, dtype=np.float32)
+        # level of detail each row is drawn at, 0 is the full mesh, picked by LODSelector
+        self.lods = np.zeros(capacity, dtype=np.uint8)
+
+    def add(self, entity, position, orientation, scale, bounds=None):
+        """
+        Give entity a row, returns the row index the entity keeps in entity.row.
+
+        bounds (culling.Bounds) is the model space bounding volume used for culling.
+        """
+        if self.count == len(self.positions):
+            self._grow(max(2 * self.count, 16))
+
+        row = self.count
+        self.count += 1
+        self.entities.append(entity)
+
+        self.positions[row] = position
+        self.orientations[row] = orientation
+        self.scales[row] = scale
+        if bounds is not None:
+            self.local_centers[row] = bounds.center
+            self.local_radii[row] = bounds.radius
+        self.lods[row] = 0
+        self.dirty[row] = True
+        self.changed = True
+        return row
+
+    def update_bounds(self, models):
+        """
+        Copy the model space bounds of models into the rows of their entities again,
+        for models whose mesh was replaced, e.g. by AssetLoader.update.
+        """
+        models = set(models)
+        for row, entity in enumerate(self.entities):
+            if entity.model in models:
+                self.local_centers[row] = entity.model.bounds.center
+                self.local_radii[row] = entity.model.bounds.radius
+                self.dirty[row] = True
+                self.changed = True
+
+    def assign(self, array, row, value):
+        """
+        Write value into one row of positions, orientations or scales.
+
+        The row is only marked dirty if the stored value actually changes.
+        """
+        value = np.asarray(value, dtype=array.dtype)
+        if np.array_equal(array[row], value):
+            return
+        array[row] = value
+        self.dirty[row] = True
+        self.changed = True
+
+    def remove(self, entity):
+        """
+        Free the row of entity by moving the last row into it.
+        """
+        row = entity.row
+        last = self.count - 1
+        if row != last:
+            moved = self.entities[last]
+            for array in self._arrays():
+                array[row] = array[last]
+            self.entities[row] = moved
+            moved.row = row
+
+        self.entities.pop()
+        self.count -= 1
+        entity.row = None
+
+    def mask(self, entities):
+        """
+        Per row bool mask with the rows of entities set, as taken by InstancedRenderer.update.
+        """
+        mask = np.zeros(self.count, dtype=bool)
+        mask[[entity.row for entity in entities]] = True
+        return mask
+
+    def update_transforms(self):
+        """
+        Recompute the model and normal matrices of every dirty row in one vectorized pass.
+        """
+        if not self.changed:
+            return
+        self.changed = False
+
+        rows = np.flatnonzero(self.dirty[:self.count])
+        if len(rows) == 0:
+            return
+
+        if len(rows) == self.count:
+            # everything changed, write straight into the store without gathering rows
+            rows = slice(0, self.count)
+            model_matrices(self.positions[rows], self.orientations[rows], self.scales[rows], self.transforms[rows])
+        else:
+            self.transforms[rows] = model_matrices(self.positions[rows], self.orientations[rows], self.scales[rows])
+
+        # the upper 3x3 is rotation * uniform scale, so its inverse transpose is rotation / scale
+        scales = self.scales[rows]
+        self.normal_matrices[rows] = self.transforms[rows, :3, :3] / (scales * scales)[:, None, None]
+
+        transforms = self.transforms[rows]
+        self.world_centers[rows] = (
+            np.einsum('ncr,nc->nr', transforms[:, :3, :3], self.local_centers[rows]) + transforms[:, 3, :3]
+        )
+        self.world_radii[rows] = self.local_radii[rows] * scales
+        self.dirty[rows] = False
+
+    def _arrays(self):
+        return (
+            self.positions, self.orientations, self.scales, self.dirty, self.transforms, self.normal_matrices,
+            self.local_centers, self.local_radii, self.world_centers, self.world_radii, self.lods
+        )
+
+    def _grow(self, capacity):
+        def resized(array, fill):
+            grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            grown[:self.count] = array[:self.count]
+            return grown
+
+        self.positions = resized(self.positions, 0)
+        self.orientations = resized(self.orientations, 0)
+        self.scales = resized(self.scales, 1)
+        self.dirty = resized(self.dirty, False)
+        self.transforms = resized(self.transforms, 0)
+        self.normal_matrices = resized(self.normal_matrices, 0)
+        self.local_centers = resized(self.local_centers, 0)
+        self.local_radii = resized(self.local_radii, 0)
+        self.world_centers = resized(self.world_centers, 0)
+        self.world_radii = resized(self.world_radii, 0)
+        self.lods = resized(self.lods, 0)
+
+
+def model_matrices(positions, orientations, scales, out=None):
+    """
+    Batched translate @ yaw @ pitch @ roll @ scale, the same matrix Entity used to build with glm.
+
+    Args:
+        positions (np.ndarray): (n, 3) x, y, z
+        orientations (np.ndarray): (n, 3) pitch, yaw, roll in degrees
+        scales (np.ndarray): (n,) uniform scale
+        out (np.ndarray): optional (n, 4, 4) float32 array to write the result into
+
+    Returns:
+        np.ndarray: (n, 4, 4) float32 matrices, column major: [i, column, row]
+    """
+    # one contiguous row per angle keeps the element wise math below cache friendly
+    radians = np.radians(np.ascontiguousarray(orientations.T, dtype=np.float32))
+    sa, sb, sc = np.sin(radians)
+    ca, cb, cc = np.cos(radians)
+
+    # yaw @ pitch @ roll written out, r[row][column] of the 3x3 rotation
+    r = (
+        (cb * cc + sb * sa * sc, sb * sa * cc - cb * sc, sb * ca),
+        (ca * sc, ca * cc, -sa),
+        (cb * sa * sc - sb * cc, sb * sc + cb * sa * cc, cb * ca),
+    )
+
+    transforms = np.zeros((len(positions), 4, 4), dtype=np.float32) if out is None else out
+    for row in range(3):
+        for column in range(3):
+            transforms[:, column, row] = r[row][column] * scales
+    transforms[:, :3, 3] = 0
+    transforms[:, 3, :3] = positions
+    transforms[:, 3, 3] = 1
+    return transforms
+
+
+# entities live in a single store unless they are given their own
+entity_store = EntityStore()
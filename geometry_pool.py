@@ -0,0 +1,279 @@
+from OpenGL.GL import *
+import numpy as np
+
+from gl_state import gl_state
+from profiler import profiler
+
+
+class VertexFormat:
+
+    def __init__(self, name, *attributes):
+        """
+        Interleaved float32 vertex layout.
+
+        Args:
+            name (str): registry name
+            attributes (tuple[int, int]): (location, component count) of each attribute, in memory order
+        """
+        self.name = name
+        self.attributes = []
+        offset = 0
+        for location, size in attributes:
+            self.attributes.append((location, size, offset))
+            offset += 4 * size
+        self.stride = offset
+        # floats per vertex
+        self.width = offset // 4
+
+    def attach(self, vbo):
+        """
+        Point the attributes of the bound vertex array at vbo.
+        """
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        for location, size, offset in self.attributes:
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, self.stride, ctypes.c_void_p(offset))
+
+
+# name -> format
+VERTEX_FORMATS: dict[str, VertexFormat] = {}
+
+
+def vertex_format(name, *attributes):
+    """
+    Register a vertex format, registering the same name again returns the existing format.
+    """
+    if name not in VERTEX_FORMATS:
+        VERTEX_FORMATS[name] = VertexFormat(name, *attributes)
+    return VERTEX_FORMATS[name]
+
+
+# x, y, z, s, t, nx, ny, nz
+POSITION_TEXTURE_NORMAL = vertex_format("position_texture_normal", (0, 3), (1, 2), (2, 3))
+# x, y, z, r, g, b
+POSITION_COLOR = vertex_format("position_color", (0, 3), (1, 3))
+# x, y, z, r, g, b, s, t
+POSITION_COLOR_TEXTURE = vertex_format("position_color_texture", (0, 3), (1, 3), (2, 2))
+# x, y, z
+POSITION = vertex_format("position", (0, 3))
+# x, y, s, t
+SCREEN = vertex_format("screen", (0, 2), (1, 2))
+
+
+class RangeAllocator:
+
+    def __init__(self, capacity):
+        """
+        First fit allocator over [0, capacity), freed ranges are merged with their neighbours.
+        """
+        self.capacity = capacity
+        # (offset, size) of free ranges, sorted by offset
+        self.free_ranges = [(0, capacity)] if capacity else []
+
+    def allocate(self, size):
+        """
+        Returns:
+            int | None: offset of the range, None if no free range is large enough
+        """
+        if size == 0:
+            return 0
+        for i, (offset, free) in enumerate(self.free_ranges):
+            if free >= size:
+                if free == size:
+                    del self.free_ranges[i]
+                else:
+                    self.free_ranges[i] = (offset + size, free - size)
+                return offset
+        return None
+
+    def free(self, offset, size):
+        if size == 0:
+            return
+        ranges = self.free_ranges
+        i = 0
+        while i < len(ranges) and ranges[i][0] < offset:
+            i += 1
+        ranges.insert(i, (offset, size))
+        # merge with the next range, then with the previous one
+        if i + 1 < len(ranges) and offset + size == ranges[i + 1][0]:
+            ranges[i] = (offset, size + ranges.pop(i + 1)[1])
+        if i > 0 and ranges[i - 1][0] + ranges[i - 1][1] == offset:
+            ranges[i - 1] = (ranges[i - 1][0], ranges[i - 1][1] + ranges.pop(i)[1])
+
+    def grow(self, capacity):
+        self.free(self.capacity, capacity - self.capacity)
+        self.capacity = capacity
+
+
+class GeometryArena:
+
+    def __init__(self, format: VertexFormat, vertex_capacity=1 << 16, index_capacity=3 << 16):
+        """
+        One vertex array with one vertex and one element buffer, shared by every mesh of a format.
+
+        Meshes get a range of each buffer and are drawn with a base vertex, so
+        switching between them needs no vertex array bind. When a buffer is
+        full it is replaced by one twice the size and the contents copied over
+        on the GPU, the offsets of existing meshes stay valid.
+
+        Indices are always uint32.
+        """
+        self.format = format
+        self.vertices = RangeAllocator(vertex_capacity)
+        self.indices = RangeAllocator(index_capacity)
+        # buffers replaced because they were full
+        self.grows = 0
+
+        self.vao = glGenVertexArrays(1)
+        self.vbo = self._create_buffer(vertex_capacity * format.stride)
+        self.ebo = self._create_buffer(index_capacity * 4)
+
+        gl_state.bind_vertex_array(self.vao)
+        format.attach(self.vbo)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+
+    def allocate(self, vertices: np.ndarray, indices: np.ndarray | None = None):
+        """
+        Copy a mesh into the arena.
+
+        Args:
+            vertices (np.ndarray): (n, format.width) float32 vertices
+            indices (np.ndarray): optional triangle indices into vertices
+
+        Returns:
+            Mesh: the ranges of the mesh, to be freed with Mesh.free
+        """
+        vertices = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, self.format.width)
+        base_vertex = self._allocate(self.vertices, len(vertices), self._grow_vertices)
+        _upload(self.vbo, base_vertex * self.format.stride, vertices)
+
+        first_index = 0
+        index_count = 0
+        if indices is not None:
+            indices = np.ascontiguousarray(indices, dtype=np.uint32)
+            index_count = len(indices)
+            first_index = self._allocate(self.indices, index_count, self._grow_indices)
+            _upload(self.ebo, first_index * 4, indices)
+
+        return Mesh(self, base_vertex, len(vertices), first_index, index_count, indices is not None)
+
+    def free(self, mesh):
+        self.vertices.free(mesh.base_vertex, mesh.vertex_count)
+        if mesh.indexed:
+            self.indices.free(mesh.first_index, mesh.index_count)
+
+    def destroy(self):
+        gl_state.forget_vertex_array(self.vao)
+        glDeleteVertexArrays(1, (self.vao,))
+        glDeleteBuffers(2, (self.vbo, self.ebo))
+
+    def _allocate(self, allocator, size, grow):
+        offset = allocator.allocate(size)
+        if offset is None:
+            grow(max(2 * allocator.capacity, allocator.capacity + size))
+            offset = allocator.allocate(size)
+        return offset
+
+    def _grow_vertices(self, capacity):
+        self.vbo = self._replace(self.vbo, self.vertices, capacity, self.format.stride)
+        gl_state.bind_vertex_array(self.vao)
+        self.format.attach(self.vbo)
+
+    def _grow_indices(self, capacity):
+        self.ebo = self._replace(self.ebo, self.indices, capacity, 4)
+        gl_state.bind_vertex_array(self.vao)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+
+    def _replace(self, buffer, allocator, capacity, item_size):
+        grown = self._create_buffer(capacity * item_size)
+        glBindBuffer(GL_COPY_READ_BUFFER, buffer)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, grown)
+        glCopyBufferSubData(GL_COPY_READ_BUFFER, GL_COPY_WRITE_BUFFER, 0, 0, allocator.capacity * item_size)
+        glDeleteBuffers(1, (buffer,))
+        allocator.grow(capacity)
+        self.grows += 1
+        return grown
+
+    def _create_buffer(self, nbytes):
+        # the copy targets leave the element buffer binding of whatever vertex array is bound alone
+        buffer = glGenBuffers(1)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, buffer)
+        glBufferData(GL_COPY_WRITE_BUFFER, nbytes, None, GL_STATIC_DRAW)
+        return buffer
+
+
+class Mesh:
+
+    def __init__(self, arena: GeometryArena, base_vertex, vertex_count, first_index, index_count, indexed):
+        """
+        Ranges of one mesh in a GeometryArena, drawn with the arena's vertex array bound.
+        """
+        self.arena = arena
+        self.base_vertex = base_vertex
+        self.vertex_count = vertex_count
+        self.first_index = first_index
+        self.index_count = index_count
+        self.indexed = indexed
+
+    @property
+    def vao(self):
+        return self.arena.vao
+
+    def draw(self):
+        if self.indexed:
+            if self.index_count:
+                glDrawElementsBaseVertex(GL_TRIANGLES, self.index_count, GL_UNSIGNED_INT,
+                                         ctypes.c_void_p(4 * self.first_index), self.base_vertex)
+                profiler.draw(self.index_count // 3)
+        elif self.vertex_count:
+            glDrawArrays(GL_TRIANGLES, self.base_vertex, self.vertex_count)
+            profiler.draw(self.vertex_count // 3)
+
+    def draw_instanced(self, instance_count):
+        if self.indexed:
+            if self.index_count:
+                glDrawElementsInstancedBaseVertex(GL_TRIANGLES, self.index_count, GL_UNSIGNED_INT,
+                                                  ctypes.c_void_p(4 * self.first_index), instance_count, self.base_vertex)
+                profiler.draw(self.index_count // 3 * instance_count)
+        elif self.vertex_count:
+            glDrawArraysInstanced(GL_TRIANGLES, self.base_vertex, self.vertex_count, instance_count)
+            profiler.draw(self.vertex_count // 3 * instance_count)
+
+    def free(self):
+        self.arena.free(self)
+        self.vertex_count = 0
+        self.index_count = 0
+
+
+class GeometryPool:
+
+    def __init__(self):
+        """
+        One GeometryArena per vertex format, created on first use.
+        """
+        # format name -> arena
+        self.arenas: dict[str, GeometryArena] = {}
+
+    def arena(self, format: VertexFormat):
+        arena = self.arenas.get(format.name)
+        if arena is None:
+            arena = self.arenas[format.name] = GeometryArena(format)
+        return arena
+
+    def allocate(self, format: VertexFormat, vertices, indices=None):
+        return self.arena(format).allocate(vertices, indices)
+
+    def destroy(self):
+        for arena in self.arenas.values():
+            arena.destroy()
+        self.arenas = {}
+
+
+def _upload(buffer, offset, array):
+    if array.nbytes:
+        glBindBuffer(GL_COPY_WRITE_BUFFER, buffer)
+        glBufferSubData(GL_COPY_WRITE_BUFFER, offset, array.nbytes, array)
+
+
+# meshes of every model share the arenas, like the GL context
+geometry_pool = GeometryPool()
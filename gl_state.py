@@ -0,0 +1,128 @@
+from OpenGL.GL import *
+
+
+class GLState:
+    """
+    Shadow copy of the OpenGL bindings that are changed most often.
+
+    Every bind goes through here, calls that would not change the current
+    binding are skipped and counted. Anything that deletes a GL object must
+    call the matching forget_* method, since the driver may hand the same
+    name out again.
+    """
+
+    def __init__(self):
+        self.invalidate()
+
+        self.issued = 0
+        self.elided = 0
+        # counts of the last finished frame
+        self.frame_issued = 0
+        self.frame_elided = 0
+
+    def invalidate(self):
+        """
+        Drop the shadow copy, for when GL state was changed behind the tracker's back.
+        """
+        self.program = None
+        self.vertex_array = None
+        self.framebuffer = None
+        self.active_texture = None
+        # texture unit -> (target, texture)
+        self.textures = {}
+        # capability -> enabled
+        self.capabilities = {}
+
+    def use_program(self, program):
+        if self.program == program:
+            self.elided += 1
+            return
+        glUseProgram(program)
+        self.program = program
+        self.issued += 1
+
+    def bind_vertex_array(self, vao):
+        if self.vertex_array == vao:
+            self.elided += 1
+            return
+        glBindVertexArray(vao)
+        self.vertex_array = vao
+        self.issued += 1
+
+    def bind_framebuffer(self, fbo):
+        if self.framebuffer == fbo:
+            self.elided += 1
+            return
+        glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+        self.framebuffer = fbo
+        self.issued += 1
+
+    def bind_texture(self, unit, texture, target=GL_TEXTURE_2D):
+        if self.textures.get(unit) == (target, texture):
+            self.elided += 1
+            return
+        if self.active_texture != unit:
+            glActiveTexture(GL_TEXTURE0 + unit)
+            self.active_texture = unit
+            self.issued += 1
+        glBindTexture(target, texture)
+        self.textures[unit] = (target, texture)
+        self.issued += 1
+
+    def enable(self, capability):
+        if self.capabilities.get(capability) is True:
+            self.elided += 1
+            return
+        glEnable(capability)
+        self.capabilities[capability] = True
+        self.issued += 1
+
+    def disable(self, capability):
+        if self.capabilities.get(capability) is False:
+            self.elided += 1
+            return
+        glDisable(capability)
+        self.capabilities[capability] = False
+        self.issued += 1
+
+    def forget_program(self, program):
+        if self.program == program:
+            self.program = None
+
+    def forget_vertex_array(self, vao):
+        if self.vertex_array == vao:
+            self.vertex_array = None
+
+    def forget_framebuffer(self, fbo):
+        if self.framebuffer == fbo:
+            self.framebuffer = None
+
+    def forget_textures(self, textures):
+        self.textures = {
+            unit: binding for unit, binding in self.textures.items() if binding[1] not in textures
+        }
+
+    def end_frame(self):
+        """
+        Publish this frame's counts in frame_issued / frame_elided and start counting the next frame.
+        """
+        self.frame_issued = self.issued
+        self.frame_elided = self.elided
+        self.issued = 0
+        self.elided = 0
+
+
+def has_extension(name):
+    """
+    Whether the current context supports an extension, the list is read once.
+    """
+    global _extensions
+    if _extensions is None:
+        _extensions = {glGetStringi(GL_EXTENSIONS, i).decode() for i in range(glGetIntegerv(GL_NUM_EXTENSIONS))}
+    return name in _extensions
+
+
+_extensions = None
+
+# there is a single GL context, so the whole program shares one tracker
+gl_state = GLState()
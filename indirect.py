@@ -0,0 +1,214 @@
+from OpenGL.GL import *
+import numpy as np
+
+from geometry_pool import GeometryArena
+from gl_state import gl_state, has_extension
+from instancing import attach_instance_matrices, detach_instance_matrices, write_instance_matrices
+from material import Material
+from models import Model
+from profiler import profiler
+from shader import Shader
+from stream_buffer import StreamBuffer
+
+from typing import Sequence
+
+# count, instanceCount, firstIndex, baseVertex, baseInstance
+ELEMENTS_COMMAND = 5
+# count, instanceCount, first, baseInstance
+ARRAYS_COMMAND = 4
+
+
+class IndirectBatch:
+
+    def __init__(self, shader: Shader, material: Material | None, arena: GeometryArena, indexed: bool, stream: StreamBuffer,
+                 multi_draw: bool):
+        """
+        Every model sharing an instanced shader, a material and a geometry arena, drawn with one multi draw.
+
+        Each level of detail of each model is one draw command whose
+        instances are the visible entities drawn at that level, as picked into
+        the store's lods column by LODSelector. The instance matrices of all
+        commands are written back to back, every command starts at its own
+        baseInstance, so the instanced shaders need no changes.
+
+        Args:
+            shader (Shader): instanced variant of the models' shader
+            material (Material): material of the models, None for untextured ones
+            arena (GeometryArena): arena holding every mesh of the batch
+            indexed (bool): whether the meshes are drawn with elements or arrays
+            stream (StreamBuffer): buffer the commands and instance matrices are written into every frame
+            multi_draw (bool): submit with glMultiDraw*Indirect, otherwise one instanced draw per command
+        """
+        self.shader = shader
+        self.material = material
+        self.arena = arena
+        self.indexed = indexed
+        self.stream = stream
+        self.multi_draw = multi_draw
+
+        self.models: list[Model] = []
+        # model -> index in models
+        self.model_index: dict[Model, int] = {}
+        # store rows of the entities and the index of their models
+        self.rows = np.zeros(0, dtype=np.intp)
+        self.model_of = np.zeros(0, dtype=np.intp)
+
+        # written by update
+        self.command_data = np.zeros((0, ELEMENTS_COMMAND if indexed else ARRAYS_COMMAND), dtype=np.uint32)
+        self.command_offset = 0
+        self.offsets = (0, 0)
+        self.instance_count = 0
+
+    def add(self, entities: Sequence):
+        rows = []
+        model_of = []
+        for entity in entities:
+            if entity.model not in self.model_index:
+                self.model_index[entity.model] = len(self.models)
+                self.models.append(entity.model)
+            rows.append(entity.row)
+            model_of.append(self.model_index[entity.model])
+
+        self.rows = np.concatenate((self.rows, rows)).astype(np.intp)
+        self.model_of = np.concatenate((self.model_of, model_of)).astype(np.intp)
+
+    def update(self, store, visible: np.ndarray | None = None):
+        """
+        Build the draw commands and gather the instance matrices of the visible entities.
+        """
+        # levels are read every frame, a model uploaded by the AssetLoader may gain some
+        lod_counts = np.array([model.lod_count for model in self.models], dtype=np.intp)
+        # each model's level 0 command is followed by the commands of its coarser levels
+        first_commands = np.cumsum(lod_counts) - lod_counts
+
+        rows = self.rows
+        levels = np.minimum(store.lods[rows], lod_counts[self.model_of] - 1)
+        command_of = first_commands[self.model_of] + levels
+        if visible is not None:
+            shown = visible[rows]
+            rows = rows[shown]
+            command_of = command_of[shown]
+        self.instance_count = len(rows)
+        if not self.instance_count:
+            return
+
+        # sorted by command, each command's instances are one contiguous run
+        order = np.argsort(command_of, kind='stable')
+        rows = rows[order]
+        meshes = [model.lod(level) for model in self.models for level in range(model.lod_count)]
+        instance_counts = np.bincount(command_of, minlength=len(meshes))
+        base_instances = np.cumsum(instance_counts) - instance_counts
+
+        # so are the meshes, which move to a new range on upload
+        commands = self.command_data
+        if len(commands) != len(meshes):
+            commands = self.command_data = np.zeros((len(meshes), commands.shape[1]), dtype=np.uint32)
+        if self.indexed:
+            commands[:, 0] = [mesh.index_count for mesh in meshes]
+            commands[:, 2] = [mesh.first_index for mesh in meshes]
+            commands[:, 3] = [mesh.base_vertex for mesh in meshes]
+        else:
+            commands[:, 0] = [mesh.vertex_count for mesh in meshes]
+            commands[:, 2] = [mesh.base_vertex for mesh in meshes]
+        commands[:, 1] = instance_counts
+        commands[:, -1] = base_instances
+
+        self.offsets = write_instance_matrices(self.stream, store.transforms, store.normal_matrices, rows)
+        if self.multi_draw:
+            self.command_offset = self.stream.write(commands, alignment=4)
+
+    def draw(self):
+        if not self.instance_count:
+            return
+
+        self.shader.use()
+        if self.material is not None:
+            self.material.use()
+        gl_state.bind_vertex_array(self.arena.vao)
+
+        if self.multi_draw:
+            attach_instance_matrices(self.stream.buffer, *self.offsets)
+            glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self.stream.buffer)
+            if self.indexed:
+                glMultiDrawElementsIndirect(GL_TRIANGLES, GL_UNSIGNED_INT, ctypes.c_void_p(self.command_offset),
+                                            len(self.command_data), 0)
+            else:
+                glMultiDrawArraysIndirect(GL_TRIANGLES, ctypes.c_void_p(self.command_offset), len(self.command_data), 0)
+            profiler.draw(int((self.command_data[:, 0].astype(np.int64) * self.command_data[:, 1]).sum()) // 3)
+        else:
+            # without base instances the attributes are moved to each command's first instance instead
+            for command in self.command_data[self.command_data[:, 1] > 0].tolist():
+                base_instance = command[-1]
+                attach_instance_matrices(self.stream.buffer, self.offsets[0] + 64 * base_instance,
+                                         self.offsets[1] + 36 * base_instance)
+                if self.indexed:
+                    count, instance_count, first_index, base_vertex, _ = command
+                    glDrawElementsInstancedBaseVertex(GL_TRIANGLES, count, GL_UNSIGNED_INT, ctypes.c_void_p(4 * first_index),
+                                                      instance_count, base_vertex)
+                else:
+                    count, instance_count, first, _ = command
+                    glDrawArraysInstanced(GL_TRIANGLES, first, count, instance_count)
+                profiler.draw(count // 3 * instance_count)
+        detach_instance_matrices()
+
+
+class IndirectRenderer:
+
+    def __init__(self, instanced_shaders: dict[Shader, Shader], stream: StreamBuffer, multi_draw=None):
+        """
+        Draws entities with multi draw indirect, one call per shader, material and vertex format.
+
+        The commands are built from the visible mask with NumPy, so the cost
+        on the CPU does not grow with the number of entities. Takes the same
+        entities and masks as InstancedRenderer, which it can replace.
+        Entities drawn by one renderer must share an EntityStore.
+
+        Multi draw indirect with base instances needs GL 4.3, on the GL 4.1
+        target every model is drawn with its own instanced call instead.
+
+        Args:
+            instanced_shaders (dict[Shader, Shader]): instanced variant of each model shader
+            stream (StreamBuffer): buffer holding the commands and instance matrices, flushed by update
+                and to be fenced with StreamBuffer.end_frame after draw
+            multi_draw (bool): use glMultiDraw*Indirect, by default whenever supported
+        """
+        if multi_draw is None:
+            multi_draw = has_extension("GL_ARB_multi_draw_indirect") and has_extension("GL_ARB_base_instance")
+        self.instanced_shaders = instanced_shaders
+        self.stream = stream
+        self.multi_draw = multi_draw
+        self.store = None
+        # (shader, material, arena, indexed) -> batch
+        self.batches: dict[tuple, IndirectBatch] = {}
+
+    def add(self, entities: Sequence):
+        groups = {}
+        for entity in entities:
+            self.store = entity.store
+            model = entity.model
+            key = (self.instanced_shaders[model.shader], model.material, model.mesh.arena, model.mesh.indexed)
+            groups.setdefault(key, []).append(entity)
+
+        for key, group in groups.items():
+            if key not in self.batches:
+                self.batches[key] = IndirectBatch(*key, self.stream, self.multi_draw)
+            self.batches[key].add(group)
+
+    def update(self, visible: np.ndarray | None = None):
+        """
+        Build this frame's draw commands.
+
+        Args:
+            visible (np.ndarray): optional per row mask of the store, as left by FrustumCuller.update,
+                entities outside of it are left out
+        """
+        if self.store is None:
+            return
+        self.store.update_transforms()
+        for batch in self.batches.values():
+            batch.update(self.store, visible)
+        self.stream.flush()
+
+    def draw(self):
+        for batch in self.batches.values():
+            batch.draw()
@@ -0,0 +1,154 @@
+from OpenGL.GL import *
+import numpy as np
+
+from gl_state import gl_state
+from models import Model
+from shader import Shader
+from stream_buffer import StreamBuffer
+
+from typing import Sequence
+
+# first attribute locations of the per instance matrices, one location per column
+INSTANCE_MODEL_LOCATION = 3
+INSTANCE_NORMAL_LOCATION = 7
+
+
+class InstancedBatch:
+
+    def __init__(self, model: Model, shader: Shader, stream: StreamBuffer):
+        """
+        All instances of one model, drawn with a single instanced draw call.
+
+        The per instance attributes are read from the range of the stream
+        buffer written by the last upload. The vertex array is shared by every
+        model of the same vertex format, so draw attaches them just for its
+        own draw call and detaches them again.
+
+        Args:
+            model (Model): the shared model
+            shader (Shader): instanced variant of the model's shader
+            stream (StreamBuffer): buffer the instance matrices are written into every frame
+        """
+        self.model = model
+        self.shader = shader
+        self.stream = stream
+        self.instance_count = 0
+        # stream buffer offsets of the model and normal matrices of the last upload
+        self.offsets = (0, 0)
+
+    def upload(self, transforms: np.ndarray, normal_matrices: np.ndarray, rows: np.ndarray | None = None):
+        """
+        Args:
+            transforms (np.ndarray): (n, 4, 4) float32 model matrices, column major like GL expects
+            normal_matrices (np.ndarray): (n, 3, 3) float32 normal matrices, column major
+            rows (np.ndarray): optional indices of the matrices to draw, they are gathered
+                straight into the stream buffer
+        """
+        self.instance_count = len(transforms) if rows is None else len(rows)
+        if not self.instance_count:
+            return
+
+        self.offsets = write_instance_matrices(self.stream, transforms, normal_matrices, rows)
+
+    def draw(self):
+        if not self.instance_count:
+            return
+
+        gl_state.bind_vertex_array(self.model.vao)
+        attach_instance_matrices(self.stream.buffer, *self.offsets)
+        self.model.draw_instanced(self.shader, self.instance_count)
+        detach_instance_matrices()
+
+
+class InstancedRenderer:
+
+    def __init__(self, instanced_shaders: dict[Shader, Shader], stream: StreamBuffer):
+        """
+        Groups entities by model and draws every group as one instanced batch.
+        Entities drawn by one renderer must share an EntityStore.
+
+        Args:
+            instanced_shaders (dict[Shader, Shader]): instanced variant of each model shader
+            stream (StreamBuffer): buffer holding the instance matrices, flushed by update
+                and to be fenced with StreamBuffer.end_frame after draw
+        """
+        self.instanced_shaders = instanced_shaders
+        self.stream = stream
+        # model -> (batch, entities)
+        self.batches: dict[Model, tuple[InstancedBatch, list]] = {}
+
+    def add(self, entities: Sequence):
+        for entity in entities:
+            model = entity.model
+            if model not in self.batches:
+                self.batches[model] = (InstancedBatch(model, self.instanced_shaders[model.shader], self.stream), [])
+            self.batches[model][1].append(entity)
+
+    def update(self, visible: np.ndarray | None = None):
+        """
+        Gather the current transform of every entity into the instance buffers.
+
+        Args:
+            visible (np.ndarray): optional per row mask of the store, as left by FrustumCuller.update,
+                entities outside of it are left out
+        """
+        for batch, entities in self.batches.values():
+            store = entities[0].store
+            store.update_transforms()
+            rows = np.fromiter((entity.row for entity in entities), dtype=np.intp, count=len(entities))
+            if visible is not None:
+                rows = rows[visible[rows]]
+            batch.upload(store.transforms, store.normal_matrices, rows)
+        self.stream.flush()
+
+    def draw(self):
+        for batch, _ in self.batches.values():
+            batch.draw()
+
+
+def write_instance_matrices(stream: StreamBuffer, transforms: np.ndarray, normal_matrices: np.ndarray,
+                            rows: np.ndarray | None = None):
+    """
+    Gather instance matrices into this frame's range of a stream buffer.
+
+    Returns:
+        tuple[int, int]: byte offsets of the model and of the normal matrices
+    """
+    # the ring never hands out a range the GPU still reads, so no draw waits on the new data
+    offsets = []
+    for matrices, size in ((transforms, 4), (normal_matrices, 3)):
+        count = len(matrices) if rows is None else len(rows)
+        offset, view = stream.allocate((count, size, size), np.float32)
+        if rows is None:
+            view[...] = matrices
+        else:
+            np.take(matrices, rows, axis=0, out=view)
+        offsets.append(offset)
+    return tuple(offsets)
+
+
+def attach_instance_matrices(buffer, model_offset, normal_offset):
+    """
+    Point the per instance matrix attributes of the bound vertex array at buffer.
+
+    Args:
+        buffer (int): buffer holding the matrices
+        model_offset (int): byte offset of the (n, 4, 4) float32 model matrices
+        normal_offset (int): byte offset of the (n, 3, 3) float32 normal matrices
+    """
+    glBindBuffer(GL_ARRAY_BUFFER, buffer)
+    for offset, first_location, size in ((model_offset, INSTANCE_MODEL_LOCATION, 4), (normal_offset, INSTANCE_NORMAL_LOCATION, 3)):
+        for column in range(size):
+            location = first_location + column
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, 4 * size * size, ctypes.c_void_p(offset + 4 * size * column))
+            glVertexAttribDivisor(location, 1)
+
+
+def detach_instance_matrices():
+    """
+    Disable the per instance matrix attributes again, the vertex array is shared with non instanced draws.
+    """
+    for location in range(INSTANCE_MODEL_LOCATION, INSTANCE_NORMAL_LOCATION + 3):
+        glVertexAttribDivisor(location, 0)
+        glDisableVertexAttribArray(location)
@@ -0,0 +1,69 @@
+import numpy as np
+
+from camera import Camera
+from entity_store import EntityStore
+
+from typing import Sequence
+
+
+class LODSelector:
+
+    def __init__(self, store: EntityStore, thresholds: Sequence = (0.25, 0.12, 0.05), hysteresis=0.15):
+        """
+        Picks the level of detail of every row of a store from its size on screen.
+
+        The size is the radius of the world space bounding sphere over the
+        half height of the view at its distance, 1 fills the screen
+        vertically. A row drops to level i + 1 once its size falls below
+        thresholds[i]. Near a threshold a row keeps its current level until
+        the size moves past it by the hysteresis fraction, so entities sitting
+        at a threshold do not pop back and forth between levels.
+
+        RenderQueue and IndirectRenderer draw the picked level, models with
+        fewer levels use their coarsest one.
+
+        Args:
+            store (EntityStore): store whose lods column is written
+            thresholds (Sequence): decreasing screen sizes below which each coarser level is used
+            hysteresis (float): fraction of a threshold the size must pass it by to switch
+        """
+        self.store = store
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+        self.hysteresis = hysteresis
+        # rows at each level after the last update
+        self.counts = np.zeros(len(thresholds) + 1, dtype=np.int64)
+
+    def update(self, camera: Camera):
+        """
+        Write the level of every row into store.lods, after the store's transforms were updated.
+        """
+        store = self.store
+        count = store.count
+        sizes = screen_sizes(camera, store.world_centers[:count], store.world_radii[:count])
+
+        # the coarsest and the finest level each size allows, the current level is kept within them
+        coarsest = (sizes[:, None] < self.thresholds * (1 + self.hysteresis)).sum(axis=1)
+        finest = (sizes[:, None] < self.thresholds * (1 - self.hysteresis)).sum(axis=1)
+        lods = store.lods[:count]
+        np.clip(lods, finest, coarsest, out=lods, casting='unsafe')
+
+        self.counts = np.bincount(lods, minlength=len(self.thresholds) + 1)
+
+
+def screen_sizes(camera: Camera, centers: np.ndarray, radii: np.ndarray):
+    """
+    Bounding sphere radii over the half height of the view at the distance of their centers.
+
+    Args:
+        camera (Camera): camera as of its last update
+        centers (np.ndarray): (n, 3) world space centers
+        radii (np.ndarray): (n,) world space radii
+
+    Returns:
+        np.ndarray: (n,) float32 sizes, 1 fills the screen vertically
+    """
+    # element [1][1] of the projection is 1 / tan(fov / 2)
+    focal = camera.projection_transform[1][1]
+    distances = np.sqrt(((centers - np.asarray(camera.position, dtype=np.float32)) ** 2).sum(axis=1))
+    # spheres around the camera fill the screen
+    return np.where(distances > radii, radii * focal / np.maximum(distances, 1e-6), np.inf).astype(np.float32)
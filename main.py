@@ -5,6 +5,7 @@ from OpenGL.GL import *
 
 import glm
 from timer import Timer
+from gl_state import gl_state
 
 from models import *
 from material import *
@@ -12,6 +13,20 @@ from camera import *
 from shader import *
 from entities import *
 from post_processing import *
+from uniform_buffer import *
+from instancing import *
+from culling import *
+from spatial import *
+from render_queue import *
+from asset_loader import *
+from stream_buffer import *
+from static_batching import *
+from geometry_pool import *
+from indirect import *
+from lod import *
+from clustered_lighting import *
+from deferred import *
+from profiler import *
 
 def main():
     # initialize -------------------------------------------------- #
@@ -26,14 +41,14 @@ def main():
 
     # create window
     WIN_SIZE = (1200, 800)
-    pygame.display.set_mode((WIN_SIZE), DOUBLEBUF | OPENGL)
+    pygame.display.set_mode((WIN_SIZE), DOUBLEBUF | OPENGL | RESIZABLE)
     pygame.mouse.set_pos(WIN_SIZE[0]/2, WIN_SIZE[1]/2)
     # pygame.mouse.set_visible(False)
     mouse_inside = False
     
     # initialize opengl
     glClearColor(0.0, 0.0, 0.0, 1)
-    glEnable(GL_DEPTH_TEST)
+    gl_state.enable(GL_DEPTH_TEST)
     
     # glCullFace(GL_BACK)
     # glFrontFace(GL_CCW)
@@ -41,37 +56,108 @@ def main():
     # initialize game objects -------------------------------------------------- #
     # shaders
     shader = Shader("shaders/vertex.vert", "shaders/fragment.frag")
-    shader.use()
-    shader.set_int("material.diffuse", 0)
-    shader.set_int("material.specular", 1)
-    shader.set_float("material.shininess", 32.0)
+    shaderInstanced = Shader("shaders/vertex_instanced.vert", "shaders/fragment.frag")
+    for lit_shader in (shader, shaderInstanced):
+        lit_shader.use()
+        lit_shader.set_int("material.diffuse", 0)
+        lit_shader.set_int("material.specular", 1)
+        lit_shader.set_float("material.shininess", 32.0)
     
     shaderBasic = Shader("shaders/simple_3d_vertex.vert", "shaders/simple_3d_fragment.frag")
+    shaderBasicInstanced = Shader("shaders/simple_3d_vertex_instanced.vert", "shaders/simple_3d_fragment.frag")
+    
+    # lighting passes of deferred shading
+    shaderDirectional = Shader("shaders/screen_vertex.vert", "shaders/deferred_directional.frag")
+    shaderPointVolume = Shader("shaders/deferred_point.vert", "shaders/deferred_point.frag")
+    
+    # per frame data shared by all shaders
+    frame_data = UniformBuffer("FrameData", Camera.FRAME_DATA_SIZE, FRAME_DATA_BINDING)
+    frame_data.attach(shader, shaderInstanced, shaderBasic, shaderBasicInstanced, shaderDirectional, shaderPointVolume)
+    
+    lights = UniformBuffer("Lights", LIGHTS_BLOCK_SIZE, LIGHTS_BINDING)
+    lights.attach(shader, shaderInstanced, shaderDirectional)
+    
+    # point lights only shade the fragments of the view clusters they reach
+    point_light_set = PointLights()
+    light_clusters = LightClusters(lights, WIN_SIZE)
+    light_clusters.attach(shader, shaderInstanced)
     
     shader2d = Shader("shaders/screen_vertex.vert", "shaders/screen_fragment.frag")
     
-    # post processing
-    post_processing = PostProcessing(WIN_SIZE, shader2d)
+    # post processing: bloom, tone mapping and fxaa, their render targets are shared through a pool
+    POST_PROCESS = True
+    post_graph = None
+    if POST_PROCESS:
+        post_graph = bloom_graph(
+            Shader("shaders/screen_vertex.vert", "shaders/post_downsample.frag"),
+            Shader("shaders/screen_vertex.vert", "shaders/post_upsample.frag"),
+            Shader("shaders/screen_vertex.vert", "shaders/post_tone_map.frag"),
+            Shader("shaders/screen_vertex.vert", "shaders/post_fxaa.frag"),
+        )
+    post_processing = PostProcessing(WIN_SIZE, shader2d, post_graph)
+    
+    # lit geometry can also write a G-buffer which is shaded once per pixel, tab switches between the two
+    deferred_shading = DeferredShading(WIN_SIZE, shader2d, shaderDirectional, shaderPointVolume, post_graph)
+    deferred_shading.attach(shader, shaderInstanced, shaderBasic, shaderBasicInstanced)
+    deferred = False
 
-    # objects
-    backpack_model = OBJModel("models/backpack.obj", Material("img/diffuse.jpg", "img/specular.jpg"), shader)
+    # objects, images and meshes are decoded in the background and show placeholders until uploaded
+    loader = AssetLoader()
+    # with coarser levels of detail for when it is far away, baked ahead by python -m mesh_simplify
+    backpack_model = OBJModel("models/backpack.obj", Material("img/diffuse.jpg", "img/specular.jpg", loader=loader), shader, loader,
+                              lod_count=4)
     backpack = Entity(backpack_model, (0, 0, 0), (0, 0, 0), 0.5)
     
-    textured_cube_model = TexturedCube(Material("img/crate_diffuse.jpg", "img/crate_specular.jpg"), shader)
+    textured_cube_model = TexturedCube(Material("img/crate_diffuse.jpg", "img/crate_specular.jpg", loader=loader), shader)
     cube = Entity(textured_cube_model, (0, 0, 0), (0, 0, 0), 1)
     
     # lights
-    dir_light = DirLight(shader, (0.5, -1, -0.5), (0.2, 0.2, 0.2), (1.0, 1.0, 1.0), (1.0, 1.0, 1.0))
+    dir_light = DirLight(lights, (0.5, -1, -0.5), (0.2, 0.2, 0.2), (1.0, 1.0, 1.0), (1.0, 1.0, 1.0))
     
     point_lights = [
-        PointLight((shaderBasic, shader), (1.0, 0.0, 0.0), (1.0, 1.0, 1.0), 0),
-        PointLight((shaderBasic, shader), (0.0, 1.0, 0.0), (1.0, 1.0, -1.0), 1),
-        PointLight((shaderBasic, shader), (0.0, 0.0, 1.0), (-1.0, 1.0, 1.0), 2),
+        PointLight(shaderBasic, point_light_set, (1.0, 0.0, 0.0), (1.0, 1.0, 1.0)),
+        PointLight(shaderBasic, point_light_set, (0.0, 1.0, 0.0), (1.0, 1.0, -1.0)),
+        PointLight(shaderBasic, point_light_set, (0.0, 0.0, 1.0), (-1.0, 1.0, 1.0)),
     ]
 
+    # static entities get their own store, they are culled through the bvh instead of one by one
+    static_store = EntityStore()
     static_entities: list[Entity] = []
     dynamic_entites: list[Entity] = [backpack]
     
+    static_index = BVH()
+    static_index.build(static_entities, *entity_boxes(static_entities))
+    
+    # per frame data is written into a ring buffer with room for several frames
+    stream = StreamBuffer(32 * 1024 * 1024)
+    
+    # static entities sharing a shader and material can be baked into one world space mesh each
+    MERGE_STATIC = True
+    if MERGE_STATIC:
+        merged_static, instanced_static = merge_static(static_entities)
+    else:
+        merged_static, instanced_static = [], static_entities
+    
+    # submit whole groups of models with one multi draw indirect call, instead of one draw call per model or entity
+    INDIRECT = True
+    instanced_shaders = {shader: shaderInstanced, shaderBasic: shaderBasicInstanced}
+    Renderer = IndirectRenderer if INDIRECT else InstancedRenderer
+    
+    # the others are drawn instanced, refilled with the visible ones every frame
+    static_batches = Renderer(instanced_shaders, stream)
+    static_batches.add(instanced_static)
+    visible_static = []
+    
+    # dynamic entities go through the render queue one by one, or through multi draw indirect
+    if INDIRECT:
+        dynamic_batches = IndirectRenderer(instanced_shaders, stream)
+        dynamic_batches.add(dynamic_entites)
+    
+    culler = FrustumCuller(entity_store)
+    # levels of detail by size on screen
+    lod_selectors = [LODSelector(entity_store), LODSelector(static_store)]
+    render_queue = RenderQueue()
+    
     camera = FPS_Camera([0.0, 0.0, 5.0], [0.0, 0.0, 0.0], glm.radians(45.0), WIN_SIZE[0]/WIN_SIZE[1], 0.3, 30.0)
     
     # game loop -------------------------------------------------- #
@@ -81,18 +167,41 @@ def main():
     while running:
         # timing -------------------------------------------------- #
         dt = clock.tick()
+        profiler.begin_frame()
 
         framerate = clock.get_fps()
-        pygame.display.set_caption(f"Running at {framerate :.2f} fps.")
+        pygame.display.set_caption(
+            f"Running at {framerate :.2f} fps, {culler.drawn}/{culler.tested} dynamic and"
+            f" {len(visible_static)}/{len(static_index)} static objects drawn,"
+            f" {gl_state.frame_elided} redundant GL state changes skipped,"
+            f" switches {render_queue.frame_unsorted} unsorted vs {render_queue.frame_sorted} sorted,"
+            f" entities per level of detail {lod_selectors[0].counts.tolist()},"
+            f" {'deferred' if deferred else 'forward'} shading."
+        )
 
         # check events -------------------------------------------------- #
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
 
+            if event.type == pygame.VIDEORESIZE:
+                WIN_SIZE = (event.w, event.h)
+                glViewport(0, 0, *WIN_SIZE)
+                camera.set_aspect_ratio(WIN_SIZE[0]/WIN_SIZE[1])
+                light_clusters.resize(WIN_SIZE)
+                post_processing.resize(WIN_SIZE)
+                deferred_shading.resize(WIN_SIZE)
+
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     running = False
+                if event.key == pygame.K_TAB:
+                    deferred = not deferred
+                # frame times of the last frames, for chrome://tracing or perfetto
+                if event.key == pygame.K_p:
+                    print(profiler.report())
+                    profiler.export_json("profile.json")
+                    profiler.export_chrome_trace("profile_trace.json")
 
         X_CENTER = WIN_SIZE[0]/2
         Y_CENTER = WIN_SIZE[1]/2
@@ -134,40 +243,99 @@ def main():
         camera.move(dt * forwards, dt * sideways, dt * vertical)
 
         # update objects -------------------------------------------------- #
-        camera.update([shader, shaderBasic])
+        # upload assets that finished loading, their entities pick up the real bounds
+        with profiler.scope("assets"):
+            loaded = loader.update()
+            if loaded:
+                entity_store.update_bounds(loaded)
+                static_store.update_bounds(loaded)
+                static_index.build(static_entities, *entity_boxes(static_entities))
         
-        dir_light.update()
+        with profiler.scope("camera"):
+            camera.update(frame_data)
         
-        # backpack.orientation.y += 50 * dt
+        with profiler.scope("lights"):
+            dir_light.update()
+            
+            for point_light in point_lights:
+                point_light.update()
+            
+            if deferred:
+                deferred_shading.update(point_light_set)
+            else:
+                light_clusters.update(camera, point_light_set)
+            lights.upload()
         
-        for point_light in point_lights:
-            point_light.update()
+        # backpack.orientation = backpack.orientation + (0, 50 * dt, 0)
         
-        for entity in dynamic_entites:
-            entity.update()
+        with profiler.scope("transforms"):
+            for entity in dynamic_entites:
+                entity.update()
+            
+            # only entities whose position, orientation or scale changed are recomputed
+            entity_store.update_transforms()
+            static_store.update_transforms()
+            for lod_selector in lod_selectors:
+                lod_selector.update(camera)
         
-        for entity in dynamic_entites:
-            entity.update_transform()
+        # cull dynamic entities against the view frustum at once, static ones through the bvh
+        with profiler.scope("culling"):
+            frustum = camera.frustum_planes()
+            culler.update(frustum)
+            visible_static = static_index.query_frustum(frustum)
+            visible_mask = static_store.mask(visible_static)
+            static_batches.update(visible_mask)
+            for batch in merged_static:
+                batch.update(visible_mask)
+            if INDIRECT:
+                dynamic_batches.update(culler.visible)
 
         # drawing
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        # post_processing.begin()
+        with profiler.scope("draw"):
+            if deferred:
+                deferred_shading.begin()
+            else:
+                if POST_PROCESS:
+                    post_processing.begin()
+                else:
+                    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+                light_clusters.bind()
 
-        glDisable(GL_CULL_FACE)
-        for point_light in point_lights:
-            point_light.draw()
+            # draws are sorted by shader, material and model, front to back within each group
+            gl_state.enable(GL_CULL_FACE)
+            if INDIRECT:
+                dynamic_batches.draw()
+            else:
+                render_queue.submit_entities(culler.filter(dynamic_entites))
+                render_queue.flush(camera.position)
+            
+            static_batches.draw()
+            for batch in merged_static:
+                batch.draw()
         
-        glEnable(GL_CULL_FACE)
-        for entity in dynamic_entites:
-            entity.draw()
+        # the unlit light cubes are drawn after shading, against the depth of the geometry pass
+        if deferred:
+            with profiler.scope("deferred lighting"):
+                deferred_shading.shade()
         
-        for entity in static_entities:
-            entity.draw()
-
-        # post_processing.end()
+        with profiler.scope("draw"):
+            gl_state.disable(GL_CULL_FACE)
+            render_queue.submit_entities(culler.filter(point_lights))
+            render_queue.flush(camera.position)
+        
+        with profiler.scope("post processing"):
+            if deferred:
+                deferred_shading.end()
+            elif POST_PROCESS:
+                post_processing.end()
 
         # flip screen
-        pygame.display.flip()
+        with profiler.scope("swap"):
+            pygame.display.flip()
+        stream.end_frame()
+        profiler.end_frame()
+        gl_state.end_frame()
+        render_queue.end_frame()
 
     # cleanup -------------------------------------------------- #
     for entity in dynamic_entites:
@@ -175,6 +343,20 @@ def main():
         
     for entity in static_entities:
         entity.destroy()
+        
+    loader.shutdown()
+    stream.destroy()
+    for batch in merged_static:
+        batch.destroy()
+    frame_data.destroy()
+    lights.destroy()
+    light_clusters.destroy()
+    deferred_shading.destroy()
+    post_processing.destroy()
+    if post_graph is not None:
+        post_graph.destroy()
+    geometry_pool.destroy()
+    profiler.destroy()
 
 main()
 pygame.quit()
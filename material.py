@@ -1,35 +1,31 @@
 from OpenGL.GL import *
-import pygame
 
-class Material:
-    
-    def __init__(self, *filepaths):
-        self.textures = tuple(self.generate_texture(filepath) for filepath in filepaths)
-        
-    def generate_texture(self, filepath):
-        texture = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, texture)
-        
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-
-        image = pygame.image.load(filepath).convert()
-        image_width, image_height = image.get_rect().size
-        img_data = pygame.image.tostring(image, 'RGBA')
+from texture_cache import TextureCache, texture_cache
 
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, image_width,
-                     image_height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img_data)  
+class Material:
 
-        glGenerateMipmap(GL_TEXTURE_2D)
-        
-        return texture
+    def __init__(self, *filepaths, loader=None, cache: TextureCache = texture_cache,
+                 wrap=GL_REPEAT, min_filter=GL_LINEAR_MIPMAP_LINEAR, mag_filter=GL_LINEAR):
+        """
+        Args:
+            filepaths (str): image of each texture unit
+            loader (AssetLoader): optional, decode the images on its workers and show
+                a placeholder until AssetLoader.update uploads them
+            cache (TextureCache): cache sharing the textures with other materials
+            wrap, min_filter, mag_filter: sampler parameters of every texture
+        """
+        self.cache = cache
+        # texture_cache.Texture per unit, materials using the same images share them
+        self.textures = tuple(
+            cache.acquire(filepath, wrap, min_filter, mag_filter, loader) for filepath in filepaths
+        )
 
     def use(self):
+        # binding one texture must not evict another of the same draw
+        self.cache.pin(self.textures)
         for i, texture in enumerate(self.textures):
-            glActiveTexture(GL_TEXTURE0 + i)
-            glBindTexture(GL_TEXTURE_2D, texture)
+            self.cache.bind(i, texture)
 
     def destroy(self):
-        glDeleteTextures(len(self.textures), self.textures)
+        for texture in self.textures:
+            self.cache.release(texture)
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import struct
+import threading
+import warnings
+
+import numpy as np
+
+from mesh_simplify import simplify
+from obj_loader import load_obj
+
+CACHE_DIRECTORY = ".cache/meshes"
+
+# magic, version, source size, source mtime, vertex count, floats per vertex, index count, index size
+_HEADER = struct.Struct("<8sIQQIIII")
+_MAGIC = b"PYGLMESH"
+_VERSION = 1
+_HEADER_SIZE = 64
+
+
+def load_mesh(filename, cache_directory=CACHE_DIRECTORY):
+    """
+    Load an OBJ file through the binary mesh cache.
+
+    The first load parses the OBJ text and writes the result to the cache,
+    later loads map the cached file so the vertex and index blocks can go
+    straight to glBufferData without any parsing.
+
+    Args:
+        filename (str): path to the .obj file
+        cache_directory (str): directory holding compiled meshes
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: vertices and indices, as returned by load_obj
+    """
+    path = cache_path(filename, ".mesh", cache_directory)
+    stat = os.stat(filename)
+
+    mesh = read_mesh(path, stat)
+    if mesh is None:
+        mesh = load_obj(filename)
+        try:
+            write_mesh(path, *mesh, stat)
+        except OSError as e:
+            warnings.warn(f"could not cache {filename}: {e}")
+    return mesh
+
+
+def load_lods(filename, levels=4, ratio=0.5, cache_directory=CACHE_DIRECTORY):
+    """
+    Load the level of detail chain of an OBJ file through the mesh cache.
+
+    Level 0 is the mesh of load_mesh. Coarser levels are simplified from the
+    level before by quadric edge collapse and cached next to it, one file per
+    level, so they are only ever built once per source file.
+
+    Args:
+        filename (str): path to the .obj file
+        levels (int): number of levels, level 0 included
+        ratio (float): triangles kept from one level to the next
+        cache_directory (str): directory holding compiled meshes
+
+    Returns:
+        list[tuple[np.ndarray, np.ndarray]]: vertices and indices of each level, level 0 first
+    """
+    chain = [load_mesh(filename, cache_directory)]
+    stat = os.stat(filename)
+    for level in range(1, levels):
+        # the ratio is part of the name, chains baked with another ratio are kept apart
+        path = cache_path(filename, f".lod{level}-{ratio:g}.mesh", cache_directory)
+        mesh = read_mesh(path, stat)
+        if mesh is None:
+            vertices, indices = chain[-1]
+            mesh = simplify(vertices, indices, int(len(indices) // 3 * ratio))
+            try:
+                write_mesh(path, *mesh, stat)
+            except OSError as e:
+                warnings.warn(f"could not cache level {level} of {filename}: {e}")
+        chain.append(mesh)
+    return chain
+
+
+def cache_path(filename, suffix, cache_directory=CACHE_DIRECTORY):
+    """
+    Location of the compiled form of a source asset, unique per source path.
+    """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    key = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:16]
+    return os.path.join(cache_directory, f"{name}-{key}{suffix}")
+
+
+def read_mesh(path, stat):
+    """
+    Map a compiled mesh, or return None if it is missing or older than its source.
+    """
+    try:
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+    except (OSError, ValueError):
+        return None
+    if len(data) < _HEADER_SIZE:
+        return None
+
+    magic, version, size, mtime, vertex_count, width, index_count, index_size = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION or size != stat.st_size or mtime != stat.st_mtime_ns:
+        return None
+
+    vertex_end = _HEADER_SIZE + vertex_count * width * 4
+    index_end = vertex_end + index_count * index_size
+    if len(data) != index_end:
+        return None
+
+    vertices = data[_HEADER_SIZE:vertex_end].view(np.float32).reshape(vertex_count, width)
+    indices = data[vertex_end:index_end].view(np.uint16 if index_size == 2 else np.uint32)
+    return vertices, indices
+
+
+def write_mesh(path, vertices, indices, stat):
+    """
+    Write a compiled mesh: a fixed size header, the float32 vertex block, then the index block.
+    """
+    header = _HEADER.pack(
+        _MAGIC, _VERSION, stat.st_size, stat.st_mtime_ns,
+        len(vertices), vertices.shape[1], len(indices), indices.itemsize
+    )
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write next to the target and rename, so readers never see a partial file,
+    # the name is unique per thread since asset loader workers may compile the same mesh
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(header.ljust(_HEADER_SIZE, b'\0'))
+        f.write(np.ascontiguousarray(vertices, dtype=np.float32).tobytes())
+        f.write(np.ascontiguousarray(indices).tobytes())
+    os.replace(temporary, path)
@@ -0,0 +1,237 @@
+"""
+Mesh simplification by quadric edge collapse, used offline to build level of detail chains.
+
+Run from the repository root to bake the chains ahead of time:
+    python -m mesh_simplify [--levels 4] [--ratio 0.5] models/*.obj
+"""
+import argparse
+import heapq
+
+import numpy as np
+
+from obj_loader import index_dtype
+
+
+def simplify(vertices: np.ndarray, indices: np.ndarray, target_triangles: int):
+    """
+    Collapse edges until at most target_triangles triangles are left.
+
+    Every vertex position gets the quadric of the planes of the triangles
+    around it, weighted by their areas. The cheapest edge by quadric error is
+    collapsed first, always onto one of its end points, so the attributes of
+    the surviving vertices are kept as they are. Vertices that share a
+    position but not their texture coordinates or normals, the seams of the
+    mesh, only move along the seam as a whole so no cracks open. Open borders
+    only collapse along themselves, and collapses that would flip a triangle
+    or pinch the surface are skipped.
+
+    Args:
+        vertices (np.ndarray): (n, 8) float32 x, y, z, s, t, nx, ny, nz vertices, as returned by load_obj
+        indices (np.ndarray): triangle indices into vertices
+        target_triangles (int): stop once this many triangles are left, fewer may be reached
+            if no collapse is left
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: the vertices still referenced, in the order they are
+            first used, and the indices into them
+    """
+    positions = vertices[:, :3].astype(np.float64)
+    # vertices sharing a position collapse together, p is the welded position of every vertex
+    welded, p = np.unique(positions, axis=0, return_inverse=True)
+    p = p.ravel()
+
+    corners = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    corner_positions = p[corners]
+    # triangles that are already degenerate in position draw nothing
+    keep = ((corner_positions[:, 0] != corner_positions[:, 1]) & (corner_positions[:, 1] != corner_positions[:, 2])
+            & (corner_positions[:, 2] != corner_positions[:, 0]))
+    corners = corners[keep]
+    corner_positions = corner_positions[keep]
+
+    quadrics = _quadrics(welded, corner_positions)
+    borders = _border_edges(corner_positions)
+    border_positions = {position for edge in borders for position in edge}
+
+    triangles = corners.tolist()
+    alive = [True] * len(triangles)
+    live_count = len(triangles)
+    # welded position -> triangles around it
+    around = [set() for _ in range(len(welded))]
+    for t, (a, b, c) in enumerate(corner_positions.tolist()):
+        around[a].add(t)
+        around[b].add(t)
+        around[c].add(t)
+    position_of = p.tolist()
+    points = welded.tolist()
+    removed = [False] * len(welded)
+    # bumped whenever the quadric of a position changes, older heap entries are skipped
+    versions = [0] * len(welded)
+
+    heap = []
+
+    def push(u, w):
+        q = quadrics[u] + quadrics[w]
+        x = np.append(welded[w], 1.0)
+        heapq.heappush(heap, (float(x @ q @ x), u, w, versions[u], versions[w]))
+
+    for a, b in _edges(corner_positions):
+        push(a, b)
+        push(b, a)
+
+    while live_count > target_triangles and heap:
+        _, u, w, version_u, version_w = heapq.heappop(heap)
+        if removed[u] or removed[w] or versions[u] != version_u or versions[w] != version_w:
+            continue
+
+        shared = around[u] & around[w]
+        if not shared:
+            continue
+        if u in border_positions and _edge_key(u, w) not in borders:
+            continue
+
+        mapping = _seam_mapping(u, w, shared, triangles, position_of, around[u])
+        if mapping is None:
+            continue
+        if not _keeps_manifold(u, w, shared, triangles, position_of, around):
+            continue
+        if _flips(u, w, around[u] - shared, triangles, position_of, points):
+            continue
+
+        for t in shared:
+            alive[t] = False
+            live_count -= 1
+            for vertex in triangles[t]:
+                around[position_of[vertex]].discard(t)
+        for t in around[u]:
+            triangles[t] = [mapping.get(vertex, vertex) for vertex in triangles[t]]
+            around[w].add(t)
+        around[u] = set()
+
+        removed[u] = True
+        quadrics[w] += quadrics[u]
+        versions[w] += 1
+        if u in border_positions:
+            borders.discard(_edge_key(u, w))
+            for v in _neighbours(w, triangles, position_of, around):
+                key = _edge_key(u, v)
+                if key in borders:
+                    borders.discard(key)
+                    borders.add(_edge_key(w, v))
+        for v in _neighbours(w, triangles, position_of, around):
+            push(v, w)
+            push(w, v)
+
+    corners = np.array([triangle for triangle, live in zip(triangles, alive) if live], dtype=np.int64).reshape(-1)
+    used, first = np.unique(corners, return_index=True)
+    # keep the order in which vertices are first referenced, as load_obj does
+    used = used[np.argsort(first)]
+    remap = np.zeros(len(vertices), dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    return np.ascontiguousarray(vertices[used]), remap[corners].astype(index_dtype(len(used)))
+
+
+def _quadrics(positions, corner_positions):
+    p0, p1, p2 = (positions[corner_positions[:, i]] for i in range(3))
+    normals = np.cross(p1 - p0, p2 - p0)
+    # twice the area, so each plane is weighted by the area of its triangle
+    areas = np.linalg.norm(normals, axis=1)
+    units = normals / np.maximum(areas, 1e-30)[:, None]
+    planes = np.concatenate((units, -(units * p0).sum(axis=1, keepdims=True)), axis=1)
+    face_quadrics = (areas / 2)[:, None, None] * planes[:, :, None] * planes[:, None, :]
+
+    quadrics = np.zeros((len(positions), 4, 4))
+    for i in range(3):
+        np.add.at(quadrics, corner_positions[:, i], face_quadrics)
+    return quadrics
+
+
+def _edges(corner_positions):
+    edges = np.sort(np.concatenate((corner_positions[:, [0, 1]], corner_positions[:, [1, 2]], corner_positions[:, [2, 0]])), axis=1)
+    return np.unique(edges, axis=0).tolist()
+
+
+def _border_edges(corner_positions):
+    """
+    Edges of only one triangle, as (smaller, larger) welded positions.
+    """
+    edges = np.sort(np.concatenate((corner_positions[:, [0, 1]], corner_positions[:, [1, 2]], corner_positions[:, [2, 0]])), axis=1)
+    unique, counts = np.unique(edges, axis=0, return_counts=True)
+    return set(map(tuple, unique[counts == 1].tolist()))
+
+
+def _edge_key(a, b):
+    return (a, b) if a < b else (b, a)
+
+
+def _neighbours(position, triangles, position_of, around):
+    neighbours = set()
+    for t in around[position]:
+        neighbours.update(position_of[vertex] for vertex in triangles[t])
+    neighbours.discard(position)
+    return neighbours
+
+
+def _seam_mapping(u, w, shared, triangles, position_of, around_u):
+    """
+    Vertex at w that each vertex at u turns into, None if the vertices at u cannot move as one.
+
+    Each vertex at u must meet exactly one vertex at w in the triangles along
+    the edge, otherwise the collapse would tear a seam open.
+    """
+    mapping = {}
+    for t in shared:
+        source = target = None
+        for vertex in triangles[t]:
+            if position_of[vertex] == u:
+                source = vertex
+            elif position_of[vertex] == w:
+                target = vertex
+        if mapping.setdefault(source, target) != target:
+            return None
+    for t in around_u:
+        for vertex in triangles[t]:
+            if position_of[vertex] == u and vertex not in mapping:
+                return None
+    return mapping
+
+
+def _keeps_manifold(u, w, shared, triangles, position_of, around):
+    """
+    The link condition: u and w may only have the opposite corners of their shared triangles as common neighbours.
+    """
+    opposite = {position_of[vertex] for t in shared for vertex in triangles[t]} - {u, w}
+    common = _neighbours(u, triangles, position_of, around) & _neighbours(w, triangles, position_of, around)
+    return common == opposite
+
+
+def _flips(u, w, moved, triangles, position_of, points):
+    """
+    Whether moving u onto w turns any of the moved triangles over or collapses it to a sliver.
+    """
+    for t in moved:
+        before = [points[position_of[vertex]] for vertex in triangles[t]]
+        after = [points[w] if position_of[vertex] == u else point for vertex, point in zip(triangles[t], before)]
+        old = np.cross(np.subtract(before[1], before[0]), np.subtract(before[2], before[0]))
+        new = np.cross(np.subtract(after[1], after[0]), np.subtract(after[2], after[0]))
+        if old @ new <= 0.1 * np.linalg.norm(old) * np.linalg.norm(new):
+            return True
+    return False
+
+
+def main():
+    from mesh_cache import CACHE_DIRECTORY, load_lods
+
+    parser = argparse.ArgumentParser(description="Bake the level of detail chains of OBJ files into the mesh cache.")
+    parser.add_argument("models", nargs="+")
+    parser.add_argument("--levels", type=int, default=4, help="levels including the full mesh")
+    parser.add_argument("--ratio", type=float, default=0.5, help="triangles kept from one level to the next")
+    parser.add_argument("--cache-directory", default=CACHE_DIRECTORY)
+    args = parser.parse_args()
+
+    for filename in args.models:
+        chain = load_lods(filename, args.levels, args.ratio, args.cache_directory)
+        print(f"{filename}: " + ", ".join(f"{len(indices) // 3}" for _, indices in chain) + " triangles")
+
+
+if __name__ == "__main__":
+    main()
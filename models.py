@@ -1,36 +1,92 @@
-from typing import Any
 from OpenGL.GL import * 
-import glm
+import numpy as np
 
+from culling import Bounds
+from geometry_pool import Mesh, POSITION_COLOR, POSITION_COLOR_TEXTURE, POSITION_TEXTURE_NORMAL, SCREEN, geometry_pool
+from gl_state import gl_state
 from shader import Shader
 from material import Material
+from mesh_cache import load_lods
 
 
 class Model():
     shader: Shader
-    vertex_count: float
-    vao: Any
-    vbo: Any
+    # only textured models have one
+    material: Material | None = None
+    # model space bounding volume, computed at load time
+    bounds: Bounds
+    # ranges in the geometry pool arena of the model's vertex format
+    mesh: Mesh
+    # cpu copy of the mesh, indices is None for unindexed models
+    vertices: np.ndarray
+    indices: np.ndarray | None = None
+    # coarser meshes for distant entities, level 1 first, most models have none
+    lods: tuple[Mesh, ...] = ()
+
+    @property
+    def vao(self):
+        """
+        Vertex array of the arena, shared by every model of the same vertex format.
+        """
+        return self.mesh.vao
+
+    @property
+    def lod_count(self):
+        """
+        Number of levels of detail, the full mesh included.
+        """
+        return 1 + len(self.lods)
+
+    def lod(self, level):
+        """
+        Mesh drawn at a level of detail, levels past the end of the chain get the coarsest mesh.
+        """
+        if level == 0 or not self.lods:
+            return self.mesh
+        return self.lods[min(level, len(self.lods)) - 1]
     
-    def draw(self, transform):
+    def draw(self, transform, normal_matrix=None, lod=0):
         self.shader.use()
-        
+        gl_state.bind_vertex_array(self.vao)
+        self.draw_bound(transform, normal_matrix, lod)
+
+    def draw_bound(self, transform, normal_matrix=None, lod=0):
+        """
+        Draw with the shader, material and vertex array of the model already bound, as RenderQueue does.
+        All levels of detail share the vertex array.
+        """
         self.shader.set_mat4("model", transform)
+        # lit shaders take a precomputed normal matrix instead of inverting the model matrix per vertex
+        if normal_matrix is not None and "normalMatrix" in self.shader.uniforms:
+            self.shader.set_mat3("normalMatrix", normal_matrix)
+
+        self.lod(lod).draw()
+
+    def draw_instanced(self, shader: Shader, instance_count):
+        """
+        Draw instance_count copies, the shader reads the model matrix from instance attributes.
+        """
+        shader.use()
 
-        glBindVertexArray(self.vao)
-        glDrawArrays(GL_TRIANGLES, 0, self.vertex_count)
+        gl_state.bind_vertex_array(self.vao)
+        self.mesh.draw_instanced(instance_count)
     
     def destroy(self):
-        glDeleteVertexArrays(1, (self.vao,))
-        glDeleteBuffers(1, (self.vbo,))
+        self.mesh.free()
+        for mesh in self.lods:
+            mesh.free()
 
 
 class TexturedModel(Model):
     material: Material
     
-    def draw(self, transform):
+    def draw(self, transform, normal_matrix=None, lod=0):
         self.material.use()
-        super().draw(transform)
+        super().draw(transform, normal_matrix, lod)
+
+    def draw_instanced(self, shader: Shader, instance_count):
+        self.material.use()
+        super().draw_instanced(shader, instance_count)
         
     def destroy(self):
         self.material.destroy()
@@ -48,139 +104,58 @@ class Triangle:
             0.5, -0.5, 0.0, 0.0, 1.0, 0.0, 0.75, 0.75,
             0.0,  0.5, 0.0, 0.0, 0.0, 1.0,  0.5, 0.25
         )
-        self.vertices = glm.array(glm.float32, *self.vertices)
-
-        self.vertex_count = 3
-
-        self.vao = glGenVertexArrays(1)
-        glBindVertexArray(self.vao)
-
-        self.vbo = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-
-        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices.ptr, GL_STATIC_DRAW)
-
-        glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
-
-        glEnableVertexAttribArray(1)
-        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE,
-                              32, ctypes.c_void_p(12))
-
-        glEnableVertexAttribArray(2)
-        glVertexAttribPointer(2, 2, GL_FLOAT, GL_FALSE,
-                              32, ctypes.c_void_p(24))
+        self.vertices = np.array(self.vertices, dtype=np.float32).reshape(-1, 8)
+        self.mesh = geometry_pool.allocate(POSITION_COLOR_TEXTURE, self.vertices)
 
     def draw(self, shader: Shader):
         shader.use()
 
         self.texture.use()
 
-        glBindVertexArray(self.vao)
-        glDrawArrays(GL_TRIANGLES, 0, self.vertex_count)
+        gl_state.bind_vertex_array(self.mesh.vao)
+        self.mesh.draw()
         
 
 class OBJModel(TexturedModel):
     
-    def __init__(self, filename, material: Material, shader: Shader):
+    def __init__(self, filename, material: Material, shader: Shader, loader=None, lod_count=1):
+        """
+        Args:
+            filename (str): path to the .obj file
+            material (Material): textures of the model
+            shader (Shader): shader drawing the model
+            loader (AssetLoader): optional, parse the mesh on its workers, the model
+                draws nothing until AssetLoader.update uploads it
+            lod_count (int): levels of detail, the full mesh included, each with half
+                the triangles of the one before, see mesh_cache.load_lods
+        """
         self.material = material
         self.shader = shader
         # x, y, z, s, t, nx, ny, nz
-        self.vertices = self.loadMesh(filename)
-        self.vertices = glm.array(glm.float32, *self.vertices)
-        self.vertex_count = len(self.vertices)//8
+        self.mesh = geometry_pool.allocate(POSITION_TEXTURE_NORMAL, np.zeros((0, 8)), np.zeros(0))
 
-        self.vao = glGenVertexArrays(1)
-        glBindVertexArray(self.vao)
-        
-        self.vbo = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices.ptr, GL_STATIC_DRAW)
-        # position
-        glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
-        # texture
-        glEnableVertexAttribArray(1)
-        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(12))
-        # normal
-        glEnableVertexAttribArray(2)
-        glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(20))
-        
+        if loader is None:
+            self.upload(load_lods(filename, lod_count))
+        else:
+            # an empty mesh at the origin until the real one arrives
+            self.bounds = Bounds(np.zeros((1, 3)))
+            loader.submit(self, load_lods, filename, lod_count, callback=self.upload)
 
-    def loadMesh(self, filename):
-        # raw, unassembled data
-        v = []
-        vt = []
-        vn = []
-
-        # final, assembled and packed result
-        vertices = []
-
-        # open the obj file and read the data
-        with open(filename, 'r') as f:
-            line = f.readline()
-            while line:
-                firstSpace = line.find(" ")
-                flag = line[0:firstSpace]
-                if flag == "v":
-                    # vertex
-                    line = line.replace("v ", "")
-                    line = line.split(" ")
-                    l = [float(x) for x in line]
-                    v.append(l)
-                elif flag == "vt":
-                    # texture coordinate
-                    line = line.replace("vt ", "")
-                    line = line.split(" ")
-                    l = [float(x) for x in line]
-                    vt.append(l)
-                elif flag == "vn":
-                    # normal
-                    line = line.replace("vn ", "")
-                    line = line.split(" ")
-                    l = [float(x) for x in line]
-                    vn.append(l)
-                elif flag == "f":
-                    # face, three or more vertices in v/vt/vn form
-                    line = line.replace("f ", "")
-                    line = line.replace("\n", "")
-                    # get the individual vertices for each line
-                    line = line.split(" ")
-                    faceVertices = []
-                    faceTextures = []
-                    faceNormals = []
-                    for vertex in line:
-                        # break out into [v,vt,vn],
-                        # correct for 0 based indexing.
-                        l = vertex.split("/")
-                        position = int(l[0]) - 1
-                        faceVertices.append(v[position])
-                        texture = int(l[1]) - 1
-                        faceTextures.append(vt[texture])
-                        normal = int(l[2]) - 1
-                        faceNormals.append(vn[normal])
-                    # obj file uses triangle fan format for each face individually.
-                    # unpack each face
-                    triangles_in_face = len(line) - 2
-
-                    vertex_order = []
-                    """
-                        eg. 0,1,2,3 unpacks to vertices: [0,1,2,0,2,3]
-                    """
-                    for i in range(triangles_in_face):
-                        vertex_order.append(0)
-                        vertex_order.append(i+1)
-                        vertex_order.append(i+2)
-                    for i in vertex_order:
-                        for x in faceVertices[i]:
-                            vertices.append(x)
-                        for x in faceTextures[i]:
-                            vertices.append(x)
-                        for x in faceNormals[i]:
-                            vertices.append(x)
-                line = f.readline()
-                
-        return vertices
+    def upload(self, levels):
+        """
+        Replace the meshes in the geometry pool.
+
+        Args:
+            levels (list[tuple[np.ndarray, np.ndarray]]): vertices and indices of every level
+                of detail, level 0 first, as returned by load_lods
+        """
+        self.vertices, self.indices = levels[0]
+        self.bounds = Bounds(self.vertices[:, :3])
+
+        for mesh in (self.mesh, *self.lods):
+            mesh.free()
+        self.mesh = geometry_pool.allocate(POSITION_TEXTURE_NORMAL, self.vertices, self.indices)
+        self.lods = tuple(geometry_pool.allocate(POSITION_TEXTURE_NORMAL, vertices, indices) for vertices, indices in levels[1:])
 
 
 class TexturedCube(TexturedModel):
@@ -238,24 +213,9 @@ class TexturedCube(TexturedModel):
                 -0.5,  0.5,  0.5, 0, 0, 0, 1,  0,
                 -0.5,  0.5, -0.5, 0, 1, 0, 1,  0
             )
-        self.vertices = glm.array(glm.float32, *self.vertices)
-        self.vertex_count = len(self.vertices)//8
-
-        self.vao = glGenVertexArrays(1)
-        glBindVertexArray(self.vao)
-        
-        self.vbo = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices.ptr, GL_STATIC_DRAW)
-
-        glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
-
-        glEnableVertexAttribArray(1)
-        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(12))
-
-        glEnableVertexAttribArray(2)
-        glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(20))
+        self.vertices = np.array(self.vertices, dtype=np.float32).reshape(-1, 8)
+        self.bounds = Bounds(self.vertices[:, :3])
+        self.mesh = geometry_pool.allocate(POSITION_TEXTURE_NORMAL, self.vertices)
 
 
 class ColoredCube(Model):
@@ -311,21 +271,9 @@ class ColoredCube(Model):
                 -0.5,  0.5,  0.5, r, g, b,
                 -0.5,  0.5, -0.5, r, g, b
             )
-        self.vertex_count = len(self.vertices)//6
-        self.vertices = glm.array(glm.float32, *self.vertices)
-
-        self.vao = glGenVertexArrays(1)
-        glBindVertexArray(self.vao)
-
-        self.vbo = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices.ptr, GL_STATIC_DRAW)
-
-        glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(0))
-
-        glEnableVertexAttribArray(1)
-        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(12))
+        self.vertices = np.array(self.vertices, dtype=np.float32).reshape(-1, 6)
+        self.bounds = Bounds(self.vertices[:, :3])
+        self.mesh = geometry_pool.allocate(POSITION_COLOR, self.vertices)
 
 
 class TexturedQuad:
@@ -342,29 +290,16 @@ class TexturedQuad:
             x + w/2, y - h/2, 1, 0,
             x + w/2, y + h/2, 1, 1
         )
-        self.vertices = glm.array(glm.float32, *self.vertices)
-        
-        self.vao = glGenVertexArrays(1)
-        glBindVertexArray(self.vao)
-        self.vbo = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices.ptr, GL_STATIC_DRAW)
-
-        glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 16, ctypes.c_void_p(0))
-
-        glEnableVertexAttribArray(1)
-        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 16, ctypes.c_void_p(8))
+        self.vertices = np.array(self.vertices, dtype=np.float32).reshape(-1, 4)
+        self.mesh = geometry_pool.allocate(SCREEN, self.vertices)
     
     def draw(self):
         self.shader.use()
         
-        glActiveTexture(GL_TEXTURE0)
-        glBindTexture(GL_TEXTURE_2D, self.texture)
+        gl_state.bind_texture(0, self.texture)
         
-        glBindVertexArray(self.vao)
-        glDrawArrays(GL_TRIANGLES, 0, 6)
+        gl_state.bind_vertex_array(self.mesh.vao)
+        self.mesh.draw()
     
     def destroy(self):
-        glDeleteVertexArrays(1, (self.vao,))
-        glDeleteBuffers(1, (self.vbo,))
\ No newline at end of file
+        self.mesh.free()
\ No newline at end of file
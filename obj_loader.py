@@ -0,0 +1,141 @@
+import numpy as np
+
+# record types, by the first two bytes of a line
+_OTHER, _V, _VT, _VN, _F = range(5)
+
+_SPACE = ord(' ')
+_SLASH = ord('/')
+
+
+def load_obj(filename):
+    """
+    Parse a Wavefront OBJ file into an indexed, triangulated mesh.
+
+    The file is read in one go and handled as a single byte array: lines are
+    classified by their prefix, every record type is gathered with a mask and
+    converted with one numpy call, so no Python code runs per line.
+
+    Args:
+        filename (str): path to the .obj file, faces must be in v/vt/vn form
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (n, 8) float32 array of unique x, y, z, s, t, nx, ny, nz vertices
+            and the uint16 or uint32 index of the vertex used by every triangle corner
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    # terminate the last line and pad so the two byte prefix of every line can be read
+    buffer = np.frombuffer(data + b'\n  ', dtype=np.uint8).copy()
+    text = buffer[:-2]
+
+    ends = np.flatnonzero(text == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    first = buffer[starts]
+    second = buffer[starts + 1]
+    blank = (second == _SPACE) | (second == ord('\t'))
+
+    kinds = np.full(len(starts), _OTHER, dtype=np.uint8)
+    kinds[(first == ord('v')) & blank] = _V
+    kinds[(first == ord('v')) & (second == ord('t'))] = _VT
+    kinds[(first == ord('v')) & (second == ord('n'))] = _VN
+    kinds[(first == ord('f')) & blank] = _F
+
+    # blank out the record prefixes so only numbers are left in each line
+    text[starts[kinds != _OTHER]] = _SPACE
+    text[starts[(kinds == _VT) | (kinds == _VN)] + 1] = _SPACE
+
+    byte_kinds = np.repeat(kinds, ends - starts + 1)
+    v = _parse_floats(text, byte_kinds, kinds, _V, 3)
+    vt = _parse_floats(text, byte_kinds, kinds, _VT, 2)
+    vn = _parse_floats(text, byte_kinds, kinds, _VN, 3)
+
+    faces = text[byte_kinds == _F]
+    slashes = np.flatnonzero(faces == _SLASH)
+    faces[slashes] = _SPACE
+    # every corner is a v/vt/vn triple, so each one holds two slashes
+    face_ends = np.cumsum(ends[kinds == _F] - starts[kinds == _F] + 1)
+    corner_counts = np.bincount(np.searchsorted(face_ends, slashes, side='right'), minlength=len(face_ends)) // 2
+    raw = np.fromstring(faces.tobytes(), dtype=np.int64, sep=' ')
+    if raw.size != corner_counts.sum() * 3:
+        raise ValueError(f"{filename}: faces must be in v/vt/vn form")
+    if raw.size == 0:
+        raise ValueError(f"{filename} has no faces")
+
+    # indices are 1 based, or negative relative to the end of each list
+    raw = raw.reshape(-1, 3)
+    corners = np.where(raw < 0, raw + (len(v), len(vt), len(vn)), raw - 1)
+    corners = corners[triangulate_fans(corner_counts).ravel()]
+
+    unique, indices = deduplicate(corners)
+    vertices = np.concatenate((v[unique[:, 0]], vt[unique[:, 1]], vn[unique[:, 2]]), axis=1)
+    return vertices, indices.astype(index_dtype(len(vertices)))
+
+
+def deduplicate(corners):
+    """
+    Build a table of unique (v, vt, vn) triples.
+
+    Unique vertices keep the order in which they are first referenced, so
+    neighbouring triangles keep referring to recently used vertices, which is
+    what the post-transform vertex cache rewards.
+
+    Args:
+        corners (np.ndarray): (n, 3) int array of v, vt, vn indices per triangle corner
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (m, 3) unique triples and the (n,) index of each corner into them
+    """
+    extents = corners.max(axis=0) + 1
+    if int(extents[0]) * int(extents[1]) * int(extents[2]) < 2 ** 63:
+        # one int64 key per triple sorts much faster than the rows
+        keys = corners[:, 0] + extents[0] * (corners[:, 1] + extents[1] * corners[:, 2])
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    else:
+        _, first, inverse = np.unique(corners, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    return corners[first[order]], rank[inverse]
+
+
+def index_dtype(vertex_count):
+    """
+    Smallest index type able to address vertex_count vertices.
+    """
+    return np.uint16 if vertex_count <= 0x10000 else np.uint32
+
+
+def triangulate_fans(corner_counts):
+    """
+    Split polygons into triangle fans.
+
+    eg. a face with corners 0,1,2,3 unpacks to triangles [0,1,2], [0,2,3]
+
+    Args:
+        corner_counts (np.ndarray): number of corners of each polygon, polygons are stored back to back
+
+    Returns:
+        np.ndarray: (n, 3) int64 array of corner indices per triangle
+    """
+    triangle_counts = corner_counts - 2
+    face_starts = np.cumsum(corner_counts) - corner_counts
+    triangle_starts = np.cumsum(triangle_counts) - triangle_counts
+
+    # index of each triangle within its own fan
+    fan_index = np.arange(triangle_counts.sum()) - np.repeat(triangle_starts, triangle_counts)
+    first = np.repeat(face_starts, triangle_counts)
+
+    return np.stack((first, first + fan_index + 1, first + fan_index + 2), axis=1)
+
+
+def _parse_floats(text, byte_kinds, kinds, kind, width):
+    count = np.count_nonzero(kinds == kind)
+    if count == 0:
+        return np.zeros((0, width), dtype=np.float32)
+
+    values = np.fromstring(text[byte_kinds == kind].tobytes(), dtype=np.float32, sep=' ')
+    # drop optional trailing components such as w in "v x y z w" or "vt u v w"
+    return values.reshape(count, -1)[:, :width]
@@ -0,0 +1,92 @@
+from OpenGL import EGL
+from OpenGL.GL import *
+import numpy as np
+
+import ctypes
+import hashlib
+
+from gl_state import gl_state
+
+from typing import Sequence
+
+
+class OffscreenContext:
+
+    def __init__(self, size: Sequence):
+        """
+        OpenGL 4.1 core context without a window, on EGL.
+
+        PyOpenGL picks its platform when OpenGL is first imported, so
+        PYOPENGL_PLATFORM has to be "egl" before anything imports it. Mesa
+        then renders with llvmpipe when there is no GPU, EGL_PLATFORM=surfaceless
+        keeps it from looking for a display server.
+
+        The default framebuffer is a pbuffer of the given size, so code
+        drawing to framebuffer 0 renders offscreen as it would to a window.
+
+        Args:
+            size (Sequence): width and height of the pbuffer in pixels
+        """
+        self.size = tuple(size)
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor))
+
+        config_attributes = (EGL.EGLint * 15)(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8, EGL.EGL_ALPHA_SIZE, 8,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_NONE,
+        )
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        EGL.eglChooseConfig(self.display, config_attributes, ctypes.pointer(config), 1, ctypes.pointer(count))
+        if not count.value:
+            raise RuntimeError("no EGL config with a pbuffer and OpenGL rendering")
+
+        width, height = self.size
+        self.surface = EGL.eglCreatePbufferSurface(
+            self.display, config, (EGL.EGLint * 5)(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE)
+        )
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context_attributes = (EGL.EGLint * 7)(
+            EGL.EGL_CONTEXT_MAJOR_VERSION, 4,
+            EGL.EGL_CONTEXT_MINOR_VERSION, 1,
+            EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+            EGL.EGL_NONE,
+        )
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, context_attributes)
+        EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context)
+        glViewport(0, 0, width, height)
+
+    @property
+    def renderer(self):
+        return f"{glGetString(GL_RENDERER).decode()}, {glGetString(GL_VERSION).decode()}"
+
+    def swap(self):
+        EGL.eglSwapBuffers(self.display, self.surface)
+
+    def read_pixels(self):
+        """
+        Returns:
+            np.ndarray: (height, width, 4) uint8 RGBA pixels of framebuffer 0, bottom row first
+        """
+        width, height = self.size
+        gl_state.bind_framebuffer(0)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        pixels = glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE)
+        glPixelStorei(GL_PACK_ALIGNMENT, 4)
+        return np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, 4)
+
+    def checksum(self):
+        """
+        SHA-256 of the pixels of framebuffer 0, waits for the GPU.
+        """
+        return hashlib.sha256(self.read_pixels().tobytes()).hexdigest()
+
+    def destroy(self):
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroySurface(self.display, self.surface)
+        EGL.eglDestroyContext(self.display, self.context)
+        EGL.eglTerminate(self.display)
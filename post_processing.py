@@ -1,39 +1,315 @@
 from OpenGL.GL import *
+import glm
 
+from gl_state import gl_state
 from models import TexturedQuad
+from shader import Shader
+
+from typing import Sequence
 
 class PostProcessing:
-    
-    def __init__(self, win_size, shader):
+
+    def __init__(self, win_size, shader, graph=None):
+        """
+        Args:
+            win_size (Sequence): width and height of the window in pixels
+            shader (Shader): screen shader drawing the scene texture to the screen
+            graph (PostProcessingGraph): optional chain of passes run by end instead of shader
+        """
         self.shader = shader
-        
+        self.graph = graph
+        self.win_size = tuple(win_size)
+
         self.fbo = glGenFramebuffers(1)
-        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
-        
+        gl_state.bind_framebuffer(self.fbo)
+
+        # half floats, so lights can add up past 1 for tone mapping and bloom
         self.textureColorBuffer = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, self.textureColorBuffer)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, win_size[0], win_size[1], 0, GL_RGB, GL_UNSIGNED_BYTE, None)
+        self.rbo = glGenRenderbuffers(1)
+        self._allocate_scene()
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
         glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.textureColorBuffer, 0)
-        
-        self.rbo = glGenRenderbuffers(1)
-        glBindRenderbuffer(GL_RENDERBUFFER, self.rbo)
-        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH24_STENCIL8, win_size[0], win_size[1])
         glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_STENCIL_ATTACHMENT, GL_RENDERBUFFER, self.rbo)
-        
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
-        
+
+        gl_state.bind_framebuffer(0)
+
         self.quad = TexturedQuad(0, 0, 2, 2, self.textureColorBuffer, self.shader)
-        
+
     def begin(self):
-        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        gl_state.bind_framebuffer(self.fbo)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glEnable(GL_DEPTH_TEST)
-    
+        gl_state.enable(GL_DEPTH_TEST)
+
     def end(self):
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        gl_state.bind_framebuffer(0)
         glClear(GL_COLOR_BUFFER_BIT)
-        glDisable(GL_DEPTH_TEST)
-        
-        self.quad.draw()
\ No newline at end of file
+        gl_state.disable(GL_DEPTH_TEST)
+
+        if self.graph is not None:
+            self.graph.execute(self.textureColorBuffer, self.win_size)
+        else:
+            self.quad.draw()
+        gl_state.enable(GL_DEPTH_TEST)
+
+    def resize(self, win_size):
+        """
+        Reallocate the scene texture and depth buffer for a new window size, the graph's targets follow on their own.
+        """
+        self.win_size = tuple(win_size)
+        self._allocate_scene()
+
+    def destroy(self):
+        self.quad.destroy()
+        gl_state.forget_framebuffer(self.fbo)
+        gl_state.forget_textures((self.textureColorBuffer,))
+        glDeleteFramebuffers(1, (self.fbo,))
+        glDeleteTextures(1, (self.textureColorBuffer,))
+        glDeleteRenderbuffers(1, (self.rbo,))
+
+    def _allocate_scene(self):
+        width, height = self.win_size
+        gl_state.bind_texture(0, self.textureColorBuffer)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB16F, width, height, 0, GL_RGB, GL_FLOAT, None)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.rbo)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH24_STENCIL8, width, height)
+
+
+class RenderTarget:
+
+    def __init__(self, size: Sequence, internal_format):
+        """
+        Framebuffer with a single color texture and no depth, the output of one post processing pass.
+
+        Args:
+            size (Sequence): width and height in pixels
+            internal_format (int): sized GL format of the texture
+        """
+        self.size = tuple(size)
+        self.internal_format = internal_format
+
+        self.texture = glGenTextures(1)
+        gl_state.bind_texture(0, self.texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, internal_format, size[0], size[1], 0, GL_RGBA, GL_FLOAT, None)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+
+        self.fbo = glGenFramebuffers(1)
+        gl_state.bind_framebuffer(self.fbo)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.texture, 0)
+        gl_state.bind_framebuffer(0)
+
+    def destroy(self):
+        gl_state.forget_framebuffer(self.fbo)
+        gl_state.forget_textures((self.texture,))
+        glDeleteFramebuffers(1, (self.fbo,))
+        glDeleteTextures(1, (self.texture,))
+
+
+class RenderTargetPool:
+
+    def __init__(self):
+        """
+        Render targets kept across frames and handed out by size and format.
+
+        A target acquired and released within a frame is handed out again to
+        the next pass asking for the same size and format, so a chain of
+        passes ping-pongs between a few targets instead of owning one each.
+        Targets no pass acquired during a frame, such as those of the old
+        size after the window was resized, are deleted by end_frame.
+        """
+        # (width, height, internal format) -> targets not in use
+        self.idle: dict[tuple, list[RenderTarget]] = {}
+        self.allocated = 0
+        # targets acquired since the last end_frame
+        self.acquired: set[RenderTarget] = set()
+
+    def acquire(self, size: Sequence, internal_format):
+        """
+        Returns:
+            RenderTarget: target of that size and format, which the caller owns until release
+        """
+        targets = self.idle.get((*size, internal_format))
+        if targets:
+            target = targets.pop()
+        else:
+            target = RenderTarget(size, internal_format)
+            self.allocated += 1
+        self.acquired.add(target)
+        return target
+
+    def release(self, target: RenderTarget):
+        self.idle.setdefault((*target.size, target.internal_format), []).append(target)
+
+    def end_frame(self):
+        """
+        Delete the idle targets no pass used since the last call.
+        """
+        for key, targets in list(self.idle.items()):
+            kept = [target for target in targets if target in self.acquired]
+            for target in targets:
+                if target not in self.acquired:
+                    target.destroy()
+                    self.allocated -= 1
+            if kept:
+                self.idle[key] = kept
+            else:
+                del self.idle[key]
+        self.acquired = set()
+
+    def destroy(self):
+        for targets in self.idle.values():
+            for target in targets:
+                target.destroy()
+        self.idle = {}
+        self.allocated = 0
+
+
+class PostPass:
+
+    def __init__(self, name, shader: Shader, inputs: dict[str, str], scale=1.0, internal_format=GL_RGBA16F,
+                 uniforms: dict[str, float] | None = None):
+        """
+        One fullscreen pass of a PostProcessingGraph.
+
+        Args:
+            name (str): name later passes read the output by
+            shader (Shader): screen shader of the pass
+            inputs (dict[str, str]): sampler name -> name of the pass it reads, "scene" for the scene texture
+            scale (float): size of the output relative to the window
+            internal_format (int): sized GL format of the output
+            uniforms (dict[str, float]): float uniforms set before drawing, for shaders shared by several passes
+        """
+        self.name = name
+        self.shader = shader
+        self.inputs = inputs
+        self.scale = scale
+        self.internal_format = internal_format
+        self.uniforms = uniforms or {}
+
+
+class PostProcessingGraph:
+
+    def __init__(self, pool: RenderTargetPool | None = None):
+        """
+        Post processing chain of fullscreen passes, the last one draws to the screen.
+
+        Passes are run in the order they were added, each reading the scene
+        texture or the output of earlier passes. Every output is acquired
+        from the pool right before its pass and released after the last pass
+        reading it, so the pool only holds as many targets as are alive at
+        once. Output sizes follow the window size given to execute.
+
+        Shaders that declare a texelSize uniform get one over the size of
+        their first input, for filters sampling around a pixel.
+
+        Args:
+            pool (RenderTargetPool): pool to take the targets from, a new one by default
+        """
+        self.pool = pool if pool is not None else RenderTargetPool()
+        self.passes: list[PostPass] = []
+        self.quad = TexturedQuad(0, 0, 2, 2, 0, None)
+
+    def add(self, name, shader: Shader, inputs: dict[str, str], scale=1.0, internal_format=GL_RGBA16F,
+            uniforms: dict[str, float] | None = None):
+        """
+        Append a pass, see PostPass for the arguments.
+        """
+        names = {"scene"} | {post_pass.name for post_pass in self.passes}
+        for source in inputs.values():
+            if source not in names:
+                raise ValueError(f"post processing pass '{name}' reads '{source}', which no earlier pass writes")
+        self.passes.append(PostPass(name, shader, inputs, scale, internal_format, uniforms))
+
+    def execute(self, scene_texture, win_size: Sequence):
+        """
+        Run every pass on a scene texture of the window's size, leaving framebuffer 0 bound.
+        """
+        # index of the last pass reading each output
+        last_reads = {}
+        for i, post_pass in enumerate(self.passes):
+            last_reads[post_pass.name] = i
+            for source in post_pass.inputs.values():
+                last_reads[source] = i
+
+        # name -> (texture, size)
+        outputs = {"scene": (scene_texture, tuple(win_size))}
+        targets: dict[str, RenderTarget] = {}
+        gl_state.bind_vertex_array(self.quad.mesh.vao)
+        for i, post_pass in enumerate(self.passes):
+            if i == len(self.passes) - 1:
+                size = tuple(win_size)
+                gl_state.bind_framebuffer(0)
+            else:
+                size = (max(1, int(win_size[0] * post_pass.scale)), max(1, int(win_size[1] * post_pass.scale)))
+                target = targets[post_pass.name] = self.pool.acquire(size, post_pass.internal_format)
+                outputs[post_pass.name] = (target.texture, size)
+                gl_state.bind_framebuffer(target.fbo)
+            glViewport(0, 0, *size)
+
+            shader = post_pass.shader
+            shader.use()
+            for unit, (sampler, source) in enumerate(post_pass.inputs.items()):
+                gl_state.bind_texture(unit, outputs[source][0])
+                shader.set_int(sampler, unit)
+            if "texelSize" in shader.uniforms and post_pass.inputs:
+                input_size = outputs[next(iter(post_pass.inputs.values()))][1]
+                shader.set_vec2("texelSize", glm.vec2(1 / input_size[0], 1 / input_size[1]))
+            for uniform, value in post_pass.uniforms.items():
+                shader.set_float(uniform, value)
+            self.quad.mesh.draw()
+
+            # outputs nothing reads anymore go back to the pool for the next passes
+            for name in [name for name, target in targets.items() if last_reads[name] <= i]:
+                self.pool.release(targets.pop(name))
+
+        glViewport(0, 0, *win_size)
+        self.pool.end_frame()
+
+    def destroy(self):
+        self.quad.destroy()
+        self.pool.destroy()
+
+
+def bloom_graph(downsample: Shader, upsample: Shader, tone_map: Shader, fxaa: Shader, levels=5, threshold=1.0,
+                exposure=1.0, bloom_strength=0.2, pool: RenderTargetPool | None = None):
+    """
+    Bloom, tone mapping and FXAA.
+
+    The bright parts of the scene are downsampled into a chain of halving
+    sizes and upsampled back up, which spreads them wide at little cost.
+    Each level on the way up adds the upsampled smaller level to the
+    downsampled level of its own size, so every scale contributes to the
+    bloom, and the levels of the way down are released as soon as the way
+    up has read them. The tone mapping pass adds the bloom to the
+    scene and maps it to 8 bits, FXAA then smooths the edges on the way to
+    the screen.
+
+    Args:
+        downsample (Shader): screen_vertex.vert with post_downsample.frag
+        upsample (Shader): screen_vertex.vert with post_upsample.frag
+        tone_map (Shader): screen_vertex.vert with post_tone_map.frag
+        fxaa (Shader): screen_vertex.vert with post_fxaa.frag
+        levels (int): sizes of the bloom chain, from half the window size down
+        threshold (float): brightness above which the scene blooms
+        exposure (float): scale of the scene before tone mapping
+        bloom_strength (float): weight of the bloom added to the scene
+        pool (RenderTargetPool): pool to take the targets from, a new one by default
+
+    Returns:
+        PostProcessingGraph: the chain, to pass to PostProcessing
+    """
+    graph = PostProcessingGraph(pool)
+    graph.add("down0", downsample, {"image": "scene"}, 0.5, uniforms={"threshold": threshold})
+    for level in range(1, levels):
+        graph.add(f"down{level}", downsample, {"image": f"down{level - 1}"}, 0.5 ** (level + 1), uniforms={"threshold": 0.0})
+    bloom = f"down{levels - 1}"
+    for level in reversed(range(levels - 1)):
+        graph.add(f"up{level}", upsample, {"image": bloom, "base": f"down{level}"}, 0.5 ** (level + 1))
+        bloom = f"up{level}"
+    graph.add("tone_mapped", tone_map, {"image": "scene", "bloom": bloom}, internal_format=GL_RGBA8,
+              uniforms={"exposure": exposure, "bloomStrength": bloom_strength})
+    graph.add("screen", fxaa, {"image": "tone_mapped"})
+    return graph
@@ -0,0 +1,239 @@
+from OpenGL.GL import *
+import numpy as np
+
+from collections import deque
+from contextlib import contextmanager
+import ctypes
+import json
+import time
+
+from gl_state import gl_state
+
+PERCENTILES = (50, 95, 99)
+
+
+class Profiler:
+
+    def __init__(self, history=600, latency=3):
+        """
+        Per frame CPU and GPU times of named scopes, and counters of draws and uploads.
+
+        A scope records its CPU time with perf_counter_ns, and its GPU time
+        with a GL_TIME_ELAPSED query. Queries are read back latency frames
+        later, once the GPU finished them, so reading never stalls the
+        frame. Only one elapsed time query can run at once, so scopes nested
+        in another scope get a CPU time only.
+
+        Counters are added to from anywhere with count and draw and start
+        from zero every frame. State changes are taken from gl_state.
+
+        Args:
+            history (int): frames kept for the report and the exports
+            latency (int): frames to wait before reading back GPU times
+        """
+        self.enabled = True
+        self.latency = latency
+        # finished frames, oldest first
+        self.frames: deque[dict] = deque(maxlen=history)
+        self.frame_index = 0
+        self.origin = time.perf_counter_ns()
+
+        # frame being recorded, None outside of begin_frame / end_frame
+        self.frame = None
+        self.frame_start = 0
+        self.counters: dict[str, int] = {}
+
+        # (scope, query) of the current frame, then (frame, [(scope, query)]) waiting for their GPU times
+        self.pending_queries = []
+        self.pending: deque[tuple[dict, list]] = deque()
+        self.free_queries = []
+        self.query_running = False
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter_ns()
+        self.frame = {
+            "frame": self.frame_index,
+            "start_ms": (self.frame_start - self.origin) / 1e6,
+            "cpu_ms": {},
+            "gpu_ms": {},
+            # (scope, start in ms since the profiler was created, duration in ms)
+            "events": [],
+        }
+        self.frame_index += 1
+
+    @contextmanager
+    def scope(self, name):
+        """
+        Time the enclosed block, as part of the current frame.
+        """
+        frame = self.frame
+        if not self.enabled or frame is None:
+            yield
+            return
+
+        query = None
+        if not self.query_running:
+            query = self.free_queries.pop() if self.free_queries else int(glGenQueries(1)[0])
+            glBeginQuery(GL_TIME_ELAPSED, query)
+            self.query_running = True
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            if query is not None:
+                glEndQuery(GL_TIME_ELAPSED)
+                self.query_running = False
+                self.pending_queries.append((name, query))
+            elapsed = (end - start) / 1e6
+            frame["cpu_ms"][name] = frame["cpu_ms"].get(name, 0.0) + elapsed
+            frame["events"].append((name, (start - self.origin) / 1e6, elapsed))
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def draw(self, triangles, calls=1):
+        """
+        Count draw calls and the triangles they submit.
+        """
+        counters = self.counters
+        counters["draw calls"] = counters.get("draw calls", 0) + calls
+        counters["triangles"] = counters.get("triangles", 0) + triangles
+
+    def end_frame(self):
+        """
+        Close the current frame and read back the GPU times that are ready, call before gl_state.end_frame.
+        """
+        frame = self.frame
+        self.frame = None
+        if frame is not None and self.enabled:
+            frame["frame_ms"] = (time.perf_counter_ns() - self.frame_start) / 1e6
+            frame["counters"] = {
+                **self.counters, "state changes": gl_state.issued, "state changes skipped": gl_state.elided
+            }
+            self.frames.append(frame)
+            self.pending.append((frame, self.pending_queries))
+        self.pending_queries = []
+        self.counters = {}
+        self._read_queries()
+
+    def reset(self, history=None):
+        """
+        Forget the recorded frames, for example those of a warm up.
+
+        Args:
+            history (int): frames kept from now on, unchanged by default
+        """
+        self.frames = deque(maxlen=history or self.frames.maxlen)
+
+    def finish(self):
+        """
+        Wait for the GPU and read back every GPU time still pending, at the end of a run.
+        """
+        glFinish()
+        self._read_queries(0)
+
+    def summary(self):
+        """
+        Percentiles of the frame time and of every scope, and the mean of every counter, over the history.
+
+        Returns:
+            dict: {"frames", "frame_ms": {"p50", "p95", "p99", "mean"}, "cpu_ms": {scope: ...},
+                "gpu_ms": {scope: ...}, "counters": {name: mean}}
+        """
+        frames = list(self.frames)
+        summary = {"frames": len(frames), "frame_ms": _percentiles([frame["frame_ms"] for frame in frames])}
+        for kind in ("cpu_ms", "gpu_ms"):
+            names = dict.fromkeys(name for frame in frames for name in frame[kind])
+            summary[kind] = {
+                name: _percentiles([frame[kind][name] for frame in frames if name in frame[kind]]) for name in names
+            }
+        names = dict.fromkeys(name for frame in frames for name in frame["counters"])
+        summary["counters"] = {
+            name: float(np.mean([frame["counters"].get(name, 0) for frame in frames])) for name in names
+        }
+        return summary
+
+    def report(self):
+        """
+        The summary as text, one line per scope.
+        """
+        summary = self.summary()
+        header = "p50 / p95 / p99 ms"
+        lines = [f"{summary['frames']} frames, frame time {_format(summary['frame_ms'])} ({header})"]
+        width = max((len(name) for name in summary["cpu_ms"]), default=0)
+        for name, cpu in summary["cpu_ms"].items():
+            gpu = summary["gpu_ms"].get(name)
+            lines.append(f"  {name:<{width}}  cpu {_format(cpu)}" + (f"  gpu {_format(gpu)}" if gpu else ""))
+        for name, mean in summary["counters"].items():
+            lines.append(f"  {name}: {mean:.1f} per frame")
+        return "\n".join(lines)
+
+    def export_json(self, filename):
+        """
+        Write the summary and every frame in the history to a JSON file.
+        """
+        frames = [{key: value for key, value in frame.items() if key != "events"} for frame in self.frames]
+        with open(filename, "w") as f:
+            json.dump({"summary": self.summary(), "frames": frames}, f, indent=1)
+
+    def export_chrome_trace(self, filename):
+        """
+        Write the history in the Chrome trace event format, for chrome://tracing or Perfetto.
+
+        Scopes are complete events on a CPU track. GPU times are placed on a
+        second track at the start of their scope, the elapsed time queries do
+        not say when the GPU ran them. Counters are counter events at the start
+        of their frame.
+        """
+        events = []
+        for frame in self.frames:
+            start = frame["start_ms"] * 1000
+            events.append({"name": "frame", "ph": "X", "ts": start, "dur": frame["frame_ms"] * 1000, "pid": 0, "tid": 0,
+                           "args": {"frame": frame["frame"]}})
+            for name, scope_start, elapsed in frame["events"]:
+                events.append({"name": name, "ph": "X", "ts": scope_start * 1000, "dur": elapsed * 1000, "pid": 0, "tid": 0})
+                if name in frame["gpu_ms"]:
+                    events.append({"name": name, "ph": "X", "ts": scope_start * 1000, "dur": frame["gpu_ms"][name] * 1000,
+                                   "pid": 0, "tid": 1})
+            for name, value in frame["counters"].items():
+                events.append({"name": name, "ph": "C", "ts": start, "pid": 0, "args": {name: value}})
+        events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": 0, "args": {"name": "CPU"}})
+        events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": 1, "args": {"name": "GPU"}})
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def destroy(self):
+        queries = self.free_queries + [query for _, queries in self.pending for _, query in queries]
+        if queries:
+            glDeleteQueries(len(queries), queries)
+        self.free_queries = []
+        self.pending.clear()
+
+    def _read_queries(self, latency=None):
+        # frames older than the latency are read once their last query finished, queries finish in order
+        latency = self.latency if latency is None else latency
+        while len(self.pending) > latency:
+            frame, queries = self.pending[0]
+            if queries and not glGetQueryObjectiv(queries[-1][1], GL_QUERY_RESULT_AVAILABLE):
+                break
+            self.pending.popleft()
+            result = ctypes.c_uint64()
+            for name, query in queries:
+                glGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(result))
+                frame["gpu_ms"][name] = frame["gpu_ms"].get(name, 0.0) + result.value / 1e6
+                self.free_queries.append(query)
+
+
+def _percentiles(values):
+    if not values:
+        return {f"p{p}": 0.0 for p in PERCENTILES} | {"mean": 0.0}
+    return {f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))} | {"mean": float(np.mean(values))}
+
+
+def _format(stats):
+    return " / ".join(f"{stats[f'p{p}']:.2f}" for p in PERCENTILES)
+
+
+# there is a single GL context, so the whole program shares one profiler
+profiler = Profiler()
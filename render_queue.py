@@ -0,0 +1,141 @@
+import numpy as np
+
+from gl_state import gl_state
+from models import Model
+
+from typing import Sequence
+
+
+class RenderQueue:
+
+    def __init__(self):
+        """
+        Collects the draws of a frame and submits them sorted by shader, material, model and depth.
+
+        Sorting puts every draw sharing a program, textures and vertex array
+        next to each other, so Shader.use, Material.use and the vertex array
+        bind happen once per group instead of once per entity. Within a group
+        draws go front to back, so early depth testing rejects the fragments
+        of hidden entities.
+
+        Switches are counted twice, once for the order the draws were
+        submitted in and once for the sorted order, see end_frame.
+        """
+        # (model, transform, normal matrix, level of detail) per draw, with its world space center kept apart for the depth sort
+        self.items = []
+        self.centers = []
+
+        # program, texture and vertex array switches, as submitted and as drawn
+        self.unsorted = SwitchCount()
+        self.sorted = SwitchCount()
+        # counts of the last finished frame
+        self.frame_unsorted = SwitchCount()
+        self.frame_sorted = SwitchCount()
+
+    def __len__(self):
+        return len(self.items)
+
+    def submit(self, model: Model, transform, normal_matrix=None, center: Sequence = (0, 0, 0), lod=0):
+        """
+        Args:
+            model (Model): model to draw
+            transform: (4, 4) column major model matrix
+            normal_matrix: optional (3, 3) column major normal matrix
+            center (Sequence): x, y, z world space center, used for the depth
+            lod (int): level of detail to draw the model at
+        """
+        self.items.append((model, transform, normal_matrix, lod))
+        self.centers.append(center)
+
+    def submit_entities(self, entities: Sequence):
+        """
+        Submit every entity with the transform, world space bounding sphere center and level of detail of its store row.
+        """
+        for entity in entities:
+            store = entity.store
+            self.submit(entity.model, entity.transform_matrix, entity.normal_matrix, store.world_centers[entity.row],
+                        store.lods[entity.row])
+
+    def flush(self, eye: Sequence):
+        """
+        Sort and draw everything submitted since the last flush, then empty the queue.
+
+        Args:
+            eye (Sequence): x, y, z camera position
+        """
+        items = self.items
+        if not items:
+            return
+
+        centers = np.asarray(self.centers, dtype=np.float32).reshape(-1, 3)
+        depths = ((centers - np.asarray(eye, dtype=np.float32)) ** 2).sum(axis=1).tolist()
+        keys = [draw_key(model, depth) for (model, _, _, _), depth in zip(items, depths)]
+        order = sorted(range(len(items)), key=keys.__getitem__)
+
+        self.unsorted.add(keys)
+        self.sorted.add([keys[i] for i in order])
+
+        shader = material = vao = None
+        for i in order:
+            model, transform, normal_matrix, lod = items[i]
+            if model.shader is not shader:
+                shader = model.shader
+                shader.use()
+            # models without a material leave the texture units as they are
+            if model.material is not None and model.material is not material:
+                material = model.material
+                material.use()
+            if model.vao != vao:
+                vao = model.vao
+                gl_state.bind_vertex_array(vao)
+            model.draw_bound(transform, normal_matrix, lod)
+
+        self.items = []
+        self.centers = []
+
+    def end_frame(self):
+        """
+        Publish this frame's counts in frame_unsorted / frame_sorted and start counting the next frame.
+        """
+        self.frame_unsorted = self.unsorted
+        self.frame_sorted = self.sorted
+        self.unsorted = SwitchCount()
+        self.sorted = SwitchCount()
+
+
+def draw_key(model: Model, depth):
+    """
+    Sort key of one draw, (program, textures, vertex array, squared distance to the camera).
+    """
+    textures = tuple(texture.id for texture in model.material.textures) if model.material is not None else ()
+    return (model.shader.ID, textures, model.vao, depth)
+
+
+class SwitchCount:
+
+    def __init__(self):
+        self.programs = 0
+        self.textures = 0
+        self.vertex_arrays = 0
+
+    def add(self, keys):
+        """
+        Count the state changes needed to draw keys in this order, starting from nothing bound.
+        """
+        program = vao = None
+        # texture unit -> texture
+        bound = {}
+        for key_program, textures, key_vao, _ in keys:
+            if key_program != program:
+                program = key_program
+                self.programs += 1
+            for unit, texture in enumerate(textures):
+                if bound.get(unit) != texture:
+                    bound[unit] = texture
+                    self.textures += 1
+            if key_vao != vao:
+                vao = key_vao
+                self.vertex_arrays += 1
+
+    def __str__(self):
+        return f"{self.programs} programs, {self.textures} textures, {self.vertex_arrays} vaos"
@@ -1,6 +1,12 @@
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
 import glm
+import numpy as np
+
+import warnings
+
+from gl_state import gl_state
+from profiler import profiler
 
 class Shader:
     
@@ -18,29 +24,97 @@ class Shader:
         )
         
         self.ID = shader
+        self.uniforms = self.query_uniforms()
+        self.unknown_uniforms = set()
+
+    def query_uniforms(self):
+        """
+        Look up the location of every active uniform once, after linking.
+
+        Arrays of basic types are listed by the driver as "name[0]", so the
+        whole array and each element are added under their own names.
+
+        Returns:
+            dict[str, int]: uniform name to location
+        """
+        locations = {}
+        for i in range(glGetProgramiv(self.ID, GL_ACTIVE_UNIFORMS)):
+            name, size, _ = glGetActiveUniform(self.ID, i)
+            name = name.decode()
+
+            names = [name]
+            if name.endswith("[0]"):
+                base = name[:-3]
+                names = [base] + [f"{base}[{k}]" for k in range(size)]
+
+            for uniform in names:
+                location = glGetUniformLocation(self.ID, uniform)
+                # members of uniform blocks have no location
+                if location != -1:
+                    locations[uniform] = int(location)
+        return locations
+
+    def location(self, name):
+        """
+        Location of a uniform, for callers that want to keep the handle.
+
+        Args:
+            name (str | int): uniform name, or an already resolved location
+
+        Returns:
+            int: location, -1 for names that are not active in the program
+        """
+        if isinstance(name, int):
+            return name
+
+        location = self.uniforms.get(name)
+        if location is None:
+            if name not in self.unknown_uniforms:
+                self.unknown_uniforms.add(name)
+                warnings.warn(f"uniform '{name}' is not active in shader program {self.ID}", stacklevel=3)
+            return -1
+        return location
+
+    def bind_uniform_block(self, name, binding):
+        """
+        Point a uniform block at a uniform buffer binding point, blocks the program does not use are skipped.
+        """
+        index = glGetUniformBlockIndex(self.ID, name)
+        if index != GL_INVALID_INDEX:
+            glUniformBlockBinding(self.ID, index, binding)
         
     def use(self):
-        glUseProgram(self.ID)
+        gl_state.use_program(self.ID)
         
     def set_int(self, name, value):
-        glUniform1i(glGetUniformLocation(self.ID, name), value)
+        glUniform1i(self.location(name), value)
+        profiler.count("uniform uploads")
         
     def set_float(self, name, value):
-        glUniform1f(glGetUniformLocation(self.ID, name), value)
+        glUniform1f(self.location(name), value)
+        profiler.count("uniform uploads")
         
     def set_vec2(self, name, value):
-        glUniform2fv(glGetUniformLocation(self.ID, name), 1, glm.value_ptr(value))
+        glUniform2fv(self.location(name), 1, _pointer(value))
+        profiler.count("uniform uploads")
         
     def set_vec3(self, name, value):
-        glUniform3fv(glGetUniformLocation(self.ID, name), 1, glm.value_ptr(value))
+        glUniform3fv(self.location(name), 1, _pointer(value))
+        profiler.count("uniform uploads")
         
     def set_mat2(self, name, value):
-        glUniformMatrix2fv(glGetUniformLocation(self.ID, name), 1, GL_FALSE, glm.value_ptr(value))
+        glUniformMatrix2fv(self.location(name), 1, GL_FALSE, _pointer(value))
+        profiler.count("uniform uploads")
         
     def set_mat3(self, name, value):
-        glUniformMatrix3fv(glGetUniformLocation(self.ID, name), 1, GL_FALSE, glm.value_ptr(value))
+        glUniformMatrix3fv(self.location(name), 1, GL_FALSE, _pointer(value))
+        profiler.count("uniform uploads")
         
     def set_mat4(self, name, value):
-        glUniformMatrix4fv(glGetUniformLocation(self.ID, name), 1, GL_FALSE, glm.value_ptr(value))
+        glUniformMatrix4fv(self.location(name), 1, GL_FALSE, _pointer(value))
+        profiler.count("uniform uploads")
+
 
-        
\ No newline at end of file
+def _pointer(value):
+    # numpy arrays (column major for matrices) are passed as they are, glm values by pointer
+    return value if isinstance(value, np.ndarray) else glm.value_ptr(value)
@@ -0,0 +1,61 @@
+#version 330 core
+out vec4 FragColor;
+
+// DirLight lives in a std140 uniform block, members are ordered so the
+// struct packs into 64 bytes (see entities.py)
+struct DirLight {
+    vec3 direction;
+
+    vec3 ambient;
+    vec3 diffuse;
+    vec3 specular;
+};
+
+layout (std140) uniform FrameData {
+    mat4 projView;
+    vec3 viewPos;
+};
+
+// the same block as in fragment.frag, the cluster parameters are unused here
+layout (std140) uniform Lights {
+    DirLight dirLight;
+    vec4 clusterCounts;
+    vec4 clusterScale;
+    vec4 depthRange;
+};
+
+// world position and coverage, normal and shininess, albedo and specular intensity,
+// coverage is 1 for lit and 2 for unlit pixels
+uniform sampler2D gPosition;
+uniform sampler2D gNormal;
+uniform sampler2D gAlbedoSpecular;
+
+void main()
+{
+    ivec2 pixel = ivec2(gl_FragCoord.xy);
+    vec4 position = texelFetch(gPosition, pixel, 0);
+    // pixels no geometry was drawn to keep the clear color
+    if (position.w == 0.0)
+        discard;
+    vec4 normalShininess = texelFetch(gNormal, pixel, 0);
+    vec4 albedoSpecular = texelFetch(gAlbedoSpecular, pixel, 0);
+    if (position.w == 2.0) {
+        FragColor = vec4(albedoSpecular.rgb, 1.0);
+        return;
+    }
+
+    vec3 normal = normalShininess.xyz;
+    vec3 viewDir = normalize(viewPos - position.xyz);
+    vec3 lightDir = normalize(-dirLight.direction);
+
+    float diff = max(dot(normal, lightDir), 0.0);
+
+    vec3 reflectDir = reflect(-lightDir, normal);
+    float spec = pow(max(dot(viewDir, reflectDir), 0.0), normalShininess.w);
+
+    vec3 ambient = dirLight.ambient * albedoSpecular.rgb;
+    vec3 diffuse = dirLight.diffuse * diff * albedoSpecular.rgb;
+    vec3 specular = dirLight.specular * spec * albedoSpecular.a;
+
+    FragColor = vec4(ambient + diffuse + specular, 1.0);
+}
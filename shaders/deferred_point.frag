@@ -0,0 +1,54 @@
+#version 330 core
+out vec4 FragColor;
+
+layout (std140) uniform FrameData {
+    mat4 projView;
+    vec3 viewPos;
+};
+
+// world position and coverage, normal and shininess, albedo and specular intensity
+uniform sampler2D gPosition;
+uniform sampler2D gNormal;
+uniform sampler2D gAlbedoSpecular;
+
+uniform samplerBuffer pointLights;
+
+flat in int lightIndex;
+
+void main()
+{
+    ivec2 pixel = ivec2(gl_FragCoord.xy);
+    vec4 position = texelFetch(gPosition, pixel, 0);
+    // only lit pixels, see deferred_directional.frag
+    if (position.w != 1.0)
+        discard;
+    vec4 normalShininess = texelFetch(gNormal, pixel, 0);
+    vec4 albedoSpecular = texelFetch(gAlbedoSpecular, pixel, 0);
+
+    vec4 positionRadius = texelFetch(pointLights, 4 * lightIndex);
+    vec4 ambientConstant = texelFetch(pointLights, 4 * lightIndex + 1);
+    vec4 diffuseLinear = texelFetch(pointLights, 4 * lightIndex + 2);
+    vec4 specularQuadratic = texelFetch(pointLights, 4 * lightIndex + 3);
+
+    vec3 normal = normalShininess.xyz;
+    vec3 fragPos = position.xyz;
+    vec3 viewDir = normalize(viewPos - fragPos);
+    vec3 lightDir = normalize(positionRadius.xyz - fragPos);
+
+    float diff = max(dot(normal, lightDir), 0.0);
+
+    vec3 reflectDir = reflect(-lightDir, normal);
+    float spec = pow(max(dot(viewDir, reflectDir), 0.0), normalShininess.w);
+
+    float distance = length(positionRadius.xyz - fragPos);
+    float attenuation = 1.0 / (ambientConstant.w + diffuseLinear.w * distance + specularQuadratic.w * (distance * distance));
+    // fade out to nothing at the radius, as in fragment.frag, so the volume holds all of the light
+    float falloff = clamp(1.0 - pow(distance / positionRadius.w, 4.0), 0.0, 1.0);
+    attenuation *= falloff * falloff;
+
+    vec3 ambient = ambientConstant.rgb * albedoSpecular.rgb;
+    vec3 diffuse = diffuseLinear.rgb * diff * albedoSpecular.rgb;
+    vec3 specular = specularQuadratic.rgb * spec * albedoSpecular.a;
+
+    FragColor = vec4((ambient + diffuse + specular) * attenuation, 1.0);
+}
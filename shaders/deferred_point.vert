@@ -0,0 +1,21 @@
+#version 330 core
+
+// unit light volume, scaled to each light's radius
+layout (location = 0) in vec3 aPos;
+
+layout (std140) uniform FrameData {
+    mat4 projView;
+    vec3 viewPos;
+};
+
+// one light per instance, four texels each (see clustered_lighting.py)
+uniform samplerBuffer pointLights;
+
+flat out int lightIndex;
+
+void main()
+{
+    lightIndex = gl_InstanceID;
+    vec4 positionRadius = texelFetch(pointLights, 4 * gl_InstanceID);
+    gl_Position = projView * vec4(positionRadius.xyz + aPos * positionRadius.w, 1.0);
+}
@@ -1,5 +1,9 @@
 #version 330 core
-out vec4 FragColor;
+layout (location = 0) out vec4 FragColor;
+// G-buffer of the deferred geometry pass (see deferred.py)
+layout (location = 1) out vec4 gPosition;
+layout (location = 2) out vec4 gNormal;
+layout (location = 3) out vec4 gAlbedoSpecular;
 
 struct Material {
     sampler2D diffuse;
@@ -7,6 +11,8 @@ struct Material {
     float shininess;
 }; 
 
+// DirLight lives in a std140 uniform block, members are ordered so the
+// struct packs into 64 bytes (see entities.py)
 struct DirLight {
     vec3 direction;
 
@@ -15,16 +21,19 @@ struct DirLight {
     vec3 specular;
 };
 
+// point lights are read from a texture buffer, four texels each (see clustered_lighting.py)
 struct PointLight {
     vec3 position;
+    float radius;
 
+    vec3 ambient;
     float constant;
-    float linear;
-    float quadratic;
 
-    vec3 ambient;
     vec3 diffuse;
+    float linear;
+
     vec3 specular;
+    float quadratic;
 };
 
 struct SpotLight {
@@ -42,17 +51,37 @@ struct SpotLight {
     vec3 specular;       
 };
 
-#define NR_POINT_LIGHTS 3
-
 in vec3 FragPos;
 in vec3 Normal;
 in vec2 TexCoords;
 
-uniform vec3 viewPos;
-uniform DirLight dirLight;
-uniform PointLight pointLights[NR_POINT_LIGHTS];
+layout (std140) uniform FrameData {
+    mat4 projView;
+    vec3 viewPos;
+};
+
+layout (std140) uniform Lights {
+    DirLight dirLight;
+    // tiles across, tiles up, depth slices
+    vec4 clusterCounts;
+    // tiles per pixel across and up, slices per log depth, slice of depth 1
+    vec4 clusterScale;
+    // near, far
+    vec4 depthRange;
+};
+
 uniform Material material;
 
+// write the G-buffer instead of shading, set by DeferredShading
+uniform bool geometryPass;
+
+// the point lights, the (first, count) range of each cluster in the light list, and the list
+uniform samplerBuffer pointLights;
+uniform usamplerBuffer clusters;
+uniform usamplerBuffer clusterLights;
+
+PointLight FetchPointLight(int index);
+int ClusterIndex();
 vec3 CalcDirLight(DirLight light, vec3 normal, vec3 viewDir);
 vec3 CalcPointLight(PointLight light, vec3 normal, vec3 fragPos, vec3 viewDir);
 vec3 CalcSpotLight(SpotLight light, vec3 normal, vec3 fragPos, vec3 viewDir);
@@ -60,17 +89,53 @@ vec3 CalcSpotLight(SpotLight light, vec3 normal, vec3 fragPos, vec3 viewDir);
 void main()
 {
     vec3 norm = normalize(Normal);
+
+    if (geometryPass) {
+        gPosition = vec4(FragPos, 1.0);
+        gNormal = vec4(norm, material.shininess);
+        gAlbedoSpecular = vec4(texture(material.diffuse, TexCoords).rgb, texture(material.specular, TexCoords).r);
+        return;
+    }
+
     vec3 viewDir = normalize(viewPos - FragPos);
 
     vec3 result = CalcDirLight(dirLight, norm, viewDir);
 
-    for (int i = 0; i < NR_POINT_LIGHTS; i++) {
-        result += CalcPointLight(pointLights[i], norm, FragPos, viewDir);
+    // only the lights whose sphere touches this fragment's cluster
+    uvec2 range = texelFetch(clusters, ClusterIndex()).rg;
+    for (uint i = 0u; i < range.y; i++) {
+        int index = int(texelFetch(clusterLights, int(range.x + i)).r);
+        result += CalcPointLight(FetchPointLight(index), norm, FragPos, viewDir);
     }
 
     FragColor = vec4(result, 1.0);
 }
 
+PointLight FetchPointLight(int index)
+{
+    vec4 positionRadius = texelFetch(pointLights, 4 * index);
+    vec4 ambientConstant = texelFetch(pointLights, 4 * index + 1);
+    vec4 diffuseLinear = texelFetch(pointLights, 4 * index + 2);
+    vec4 specularQuadratic = texelFetch(pointLights, 4 * index + 3);
+    return PointLight(
+        positionRadius.xyz, positionRadius.w, ambientConstant.xyz, ambientConstant.w,
+        diffuseLinear.xyz, diffuseLinear.w, specularQuadratic.xyz, specularQuadratic.w
+    );
+}
+
+int ClusterIndex()
+{
+    // view depth from the depth buffer value, for the default depth range
+    float near = depthRange.x;
+    float far = depthRange.y;
+    float ndcDepth = 2.0 * gl_FragCoord.z - 1.0;
+    float viewDepth = 2.0 * near * far / (far + near - ndcDepth * (far - near));
+
+    ivec3 cell = ivec3(gl_FragCoord.xy * clusterScale.xy, log(viewDepth) * clusterScale.z + clusterScale.w);
+    cell = clamp(cell, ivec3(0), ivec3(clusterCounts.xyz) - 1);
+    return (cell.z * int(clusterCounts.y) + cell.y) * int(clusterCounts.x) + cell.x;
+}
+
 vec3 CalcDirLight(DirLight light, vec3 normal, vec3 viewDir)
 {
     vec3 lightDir = normalize(-light.direction);
@@ -100,6 +165,9 @@ vec3 CalcPointLight(PointLight light, vec3 normal, vec3 fragPos, vec3 viewDir)
 
     float distance = length(light.position - fragPos);
     float attenuation = 1.0 / (light.constant + light.linear * distance + light.quadratic * (distance * distance));
+    // fade out to nothing at the radius, lights do not reach past the clusters they were assigned to
+    float falloff = clamp(1.0 - pow(distance / light.radius, 4.0), 0.0, 1.0);
+    attenuation *= falloff * falloff;
 
     vec3 ambient = light.ambient * vec3(texture(material.diffuse, TexCoords));
 
@@ -0,0 +1,27 @@
+#version 330 core
+out vec4 FragColor;
+
+in vec2 TexCoords;
+
+// input at twice the size of the output
+uniform sampler2D image;
+uniform vec2 texelSize;
+// brightness kept of every sample, 0 past the first level of the bloom chain
+uniform float threshold;
+
+vec3 Bright(vec2 coords)
+{
+    return max(texture(image, coords).rgb - threshold, 0.0);
+}
+
+void main()
+{
+    // the center and four diagonal taps, each bilinear sample averages 2x2 input texels
+    vec3 sum = 4.0 * Bright(TexCoords);
+    sum += Bright(TexCoords + vec2(-texelSize.x, -texelSize.y));
+    sum += Bright(TexCoords + vec2(texelSize.x, -texelSize.y));
+    sum += Bright(TexCoords + vec2(-texelSize.x, texelSize.y));
+    sum += Bright(TexCoords + vec2(texelSize.x, texelSize.y));
+
+    FragColor = vec4(sum / 8.0, 1.0);
+}
@@ -0,0 +1,43 @@
+#version 330 core
+out vec4 FragColor;
+
+in vec2 TexCoords;
+
+// tone mapped color with its luma in alpha
+uniform sampler2D image;
+uniform vec2 texelSize;
+
+const float REDUCE_MIN = 1.0 / 128.0;
+const float REDUCE_MUL = 1.0 / 8.0;
+const float SPAN_MAX = 8.0;
+
+void main()
+{
+    float lumaNW = texture(image, TexCoords + vec2(-1.0, -1.0) * texelSize).a;
+    float lumaNE = texture(image, TexCoords + vec2(1.0, -1.0) * texelSize).a;
+    float lumaSW = texture(image, TexCoords + vec2(-1.0, 1.0) * texelSize).a;
+    float lumaSE = texture(image, TexCoords + vec2(1.0, 1.0) * texelSize).a;
+    float lumaM = texture(image, TexCoords).a;
+
+    float lumaMin = min(lumaM, min(min(lumaNW, lumaNE), min(lumaSW, lumaSE)));
+    float lumaMax = max(lumaM, max(max(lumaNW, lumaNE), max(lumaSW, lumaSE)));
+
+    // blur along the edge, across the luma gradient
+    vec2 dir = vec2(-((lumaNW + lumaNE) - (lumaSW + lumaSE)), (lumaNW + lumaSW) - (lumaNE + lumaSE));
+    float dirReduce = max((lumaNW + lumaNE + lumaSW + lumaSE) * 0.25 * REDUCE_MUL, REDUCE_MIN);
+    float rcpDirMin = 1.0 / (min(abs(dir.x), abs(dir.y)) + dirReduce);
+    dir = clamp(dir * rcpDirMin, -SPAN_MAX, SPAN_MAX) * texelSize;
+
+    vec3 rgbA = 0.5 * (
+        texture(image, TexCoords + dir * (1.0 / 3.0 - 0.5)).rgb +
+        texture(image, TexCoords + dir * (2.0 / 3.0 - 0.5)).rgb
+    );
+    vec3 rgbB = 0.5 * rgbA + 0.25 * (
+        texture(image, TexCoords - 0.5 * dir).rgb +
+        texture(image, TexCoords + 0.5 * dir).rgb
+    );
+
+    // the wider blur went past the neighbourhood, so it crossed another edge
+    float lumaB = dot(rgbB, vec3(0.299, 0.587, 0.114));
+    FragColor = vec4((lumaB < lumaMin || lumaB > lumaMax) ? rgbA : rgbB, 1.0);
+}
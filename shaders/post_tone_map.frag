@@ -0,0 +1,24 @@
+#version 330 core
+out vec4 FragColor;
+
+in vec2 TexCoords;
+
+uniform sampler2D image;
+uniform sampler2D bloom;
+uniform float exposure;
+uniform float bloomStrength;
+
+// fit of the ACES filmic curve by Krzysztof Narkowicz
+vec3 ACESFilm(vec3 x)
+{
+    return clamp((x * (2.51 * x + 0.03)) / (x * (2.43 * x + 0.59) + 0.14), 0.0, 1.0);
+}
+
+void main()
+{
+    vec3 hdr = texture(image, TexCoords).rgb + bloomStrength * texture(bloom, TexCoords).rgb;
+    vec3 color = ACESFilm(exposure * hdr);
+
+    // luma in alpha for the fxaa pass
+    FragColor = vec4(color, dot(color, vec3(0.299, 0.587, 0.114)));
+}
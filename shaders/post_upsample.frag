@@ -0,0 +1,26 @@
+#version 330 core
+out vec4 FragColor;
+
+in vec2 TexCoords;
+
+// input at half the size of the output
+uniform sampler2D image;
+// downsampled level of the size of the output
+uniform sampler2D base;
+uniform vec2 texelSize;
+
+void main()
+{
+    // 3x3 tent filter over the smaller level
+    vec3 sum = 4.0 * texture(image, TexCoords).rgb;
+    sum += 2.0 * texture(image, TexCoords + vec2(-texelSize.x, 0.0)).rgb;
+    sum += 2.0 * texture(image, TexCoords + vec2(texelSize.x, 0.0)).rgb;
+    sum += 2.0 * texture(image, TexCoords + vec2(0.0, -texelSize.y)).rgb;
+    sum += 2.0 * texture(image, TexCoords + vec2(0.0, texelSize.y)).rgb;
+    sum += texture(image, TexCoords + vec2(-texelSize.x, -texelSize.y)).rgb;
+    sum += texture(image, TexCoords + vec2(texelSize.x, -texelSize.y)).rgb;
+    sum += texture(image, TexCoords + vec2(-texelSize.x, texelSize.y)).rgb;
+    sum += texture(image, TexCoords + vec2(texelSize.x, texelSize.y)).rgb;
+
+    FragColor = vec4(sum / 16.0 + texture(base, TexCoords).rgb, 1.0);
+}
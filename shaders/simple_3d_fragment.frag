@@ -2,10 +2,25 @@
 
 in vec3 fragmentColor;
 
-out vec4 color;
+layout (location = 0) out vec4 color;
+// G-buffer of deferred shading, see deferred.py
+layout (location = 1) out vec4 gPosition;
+layout (location = 2) out vec4 gNormal;
+layout (location = 3) out vec4 gAlbedoSpecular;
+
+// write the G-buffer instead of the color, set by DeferredShading
+uniform bool geometryPass;
 
 void main()
 {
+    if (geometryPass) {
+        // coverage 2 marks unlit pixels, the lighting passes copy their albedo as is
+        gPosition = vec4(0.0, 0.0, 0.0, 2.0);
+        gNormal = vec4(0.0);
+        gAlbedoSpecular = vec4(fragmentColor, 0.0);
+        return;
+    }
+
     //return pixel color
 	color = vec4(fragmentColor,1.0);
-}
\ No newline at end of file
+}
@@ -3,8 +3,12 @@
 layout (location=0) in vec3 vertexPos;
 layout (location=1) in vec3 vertexColor;
 
+layout (std140) uniform FrameData {
+    mat4 projView;
+    vec3 viewPos;
+};
+
 uniform mat4 model;
-uniform mat4 projView;
 
 out vec3 fragmentColor;
 
@@ -0,0 +1,19 @@
+#version 330 core
+
+layout (location=0) in vec3 vertexPos;
+layout (location=1) in vec3 vertexColor;
+// per instance model matrix, one column per attribute location 3 - 6
+layout (location=3) in mat4 model;
+
+layout (std140) uniform FrameData {
+    mat4 projView;
+    vec3 viewPos;
+};
+
+out vec3 fragmentColor;
+
+void main()
+{
+    gl_Position = projView * model * vec4(vertexPos, 1.0);
+    fragmentColor = vertexColor;
+}
\ No newline at end of file
@@ -8,13 +8,18 @@ out vec3 FragPos;
 out vec3 Normal;
 out vec2 TexCoords;
 
+layout (std140) uniform FrameData {
+    mat4 projView;
+    vec3 viewPos;
+};
+
 uniform mat4 model;
-uniform mat4 projView;
+uniform mat3 normalMatrix;
 
 void main()
 {
     FragPos = vec3(model * vec4(aPos, 1.0));
-    Normal = mat3(transpose(inverse(model))) * aNormal;  
+    Normal = normalMatrix * aNormal;
     TexCoords = aTexCoords;
     gl_Position = projView * vec4(FragPos, 1.0);
 }
\ No newline at end of file
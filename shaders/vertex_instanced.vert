@@ -0,0 +1,25 @@
+#version 330 core
+
+layout (location = 0) in vec3 aPos;
+layout (location = 2) in vec3 aNormal;
+layout (location = 1) in vec2 aTexCoords;
+// per instance model and normal matrices, one column per attribute location 3 - 6 and 7 - 9
+layout (location = 3) in mat4 aModel;
+layout (location = 7) in mat3 aNormalMatrix;
+
+out vec3 FragPos;
+out vec3 Normal;
+out vec2 TexCoords;
+
+layout (std140) uniform FrameData {
+    mat4 projView;
+    vec3 viewPos;
+};
+
+void main()
+{
+    FragPos = vec3(aModel * vec4(aPos, 1.0));
+    Normal = aNormalMatrix * aNormal;
+    TexCoords = aTexCoords;
+    gl_Position = projView * vec4(FragPos, 1.0);
+}
\ No newline at end of file
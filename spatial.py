@@ -0,0 +1,421 @@
+import math
+
+import numpy as np
+
+# nodes without children
+NULL = -1
+
+
+class BVH:
+
+    def __init__(self, margin=0.1):
+        """
+        Bounding volume hierarchy of axis aligned boxes.
+
+        A binary tree with one item per leaf. Static sets are built top down
+        in bulk with build, dynamic items are inserted and removed one at a
+        time by descending the tree along the cheapest surface area path.
+        Queries only visit nodes whose box can contain a result, so their
+        cost grows with the depth of the tree and the number of results, not
+        with the number of items.
+
+        Args:
+            margin (float): leaves are enlarged by this much so that small moves
+                passed to update do not restructure the tree
+        """
+        self.margin = margin
+
+        # node boxes, one list per coordinate, which is the fastest layout for scalar access
+        self.lx, self.ly, self.lz = [], [], []
+        self.hx, self.hy, self.hz = [], [], []
+        self.parent = []
+        self.left = []
+        self.right = []
+        # item of each leaf, None for inner nodes
+        self.items = []
+        self.free = []
+
+        self.root = NULL
+        # item -> leaf node
+        self.leaves = {}
+        # nodes visited by the last query
+        self.visited = 0
+
+    def __len__(self):
+        return len(self.leaves)
+
+    # building -------------------------------------------------- #
+    def build(self, items, lows, highs):
+        """
+        Replace the contents of the tree, splitting at the median of the longest axis.
+
+        Args:
+            items (Sequence): items to store, each item may only be in the tree once
+            lows (np.ndarray): (n, 3) box minimums
+            highs (np.ndarray): (n, 3) box maximums
+        """
+        self.__init__(self.margin)
+        if len(items) == 0:
+            return
+
+        lows = np.asarray(lows, dtype=np.float64) - self.margin
+        highs = np.asarray(highs, dtype=np.float64) + self.margin
+        centers = (lows + highs) / 2
+
+        self.root = self._allocate(NULL)
+        stack = [(self.root, np.arange(len(items)))]
+        while stack:
+            node, indices = stack.pop()
+
+            if len(indices) == 1:
+                index = indices[0]
+                self._set_box(node, *lows[index], *highs[index])
+                item = items[index]
+                self.items[node] = item
+                self.leaves[item] = node
+                continue
+
+            subset = centers[indices]
+            axis = np.argmax(subset.max(axis=0) - subset.min(axis=0))
+            half = len(indices) // 2
+            split = np.argpartition(subset[:, axis], half)
+            left = self._allocate(node)
+            right = self._allocate(node)
+            self.left[node] = left
+            self.right[node] = right
+            stack.append((left, indices[split[:half]]))
+            stack.append((right, indices[split[half:]]))
+
+        # children are always allocated after their parent, so walking backwards fits every child first
+        for node in range(len(self.parent) - 1, -1, -1):
+            if self.items[node] is None:
+                self._set_box(node, *_union(self._box(self.left[node]), self._box(self.right[node])))
+
+    def insert(self, item, low, high):
+        """
+        Add one item, low and high are the corners of its box.
+        """
+        m = self.margin
+        leaf = self._allocate(NULL)
+        self._set_box(leaf, low[0] - m, low[1] - m, low[2] - m, high[0] + m, high[1] + m, high[2] + m)
+        self.items[leaf] = item
+        self.leaves[item] = leaf
+
+        if self.root == NULL:
+            self.root = leaf
+            return
+
+        sibling = self._best_sibling(leaf)
+
+        old_parent = self.parent[sibling]
+        parent = self._allocate(old_parent)
+        self.left[parent] = sibling
+        self.right[parent] = leaf
+        self.parent[sibling] = parent
+        self.parent[leaf] = parent
+
+        if old_parent == NULL:
+            self.root = parent
+        elif self.left[old_parent] == sibling:
+            self.left[old_parent] = parent
+        else:
+            self.right[old_parent] = parent
+        self._refit(parent)
+
+    def remove(self, item):
+        leaf = self.leaves.pop(item)
+        self._release(leaf)
+        if leaf == self.root:
+            self.root = NULL
+            return
+
+        parent = self.parent[leaf]
+        sibling = self.right[parent] if self.left[parent] == leaf else self.left[parent]
+        grandparent = self.parent[parent]
+        self._release(parent)
+
+        self.parent[sibling] = grandparent
+        if grandparent == NULL:
+            self.root = sibling
+            return
+        if self.left[grandparent] == parent:
+            self.left[grandparent] = sibling
+        else:
+            self.right[grandparent] = sibling
+        self._refit(grandparent)
+
+    def update(self, item, low, high):
+        """
+        Move an item, the tree only changes when the box leaves the enlarged leaf box.
+        """
+        leaf = self.leaves[item]
+        if (self.lx[leaf] <= low[0] and self.ly[leaf] <= low[1] and self.lz[leaf] <= low[2]
+                and high[0] <= self.hx[leaf] and high[1] <= self.hy[leaf] and high[2] <= self.hz[leaf]):
+            return
+        self.remove(item)
+        self.insert(item, low, high)
+
+    # queries -------------------------------------------------- #
+    def query_frustum(self, planes):
+        """
+        Items whose box is at least partly inside all planes.
+
+        Args:
+            planes (np.ndarray): (6, 4) planes with normals pointing inside, see culling.frustum_planes
+
+        Returns:
+            list: items in the frustum
+        """
+        planes = [tuple(map(float, plane)) for plane in planes]
+        lx, ly, lz, hx, hy, hz = self.lx, self.ly, self.lz, self.hx, self.hy, self.hz
+        result = []
+        visited = 0
+
+        stack = [self.root] if self.root != NULL else []
+        while stack:
+            node = stack.pop()
+            visited += 1
+
+            x0, y0, z0, x1, y1, z1 = lx[node], ly[node], lz[node], hx[node], hy[node], hz[node]
+            inside = True
+            for a, b, c, d in planes:
+                # corner furthest along the plane normal, then the nearest one
+                if a >= 0:
+                    far, near = a * x1, a * x0
+                else:
+                    far, near = a * x0, a * x1
+                if b >= 0:
+                    far += b * y1
+                    near += b * y0
+                else:
+                    far += b * y0
+                    near += b * y1
+                if c >= 0:
+                    far += c * z1
+                    near += c * z0
+                else:
+                    far += c * z0
+                    near += c * z1
+                if far + d < 0:
+                    break
+                if near + d < 0:
+                    inside = False
+            else:
+                if inside:
+                    # the whole subtree is visible, no more plane tests needed
+                    visited += self._collect(node, result)
+                elif self.items[node] is not None:
+                    result.append(self.items[node])
+                else:
+                    stack.append(self.left[node])
+                    stack.append(self.right[node])
+
+        self.visited = visited
+        return result
+
+    def query_radius(self, center, radius):
+        """
+        Items whose box overlaps the sphere around center.
+        """
+        cx, cy, cz = map(float, center)
+        radius_squared = radius * radius
+        lx, ly, lz, hx, hy, hz = self.lx, self.ly, self.lz, self.hx, self.hy, self.hz
+        result = []
+        visited = 0
+
+        stack = [self.root] if self.root != NULL else []
+        while stack:
+            node = stack.pop()
+            visited += 1
+
+            # squared distance from the center to the closest point of the box
+            dx = max(lx[node] - cx, 0.0, cx - hx[node])
+            dy = max(ly[node] - cy, 0.0, cy - hy[node])
+            dz = max(lz[node] - cz, 0.0, cz - hz[node])
+            if dx * dx + dy * dy + dz * dz > radius_squared:
+                continue
+
+            if self.items[node] is not None:
+                result.append(self.items[node])
+            else:
+                stack.append(self.left[node])
+                stack.append(self.right[node])
+
+        self.visited = visited
+        return result
+
+    def query_ray(self, origin, direction, max_distance=math.inf):
+        """
+        Nearest item whose box is hit by the ray.
+
+        Args:
+            origin (Sequence): x, y, z start of the ray
+            direction (Sequence): x, y, z direction, distances are in multiples of its length
+            max_distance (float): ignore hits further away than this
+
+        Returns:
+            tuple: (item, distance) of the nearest hit, (None, max_distance) if nothing is hit
+        """
+        ox, oy, oz = map(float, origin)
+        inverse = [1 / float(d) if d != 0 else None for d in direction]
+        nearest_item = None
+        nearest = max_distance
+        visited = 0
+
+        stack = []
+        if self.root != NULL:
+            entry = self._ray_entry(self.root, ox, oy, oz, inverse)
+            if entry is not None:
+                stack.append((entry, self.root))
+        while stack:
+            entry, node = stack.pop()
+            if entry >= nearest:
+                continue
+            visited += 1
+
+            if self.items[node] is not None:
+                nearest_item = self.items[node]
+                nearest = entry
+                continue
+
+            hits = []
+            for child in (self.left[node], self.right[node]):
+                child_entry = self._ray_entry(child, ox, oy, oz, inverse)
+                if child_entry is not None and child_entry < nearest:
+                    hits.append((child_entry, child))
+            # visit the closer child first so further subtrees get pruned by its hits
+            hits.sort(reverse=True)
+            stack.extend(hits)
+
+        self.visited = visited
+        return nearest_item, nearest
+
+    # helpers -------------------------------------------------- #
+    def _ray_entry(self, node, ox, oy, oz, inverse):
+        """
+        Distance along the ray at which it enters the box of node, None if it misses.
+        """
+        t_min = 0.0
+        t_max = math.inf
+        for origin, low, high, inv in (
+            (ox, self.lx[node], self.hx[node], inverse[0]),
+            (oy, self.ly[node], self.hy[node], inverse[1]),
+            (oz, self.lz[node], self.hz[node], inverse[2]),
+        ):
+            if inv is None:
+                # parallel to this slab, hit only if the origin lies between its planes
+                if origin < low or origin > high:
+                    return None
+                continue
+            if inv >= 0:
+                t0, t1 = (low - origin) * inv, (high - origin) * inv
+            else:
+                t0, t1 = (high - origin) * inv, (low - origin) * inv
+            if t0 > t_min:
+                t_min = t0
+            if t1 < t_max:
+                t_max = t1
+            if t_min > t_max:
+                return None
+        return t_min
+
+    def _collect(self, node, result):
+        visited = 0
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            visited += 1
+            if self.items[node] is not None:
+                result.append(self.items[node])
+            else:
+                stack.append(self.left[node])
+                stack.append(self.right[node])
+        return visited - 1
+
+    def _best_sibling(self, leaf):
+        """
+        Descend from the root towards the node whose pairing with leaf adds the least surface area.
+        """
+        box = self._box(leaf)
+        node = self.root
+        while self.items[node] is None:
+            area = _area(self._box(node))
+            combined = _area(_union(self._box(node), box))
+            # pairing here creates a parent of the combined size, every ancestor grows as well
+            cost = 2 * combined
+            inherited = 2 * (combined - area)
+
+            child_costs = []
+            for child in (self.left[node], self.right[node]):
+                child_box = self._box(child)
+                child_cost = _area(_union(child_box, box)) + inherited
+                if self.items[child] is None:
+                    child_cost -= _area(child_box)
+                child_costs.append(child_cost)
+
+            if cost < child_costs[0] and cost < child_costs[1]:
+                break
+            node = self.left[node] if child_costs[0] < child_costs[1] else self.right[node]
+        return node
+
+    def _refit(self, node):
+        while node != NULL:
+            left, right = self.left[node], self.right[node]
+            self._set_box(node, *_union(self._box(left), self._box(right)))
+            node = self.parent[node]
+
+    def _box(self, node):
+        return (self.lx[node], self.ly[node], self.lz[node], self.hx[node], self.hy[node], self.hz[node])
+
+    def _set_box(self, node, lx, ly, lz, hx, hy, hz):
+        self.lx[node], self.ly[node], self.lz[node] = float(lx), float(ly), float(lz)
+        self.hx[node], self.hy[node], self.hz[node] = float(hx), float(hy), float(hz)
+
+    def _allocate(self, parent):
+        if self.free:
+            node = self.free.pop()
+            self.parent[node] = parent
+            self.left[node] = NULL
+            self.right[node] = NULL
+            self.items[node] = None
+            return node
+
+        for coordinate in (self.lx, self.ly, self.lz, self.hx, self.hy, self.hz):
+            coordinate.append(0.0)
+        self.parent.append(parent)
+        self.left.append(NULL)
+        self.right.append(NULL)
+        self.items.append(None)
+        return len(self.parent) - 1
+
+    def _release(self, node):
+        self.items[node] = None
+        self.free.append(node)
+
+
+def entity_boxes(entities):
+    """
+    World space boxes around the bounding spheres of entities, they stay valid under any rotation.
+
+    Returns:
+        tuple: (n, 3) lows and (n, 3) highs
+    """
+    if not entities:
+        return np.zeros((0, 3)), np.zeros((0, 3))
+    store = entities[0].store
+    store.update_transforms()
+    rows = np.fromiter((entity.row for entity in entities), dtype=np.intp, count=len(entities))
+    centers = store.world_centers[rows]
+    radii = store.world_radii[rows, None]
+    return centers - radii, centers + radii
+
+
+def _union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3]), max(a[4], b[4]), max(a[5], b[5]))
+
+
+def _area(box):
+    dx = box[3] - box[0]
+    dy = box[4] - box[1]
+    dz = box[5] - box[2]
+    return dx * dy + dy * dz + dz * dx
@@ -0,0 +1,152 @@
+from OpenGL.GL import *
+import numpy as np
+
+from geometry_pool import POSITION_TEXTURE_NORMAL, geometry_pool
+from gl_state import gl_state
+from material import Material
+from models import TexturedModel
+from profiler import profiler
+from shader import Shader
+
+from typing import Sequence
+
+IDENTITY_4 = np.identity(4, dtype=np.float32)
+IDENTITY_3 = np.identity(3, dtype=np.float32)
+
+
+class StaticBatch:
+
+    def __init__(self, shader: Shader, material: Material, entities: Sequence):
+        """
+        Entities that never move, merged into one world space mesh.
+
+        Every entity's vertices are moved into world space once, so the batch
+        is drawn with identity model and normal matrices. The merged mesh
+        lives in the geometry pool next to the models, each entity keeps its
+        own range of it, draw submits the visible ranges with a single
+        glMultiDrawElementsBaseVertex and merges ranges that touch.
+
+        Args:
+            shader (Shader): shader of every model in the batch
+            material (Material): material of every model in the batch
+            entities (Sequence): entities with TexturedModels in the x, y, z, s, t, nx, ny, nz layout,
+                all from one EntityStore
+        """
+        self.shader = shader
+        self.material = material
+        self.store = entities[0].store
+        self.store.update_transforms()
+        self.rows = np.fromiter((entity.row for entity in entities), dtype=np.intp, count=len(entities))
+
+        vertices = []
+        indices = []
+        # first index and index count of each entity
+        self.firsts = np.zeros(len(entities), dtype=np.int64)
+        self.counts = np.zeros(len(entities), dtype=np.int64)
+        vertex_count = index_count = 0
+        for i, entity in enumerate(entities):
+            model = entity.model
+            model_indices = model.indices if model.indices is not None else np.arange(len(model.vertices))
+            vertices.append(world_vertices(model.vertices, entity.transform_matrix, entity.normal_matrix))
+            indices.append(model_indices.astype(np.uint32) + vertex_count)
+            self.firsts[i] = index_count
+            self.counts[i] = len(model_indices)
+            vertex_count += len(model.vertices)
+            index_count += len(model_indices)
+
+        self.vertices = np.concatenate(vertices)
+        self.indices = np.concatenate(indices)
+        self.mesh = geometry_pool.allocate(POSITION_TEXTURE_NORMAL, self.vertices, self.indices)
+
+        # ranges drawn by the next draw
+        self.draw_firsts = self.firsts
+        self.draw_counts = self.counts
+
+    def __len__(self):
+        return len(self.rows)
+
+    def update(self, visible: np.ndarray | None = None):
+        """
+        Pick the index ranges to draw.
+
+        Args:
+            visible (np.ndarray): optional per row mask of the store, as taken by InstancedRenderer.update,
+                entities outside of it are left out
+        """
+        if visible is None:
+            self.draw_firsts, self.draw_counts = self.firsts, self.counts
+            return
+
+        shown = visible[self.rows]
+        firsts = self.firsts[shown]
+        counts = self.counts[shown]
+        if len(firsts) == 0:
+            self.draw_firsts, self.draw_counts = firsts, counts
+            return
+
+        # ranges of neighbouring entities that are both visible become one
+        starts = np.concatenate(([True], firsts[1:] != firsts[:-1] + counts[:-1]))
+        run = np.cumsum(starts) - 1
+        self.draw_firsts = firsts[starts]
+        self.draw_counts = np.bincount(run, weights=counts).astype(np.int64)
+
+    def draw(self):
+        if len(self.draw_counts) == 0:
+            return
+
+        self.shader.use()
+        self.material.use()
+        self.shader.set_mat4("model", IDENTITY_4)
+        self.shader.set_mat3("normalMatrix", IDENTITY_3)
+
+        gl_state.bind_vertex_array(self.mesh.vao)
+        offsets = (self.mesh.first_index + self.draw_firsts) * 4
+        count = len(offsets)
+        glMultiDrawElementsBaseVertex(
+            GL_TRIANGLES, self.draw_counts.astype(np.int32), GL_UNSIGNED_INT,
+            (ctypes.c_void_p * count)(*offsets.tolist()), count, np.full(count, self.mesh.base_vertex, dtype=np.int32)
+        )
+        profiler.draw(int(self.draw_counts.sum()) // 3)
+
+    def destroy(self):
+        self.mesh.free()
+
+
+def world_vertices(vertices, transform, normal_matrix):
+    """
+    Vertices in the x, y, z, s, t, nx, ny, nz layout moved into world space.
+
+    Args:
+        vertices (np.ndarray): (n, 8) float32 model space vertices
+        transform (np.ndarray): (4, 4) column major model matrix
+        normal_matrix (np.ndarray): (3, 3) column major normal matrix
+    """
+    world = np.array(vertices, dtype=np.float32)
+    # column major [column, row], so row vectors multiply from the left
+    world[:, :3] = vertices[:, :3] @ transform[:3, :3] + transform[3, :3]
+    normals = vertices[:, 5:8] @ normal_matrix
+    world[:, 5:8] = normals / np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+    return world
+
+
+def mergeable(entity):
+    model = entity.model
+    return isinstance(model, TexturedModel) and model.mesh.arena.format is POSITION_TEXTURE_NORMAL and hasattr(model, "vertices")
+
+
+def merge_static(entities: Sequence):
+    """
+    Merge static entities sharing a shader and material into StaticBatches.
+
+    Returns:
+        tuple[list[StaticBatch], list]: the batches, and the entities whose models cannot
+            be merged, e.g. ColoredCubes, to be drawn some other way
+    """
+    groups = {}
+    rest = []
+    for entity in entities:
+        if mergeable(entity):
+            groups.setdefault((entity.model.shader, entity.model.material), []).append(entity)
+        else:
+            rest.append(entity)
+    return [StaticBatch(shader, material, group) for (shader, material), group in groups.items()], rest
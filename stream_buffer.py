@@ -0,0 +1,174 @@
+from collections import deque
+import ctypes
+
+from OpenGL.GL import *
+import numpy as np
+
+from gl_state import has_extension
+
+_PERSISTENT_FLAGS = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+
+
+class StreamBuffer:
+
+    def __init__(self, size, target=GL_ARRAY_BUFFER, persistent=None):
+        """
+        Ring buffer over one GL buffer for data written every frame.
+
+        allocate hands out aligned ranges as numpy views, which callers fill
+        in place. The ring only moves forward, every finished frame is fenced
+        and a range is only handed out again once the GPU is done with the
+        frame that used it, so writes never race a draw still in flight and
+        the buffer is never reallocated. With room for a few frames the
+        fences have signaled long before a range comes around again.
+
+        With ARB_buffer_storage (GL 4.4) the buffer is persistently and
+        coherently mapped and the views are the mapping itself, so nothing is
+        copied. Without it, as on the GL 4.1 target, the views point into a
+        CPU side copy and flush sends what was written since the last flush
+        with glBufferSubData.
+
+        Args:
+            size (int): bytes in the ring, must hold a few frames worth of data
+            target (int): buffer target used while uploading
+            persistent (bool): map persistently, by default whenever supported
+        """
+        self.size = size
+        self.target = target
+        if persistent is None:
+            persistent = has_extension("GL_ARB_buffer_storage")
+        self.persistent = persistent
+
+        self.buffer = glGenBuffers(1)
+        glBindBuffer(target, self.buffer)
+        if persistent:
+            glBufferStorage(target, size, None, _PERSISTENT_FLAGS)
+            pointer = glMapBufferRange(target, 0, size, _PERSISTENT_FLAGS)
+            self.data = np.ctypeslib.as_array((ctypes.c_ubyte * size).from_address(pointer))
+        else:
+            glBufferData(target, size, None, GL_STREAM_DRAW)
+            self.data = np.zeros(size, dtype=np.uint8)
+
+        # next free byte
+        self.head = 0
+        # start of the data not yet sent by flush
+        self.flushed = 0
+        # start and length of the frame being written, skipped bytes at a wrap included
+        self.frame_start = 0
+        self.frame_used = 0
+        # (fence, start, length) of finished frames the GPU may still read, oldest first
+        self.in_flight = deque()
+        # fences that had not signaled when their range was needed
+        self.waits = 0
+
+    def allocate(self, shape, dtype=np.float32, alignment=16):
+        """
+        Reserve room for an array in this frame.
+
+        Args:
+            shape (int | tuple): shape of the array
+            dtype: element type
+            alignment (int): alignment of the offset in bytes
+
+        Returns:
+            tuple[int, np.ndarray]: byte offset in the buffer and a writable view of that range
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+
+        offset = -self.head % alignment + self.head
+        if offset + nbytes > self.size:
+            offset = 0
+        end = offset + nbytes
+        if offset < self.head:
+            # bytes skipped at the end of the ring belong to this frame too
+            used = self.frame_used + self.size - self.head + end
+        else:
+            used = self.frame_used + end - self.head
+        if used > self.size:
+            raise ValueError(f"a frame needs more than the {self.size} bytes of the stream buffer")
+
+        self._wait_for(offset, nbytes)
+        if offset < self.head:
+            self._flush()
+            self.flushed = 0
+        self.head = end
+        self.frame_used = used
+
+        return offset, self.data[offset:end].view(dtype).reshape(shape)
+
+    def write(self, array, alignment=16):
+        """
+        Copy an array into this frame's range of the buffer.
+
+        Returns:
+            int: byte offset of the copy
+        """
+        array = np.asarray(array)
+        offset, view = self.allocate(array.shape, array.dtype, alignment)
+        view[...] = array
+        return offset
+
+    def flush(self):
+        """
+        Make everything allocated so far visible to draws, call before drawing from the buffer.
+        """
+        self._flush()
+
+    def end_frame(self):
+        """
+        Fence the ranges written this frame, call after the last draw reading them.
+        """
+        self._flush()
+        if self.frame_used:
+            fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+            self.in_flight.append((fence, self.frame_start, self.frame_used))
+        self.frame_start = self.head
+        self.frame_used = 0
+
+    def destroy(self):
+        for fence, _, _ in self.in_flight:
+            glDeleteSync(fence)
+        self.in_flight.clear()
+        if self.persistent:
+            glBindBuffer(self.target, self.buffer)
+            glUnmapBuffer(self.target)
+        self.data = None
+        glDeleteBuffers(1, (self.buffer,))
+
+    def _flush(self):
+        if self.persistent or self.flushed == self.head:
+            return
+        glBindBuffer(self.target, self.buffer)
+        glBufferSubData(self.target, self.flushed, self.head - self.flushed, self.data[self.flushed:self.head])
+        self.flushed = self.head
+
+    def _wait_for(self, offset, nbytes):
+        """
+        Block until no frame in flight still reads any of the bytes [offset, offset + nbytes).
+        """
+        last = None
+        for i, (_, start, length) in enumerate(self.in_flight):
+            if _overlaps(start, length, offset, nbytes, self.size):
+                last = i
+        if last is None:
+            return
+
+        # fences signal in order, once the last overlapping frame is done so are the ones before it
+        fence = self.in_flight[last][0]
+        if glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 0) == GL_TIMEOUT_EXPIRED:
+            self.waits += 1
+            while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1_000_000) == GL_TIMEOUT_EXPIRED:
+                pass
+        for _ in range(last + 1):
+            glDeleteSync(self.in_flight.popleft()[0])
+
+
+def _overlaps(start, length, offset, nbytes, size):
+    """
+    Whether the ring range of length bytes from start, which may wrap around, overlaps [offset, offset + nbytes).
+    """
+    end = start + length
+    if end <= size:
+        return offset < end and start < offset + nbytes
+    return offset < end - size or start < offset + nbytes
@@ -0,0 +1,297 @@
+"""
+Textures baked into a binary container with their whole mip chain.
+
+Run from the repository root to bake ahead of time:
+    python -m texture_bake [--format rgb8|rgba8|bc1] [--srgb] img/*.jpg
+"""
+import argparse
+import os
+import struct
+import threading
+import warnings
+
+from OpenGL.GL import GL_RGB8, GL_RGBA8, GL_SRGB8, GL_SRGB8_ALPHA8
+import numpy as np
+import pygame
+
+from mesh_cache import cache_path
+
+CACHE_DIRECTORY = ".cache/textures"
+
+# EXT_texture_compression_s3tc and EXT_texture_sRGB, no alpha
+GL_COMPRESSED_RGB_S3TC_DXT1_EXT = 0x83F0
+GL_COMPRESSED_SRGB_S3TC_DXT1_EXT = 0x8C4C
+
+# internal format -> channels of the uncompressed formats
+CHANNELS = {GL_RGB8: 3, GL_SRGB8: 3, GL_RGBA8: 4, GL_SRGB8_ALPHA8: 4}
+# internal format -> bytes per 4x4 block of the compressed formats
+BLOCK_SIZES = {GL_COMPRESSED_RGB_S3TC_DXT1_EXT: 8, GL_COMPRESSED_SRGB_S3TC_DXT1_EXT: 8}
+
+# bake formats -> internal format, linear and sRGB
+FORMATS = {
+    "rgb8": (GL_RGB8, GL_SRGB8),
+    "rgba8": (GL_RGBA8, GL_SRGB8_ALPHA8),
+    "bc1": (GL_COMPRESSED_RGB_S3TC_DXT1_EXT, GL_COMPRESSED_SRGB_S3TC_DXT1_EXT),
+}
+
+# magic, version, source size, source mtime, internal format, width, height, level count
+_HEADER = struct.Struct("<8sIQQIIII")
+_MAGIC = b"PYGLTEX\0"
+_VERSION = 1
+_HEADER_SIZE = 64
+
+
+class BakedTexture:
+
+    def __init__(self, internal_format, width, height, levels):
+        """
+        A texture ready for upload, level 0 first.
+
+        Args:
+            internal_format (int): GL internal format, one of CHANNELS or BLOCK_SIZES
+            width (int): width of level 0
+            height (int): height of level 0
+            levels (list[np.ndarray]): (height, width, channels) uint8 images, or the
+                raw blocks of each level for compressed formats
+        """
+        self.internal_format = internal_format
+        self.width = width
+        self.height = height
+        self.levels = levels
+
+    @property
+    def compressed(self):
+        return self.internal_format in BLOCK_SIZES
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+    def level_size(self, level):
+        return max(self.width >> level, 1), max(self.height >> level, 1)
+
+
+def load_texture(filename, compressed=True, cache_directory=CACHE_DIRECTORY):
+    """
+    Load an image through the baked texture cache.
+
+    The first load decodes the image, builds its mip chain and writes the
+    result to the cache, later loads map the cached file so every level can
+    go straight to glTexImage2D without decoding or glGenerateMipmap.
+    Needs no GL context, so it can run on AssetLoader workers.
+
+    Args:
+        filename (str): path to the source image
+        compressed (bool): False if the driver cannot sample block compressed textures,
+            a compressed bake is then ignored and the image baked uncompressed in memory
+        cache_directory (str): directory holding baked textures
+
+    Returns:
+        BakedTexture: the texture with its full mip chain
+    """
+    path = cache_path(filename, ".tex", cache_directory)
+    stat = os.stat(filename)
+
+    texture = read_texture(path, stat)
+    if texture is not None and texture.compressed and not compressed:
+        warnings.warn(f"{path} is block compressed, which the driver does not support, using {filename}")
+        return bake(decode_image(filename))
+    if texture is None:
+        texture = bake(decode_image(filename))
+        try:
+            write_texture(path, texture, stat)
+        except OSError as e:
+            warnings.warn(f"could not cache {filename}: {e}")
+    return texture
+
+
+def bake_file(filename, format=None, srgb=False, cache_directory=CACHE_DIRECTORY):
+    """
+    Bake one image into the cache ahead of time, in the given format.
+    """
+    texture = bake(decode_image(filename), format, srgb)
+    write_texture(cache_path(filename, ".tex", cache_directory), texture, os.stat(filename))
+    return texture
+
+
+def bake(pixels, format=None, srgb=False):
+    """
+    Build the mip chain of an image and convert every level to the target format.
+
+    Args:
+        pixels (np.ndarray): (height, width, 4) uint8 RGBA image, as returned by decode_image
+        format (str): key of FORMATS, by default rgb8 for opaque images and rgba8 otherwise
+        srgb (bool): store the sRGB variant of the format
+
+    Returns:
+        BakedTexture
+    """
+    if format is None:
+        format = "rgb8" if (pixels[..., 3] == 255).all() else "rgba8"
+    internal_format = FORMATS[format][srgb]
+
+    height, width = pixels.shape[:2]
+    levels = []
+    for level in mip_chain(pixels):
+        if internal_format in BLOCK_SIZES:
+            levels.append(encode_bc1(level[..., :3]))
+        else:
+            levels.append(np.ascontiguousarray(level[..., :CHANNELS[internal_format]]))
+    return BakedTexture(internal_format, width, height, levels)
+
+
+def mip_chain(pixels):
+    """
+    Every level down to 1x1, each a 2x2 box filtered copy of the one before, sized like glGenerateMipmap does.
+
+    Returns:
+        list[np.ndarray]: uint8 levels, level 0 first
+    """
+    levels = [pixels]
+    # filter in float from the previous unrounded level, so rounding errors do not add up
+    image = pixels.astype(np.float32)
+    while image.shape[0] > 1 or image.shape[1] > 1:
+        height, width = image.shape[:2]
+        if height > 1:
+            image = (image[0:height // 2 * 2:2] + image[1:height // 2 * 2:2]) / 2
+        if width > 1:
+            image = (image[:, 0:width // 2 * 2:2] + image[:, 1:width // 2 * 2:2]) / 2
+        levels.append((image + 0.5).astype(np.uint8))
+    return levels
+
+
+def encode_bc1(pixels):
+    """
+    Encode an RGB image as BC1 (DXT1) blocks.
+
+    A fast encoder: the endpoints of every 4x4 block are the corners of its
+    color bounding box, each pixel takes the nearest of the four palette colors.
+
+    Args:
+        pixels (np.ndarray): (height, width, 3) uint8 image, partial blocks are padded by repeating the edge
+
+    Returns:
+        np.ndarray: uint8 blocks in row order, 8 bytes each
+    """
+    height, width = pixels.shape[:2]
+    pixels = np.pad(pixels, ((0, -height % 4), (0, -width % 4), (0, 0)), mode='edge')
+    rows, columns = pixels.shape[0] // 4, pixels.shape[1] // 4
+    blocks = pixels.reshape(rows, 4, columns, 4, 3).swapaxes(1, 2).reshape(-1, 16, 3).astype(np.float32)
+
+    high = _pack_565(blocks.max(axis=1))
+    low = _pack_565(blocks.min(axis=1))
+    # the four color mode needs color0 > color1, equal endpoints leave every index at 0
+    palette = np.stack((_unpack_565(high), _unpack_565(low)), axis=1)
+    palette = np.concatenate((palette, (2 * palette[:, :1] + palette[:, 1:]) / 3, (palette[:, :1] + 2 * palette[:, 1:]) / 3), axis=1)
+
+    distances = ((blocks[:, :, None] - palette[:, None]) ** 2).sum(axis=3)
+    indices = distances.argmin(axis=2).astype(np.uint32)
+    indices[high == low] = 0
+    bits = (indices << (2 * np.arange(16, dtype=np.uint32))).sum(axis=1, dtype=np.uint32)
+
+    encoded = np.empty(len(blocks), dtype=[('color0', '<u2'), ('color1', '<u2'), ('indices', '<u4')])
+    encoded['color0'] = high
+    encoded['color1'] = low
+    encoded['indices'] = bits
+    return encoded.view(np.uint8)
+
+
+def _pack_565(colors):
+    r, g, b = (colors + 0.5).astype(np.uint16).T
+    return (r >> 3 << 11) | (g >> 2 << 5) | (b >> 3)
+
+
+def _unpack_565(colors):
+    r = (colors >> 11) & 31
+    g = (colors >> 5) & 63
+    b = colors & 31
+    return np.stack((r * 255 / 31, g * 255 / 63, b * 255 / 31), axis=1).astype(np.float32)
+
+
+def level_bytes(internal_format, width, height):
+    if internal_format in BLOCK_SIZES:
+        return ((width + 3) // 4) * ((height + 3) // 4) * BLOCK_SIZES[internal_format]
+    return width * height * CHANNELS[internal_format]
+
+
+def read_texture(path, stat):
+    """
+    Map a baked texture, or return None if it is missing or older than its source.
+    """
+    try:
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+    except (OSError, ValueError):
+        return None
+    if len(data) < _HEADER_SIZE:
+        return None
+
+    magic, version, size, mtime, internal_format, width, height, level_count = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION or size != stat.st_size or mtime != stat.st_mtime_ns:
+        return None
+    if internal_format not in CHANNELS and internal_format not in BLOCK_SIZES:
+        return None
+
+    texture = BakedTexture(internal_format, width, height, [])
+    offset = _HEADER_SIZE
+    for level in range(level_count):
+        level_width, level_height = texture.level_size(level)
+        end = offset + level_bytes(internal_format, level_width, level_height)
+        if end > len(data):
+            return None
+        if texture.compressed:
+            texture.levels.append(data[offset:end])
+        else:
+            texture.levels.append(data[offset:end].reshape(level_height, level_width, CHANNELS[internal_format]))
+        offset = end
+    if offset != len(data):
+        return None
+    return texture
+
+
+def write_texture(path, texture: BakedTexture, stat):
+    """
+    Write a baked texture: a fixed size header, then every level in order.
+    """
+    header = _HEADER.pack(
+        _MAGIC, _VERSION, stat.st_size, stat.st_mtime_ns,
+        texture.internal_format, texture.width, texture.height, len(texture.levels)
+    )
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write next to the target and rename, so readers never see a partial file
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(header.ljust(_HEADER_SIZE, b'\0'))
+        for level in texture.levels:
+            f.write(np.ascontiguousarray(level).tobytes())
+    os.replace(temporary, path)
+
+
+def decode_image(filepath):
+    """
+    Decode an image file, needs no GL context or display so it can run on any thread.
+
+    Returns:
+        np.ndarray: (height, width, 4) uint8 RGBA pixels, rows in the order pygame stores them
+    """
+    image = pygame.image.load(filepath)
+    image_width, image_height = image.get_rect().size
+    img_data = pygame.image.tostring(image, 'RGBA')
+    return np.frombuffer(img_data, dtype=np.uint8).reshape(image_height, image_width, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bake images into the texture cache with their mip chains.")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--format", choices=FORMATS, help="rgb8 for opaque images and rgba8 otherwise by default")
+    parser.add_argument("--srgb", action="store_true", help="store the sRGB variant of the format")
+    parser.add_argument("--cache-directory", default=CACHE_DIRECTORY)
+    args = parser.parse_args()
+
+    for filename in args.images:
+        texture = bake_file(filename, args.format, args.srgb, args.cache_directory)
+        print(f"{filename}: {texture.width}x{texture.height}, {len(texture.levels)} levels, {texture.nbytes / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+from collections import OrderedDict
+
+from OpenGL.GL import *
+import numpy as np
+
+from gl_state import gl_state, has_extension
+from texture_bake import BakedTexture, load_texture
+
+# shown until the image of a texture loaded in the background is uploaded
+PLACEHOLDER = BakedTexture(GL_RGBA8, 1, 1, [np.array([[[128, 128, 128, 255]]], dtype=np.uint8)])
+
+_MIPMAP_FILTERS = (GL_NEAREST_MIPMAP_NEAREST, GL_LINEAR_MIPMAP_NEAREST, GL_NEAREST_MIPMAP_LINEAR, GL_LINEAR_MIPMAP_LINEAR)
+
+
+class Texture:
+
+    def __init__(self, id, path, wrap, min_filter, mag_filter, loader=None):
+        """
+        One image with its sampler parameters, shared by every material using it.
+
+        name is the GL texture while resident and None after eviction, so users
+        keep the Texture and bind it through TextureCache.bind.
+        """
+        # stable for the lifetime of the texture, unlike name
+        self.id = id
+        self.path = path
+        self.wrap = wrap
+        self.min_filter = min_filter
+        self.mag_filter = mag_filter
+        # reloads after an eviction go through the loader the texture was first acquired with
+        self.loader = loader
+
+        self.name = None
+        self.nbytes = 0
+        self.refs = 0
+
+    @property
+    def key(self):
+        return (self.path, self.wrap, self.min_filter, self.mag_filter)
+
+    @property
+    def mipmapped(self):
+        return self.min_filter in _MIPMAP_FILTERS
+
+
+class TextureCache:
+
+    def __init__(self, budget=512 * 1024 * 1024):
+        """
+        Texture objects shared by path and sampler parameters, with a GPU memory budget.
+
+        Materials acquire their textures here and release them when destroyed,
+        a texture is deleted once nothing references it. Resident textures are
+        kept in least recently used order, when their estimated size passes
+        the budget the ones bound longest ago are evicted. An evicted texture
+        keeps its place in the cache and is loaded again the next time it is
+        bound. The textures of the material being bound are pinned, so
+        binding one never evicts another the same draw samples, a budget too
+        small for them is exceeded instead.
+
+        Args:
+            budget (int): bytes of texture memory to keep resident, mip chains included
+        """
+        self.budget = budget
+        # key -> texture, every acquired texture whether resident or not
+        self.textures = {}
+        # resident textures, least recently bound first
+        self.resident = OrderedDict()
+        self.resident_bytes = 0
+        # keys of the textures of the current draw, never evicted, see pin
+        self.pinned = set()
+        self.next_id = 0
+        # whether the driver samples block compressed textures, queried on the first load
+        self.compressed = None
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.textures)
+
+    def acquire(self, path, wrap=GL_REPEAT, min_filter=GL_LINEAR_MIPMAP_LINEAR, mag_filter=GL_LINEAR, loader=None):
+        """
+        Shared texture for path, loaded on first use of this path and sampler combination.
+
+        Args:
+            loader (AssetLoader): optional, decode the image on its workers and show
+                a placeholder until AssetLoader.update uploads it
+
+        Returns:
+            Texture: to be handed back to release
+        """
+        key = (path, wrap, min_filter, mag_filter)
+        texture = self.textures.get(key)
+        if texture is None:
+            texture = Texture(self.next_id, path, wrap, min_filter, mag_filter, loader)
+            self.next_id += 1
+            self.textures[key] = texture
+            self._load(texture)
+        else:
+            self.hits += 1
+        texture.refs += 1
+        return texture
+
+    def release(self, texture: Texture):
+        texture.refs -= 1
+        if texture.refs == 0:
+            del self.textures[texture.key]
+            self._unload(texture)
+
+    def pin(self, textures):
+        """
+        Keep textures resident until the next pin, called with every texture a draw samples before binding them.
+        """
+        self.pinned = {texture.key for texture in textures}
+
+    def bind(self, unit, texture: Texture):
+        """
+        Bind texture to a texture unit, loading it again if it was evicted.
+        """
+        if texture.name is None:
+            self._load(texture, unit)
+        else:
+            self.resident.move_to_end(texture.key)
+            # the budget may have been lowered since the last load
+            if self.resident_bytes > self.budget:
+                self._trim(texture)
+        gl_state.bind_texture(unit, texture.name)
+
+    def _load(self, texture: Texture, unit=0):
+        # loads during a bind happen on the unit being bound, the other units keep the textures of the draw
+        texture.name = glGenTextures(1)
+        gl_state.bind_texture(unit, texture.name)
+
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, texture.wrap)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, texture.wrap)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, texture.min_filter)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, texture.mag_filter)
+
+        self.resident[texture.key] = texture
+        self.loads += 1
+        if self.compressed is None:
+            self.compressed = supports_s3tc()
+        if texture.loader is None:
+            self.upload(texture, load_texture(texture.path, self.compressed), unit)
+            return
+
+        self.upload(texture, PLACEHOLDER, unit)
+        name = texture.name
+        def finish(image):
+            # skip images that arrive after the texture was evicted or released
+            if texture.name == name:
+                self.upload(texture, image)
+        texture.loader.submit(texture, load_texture, texture.path, self.compressed, callback=finish)
+
+    def upload(self, texture: Texture, image: BakedTexture, unit=0):
+        """
+        Respecify the levels of a resident texture, its name stays the same.
+
+        Textures sampled without mipmaps only get level 0.
+
+        Args:
+            unit (int): texture unit the texture is bound to for the upload
+        """
+        gl_state.bind_texture(unit, texture.name)
+        levels = image.levels if texture.mipmapped else image.levels[:1]
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(levels) - 1)
+
+        # rows of RGB levels are not padded to 4 bytes
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        for level, pixels in enumerate(levels):
+            width, height = image.level_size(level)
+            if image.compressed:
+                glCompressedTexImage2D(GL_TEXTURE_2D, level, image.internal_format, width, height, 0, pixels)
+            else:
+                format = GL_RGB if pixels.shape[2] == 3 else GL_RGBA
+                glTexImage2D(GL_TEXTURE_2D, level, image.internal_format, width, height, 0, format, GL_UNSIGNED_BYTE, pixels)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+
+        self.resident_bytes -= texture.nbytes
+        texture.nbytes = sum(pixels.nbytes for pixels in levels)
+        self.resident_bytes += texture.nbytes
+        self._trim(texture)
+
+    def _trim(self, keep: Texture):
+        """
+        Evict least recently bound textures until the resident ones fit the budget, keep and pinned ones are never evicted.
+        """
+        for texture in list(self.resident.values()):
+            if self.resident_bytes <= self.budget:
+                break
+            if texture is keep or texture.key in self.pinned:
+                continue
+            self._unload(texture)
+            self.evictions += 1
+
+    def _unload(self, texture: Texture):
+        if texture.name is None:
+            return
+        gl_state.forget_textures((texture.name,))
+        glDeleteTextures(1, (texture.name,))
+        del self.resident[texture.key]
+        self.resident_bytes -= texture.nbytes
+        texture.name = None
+        texture.nbytes = 0
+
+
+def supports_s3tc():
+    """
+    Whether the current context can sample the BC1 textures written by texture_bake.
+    """
+    return has_extension("GL_EXT_texture_compression_s3tc")
+
+
+# textures are shared program wide, like the GL context
+texture_cache = TextureCache()
@@ -0,0 +1,59 @@
+from OpenGL.GL import *
+import numpy as np
+
+from profiler import profiler
+
+# fixed binding points of the uniform blocks declared in the shaders
+FRAME_DATA_BINDING = 0
+LIGHTS_BINDING = 1
+
+
+class UniformBuffer:
+
+    def __init__(self, block_name, size, binding):
+        """
+        CPU side copy of a std140 uniform block, sent to the GPU with a single glBufferSubData.
+
+        Args:
+            block_name (str): name of the uniform block in the shaders
+            size (int): size of the block in bytes
+            binding (int): uniform buffer binding point
+        """
+        self.block_name = block_name
+        self.binding = binding
+        self.data = np.zeros(size // 4, dtype=np.float32)
+
+        self.ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferData(GL_UNIFORM_BUFFER, self.data.nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBufferBase(GL_UNIFORM_BUFFER, binding, self.ubo)
+
+    def attach(self, *shaders):
+        for shader in shaders:
+            shader.bind_uniform_block(self.block_name, self.binding)
+
+    def write(self, offset, value):
+        """
+        Args:
+            offset (int): std140 byte offset of the member
+            value: float, glm vector / matrix or array of floats
+        """
+        start = offset // 4
+        if isinstance(value, (int, float, np.number)):
+            self.data[start] = value
+            return
+
+        if isinstance(value, np.ndarray):
+            values = value.ravel()
+        else:
+            # glm matrices are stored column major, as GL expects
+            values = np.frombuffer(value.to_bytes(), dtype=np.float32)
+        self.data[start:start + len(values)] = values
+
+    def upload(self):
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.data.nbytes, self.data)
+        profiler.count("uniform buffer uploads")
+
+    def destroy(self):
+        glDeleteBuffers(1, (self.ubo,))